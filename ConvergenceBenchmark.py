@@ -0,0 +1,280 @@
+import sys
+import json
+import time
+import socket
+import argparse
+import numpy as np
+import unittest as ut
+from RandomStreams import SeedStreams
+
+LOADS = [0.3, 0.6, 0.9]
+
+# Cases whose mean workload is known in closed form (see getKnownWorkload). Job sizes are alpha w.p. p and beta
+# otherwise; OneQueueFixedServiceRate derives beta from mu, which is chosen so that beta (= 100) is a whole number.
+CASES = [{'policy': 'OneQueueFixedServiceRateStrategy', 'params': {'alpha': 10, 'mu': 1.0 / 55, 'p': 0.5},
+          'size': 1},
+         {'policy': 'RandomQueueStrategy', 'params': {'alpha': 10, 'beta': 100, 'p': 0.5}, 'size': 1},
+         {'policy': 'RandomQueueStrategy', 'params': {'alpha': 10, 'beta': 100, 'p': 0.5}, 'size': 4}]
+
+# Convergence settings: (convergence condition class name, its params).
+SETTINGS = [('STDVConvergenceStrategy', {'epsilon': 1e-2}),
+            ('STDVConvergenceStrategy', {'epsilon': 1e-3}),
+            ('STDVConvergenceStrategy', {'epsilon': 1e-4}),
+            ('DeltaConvergenceStrategy', {'epsilon': 1e-3}),
+            ('VarianceConvergenceStrategy', {'epsilon': 1e-2}),
+            ('VarianceConvergenceStrategy', {'epsilon': 1e-3}),
+            ('VarianceConvergenceStrategy', {'epsilon': 5e-5}),
+            ('RunForXSlotsConvergenceStrategy', {'x': 10 ** 5}),
+            ('RunForXSlotsConvergenceStrategy', {'x': 10 ** 6})]
+
+
+##
+# The mean workload (after service) of a single queue served at 1 unit per slot, fed by Bernoulli(@arrivalRate)
+# arrivals of whole job sizes @jobSizes drawn with @probabilities. This is the discrete-time Pollaczek-Khinchine
+# formula: with A the work arriving in a slot, V' = max(V + A - 1, 0) gives
+#   E[V] = (E[A^2] - E[A]) / (2 (1 - E[A])) = lambda (E[S^2] - E[S]) / (2 (1 - lambda E[S])).
+##
+def getMeanWorkload(arrivalRate, jobSizes, probabilities):
+    sizes = np.asarray(jobSizes, dtype=float)
+    probabilities = np.asarray(probabilities, dtype=float)
+    meanSize = float(np.sum(probabilities * sizes))
+    meanSquaredSize = float(np.sum(probabilities * sizes ** 2))
+    load = arrivalRate * meanSize
+    if load >= 1.0:
+        return float('inf')
+    return arrivalRate * (meanSquaredSize - meanSize) / (2.0 * (1.0 - load))
+
+
+##
+# Get the job sizes and their probabilities of @policy (whose job sizes are a DiscreteJobSizes).
+##
+def getJobSizes(policy):
+    values = [value if float(value) != round(value) else int(round(value)) for value in policy.jobSizes.getValues()]
+    return values, policy.jobSizes.getProbabilities()
+
+
+##
+# The exact mean total workload of @case at @arrivalRate. RandomQueue sends every job to a uniformly chosen queue, so
+# each of its n queues is a single queue fed by Bernoulli(arrivalRate / n) arrivals.
+##
+def getKnownWorkload(case, arrivalRate):
+    import DispatchPolicyStrategy
+    policy = getattr(DispatchPolicyStrategy, case['policy'])(**case['params'])
+    (jobSizes, probabilities) = getJobSizes(policy)
+    if case['policy'] == 'OneQueueFixedServiceRateStrategy':
+        return getMeanWorkload(arrivalRate, jobSizes, probabilities)
+    if case['policy'] == 'RandomQueueStrategy':
+        n = case['size']
+        return n * getMeanWorkload(arrivalRate / n, jobSizes, probabilities)
+    raise Exception("No known answer for " + case['policy'])
+
+
+def getCaseId(case):
+    return case['policy'] + ",n=" + str(case['size'])
+
+
+def getSettingId(setting):
+    (convergenceName, params) = setting
+    return convergenceName.replace('ConvergenceStrategy', '') + "(" + \
+        ",".join(name + "=" + "%g" % params[name] for name in sorted(params)) + ")"
+
+
+##
+# Get the benchmark rounds: every setting on every case, load and replication. Replication r of a (case, load) pair
+# runs on the same seed under every setting, so settings are compared on the same sample paths.
+##
+def getRounds(cases=CASES, settings=SETTINGS, loads=LOADS, replications=5, rootSeed=None, historyWindowSize=10000,
+              T_max=10 ** 7):
+    import DispatchPolicyStrategy
+    from QueueNetwork import QueueNetwork
+    from SimulationSpec import SimulationSpec
+    streams = SeedStreams(rootSeed)
+    rounds = []
+    for (c, case) in enumerate(cases):
+        policy = getattr(DispatchPolicyStrategy, case['policy'])(**case['params'])
+        effectiveServiceRate = policy.getEffectiveServiceRate(QueueNetwork(case['size']))
+        for (l, load) in enumerate(loads):
+            arrivalRate = load * effectiveServiceRate
+            exact = getKnownWorkload(case, arrivalRate)
+            for setting in settings:
+                for r in range(replications):
+                    spec = SimulationSpec(case['size'], case['policy'], case['params'], setting[0], setting[1],
+                                          arrivalRate, effectiveServiceRate, index=len(rounds),
+                                          seed=streams.getSeed(c, l, r), historyWindowSize=historyWindowSize,
+                                          T_max=T_max, replication=r)
+                    rounds.append({'case': getCaseId(case), 'setting': getSettingId(setting), 'load': load,
+                                   'replication': r, 'exact': exact, 'spec': spec})
+    return rounds, streams.getRootSeed()
+
+
+##
+# Run a single round and return its estimate, error and cost. A setting that cannot run (e.g. a condition that needs
+# statistics the slot loop does not collect) is reported with its 'error'.
+##
+def runRound(benchmarkRound):
+    spec = benchmarkRound['spec']
+    result = dict((key, value) for key, value in benchmarkRound.items() if key != 'spec')
+    try:
+        (estimate, diagnostics) = spec.run()
+    except Exception as e:
+        result.update({'estimate': None, 'slots': None, 'wallTime': None, 'converged': None,
+                       'error': e.__class__.__name__ + ": " + str(e)})
+        return result
+    result.update({'estimate': float(estimate),
+                   'bias': float(estimate) - result['exact'],
+                   'relativeError': abs(float(estimate) - result['exact']) / result['exact'],
+                   'slots': diagnostics['slots'],
+                   'wallTime': diagnostics['wallTime'],
+                   'converged': diagnostics['converged']})
+    return result
+
+
+##
+# Run the rounds on @pool (a WorkerPool; a pool of its own by default) and return the results document.
+##
+def runConvergenceBenchmark(rounds, rootSeed, pool=None, verbose=False):
+    from WorkerPool import WorkerPool
+    ownPool = pool is None
+    if ownPool:
+        pool = WorkerPool()
+    results = []
+    try:
+        for result in pool.imapUnordered(runRound, rounds):
+            if verbose and 'error' in result:
+                print("WARN:    " + result['setting'] + " @ " + result['case'] + " failed: " + result['error'])
+            elif verbose:
+                roundId = result['setting'] + " @ " + result['case'] + ",load=" + str(result['load'])
+                print("INFO:    " + roundId.ljust(72) + ("%.4g" % result['relativeError']).rjust(12) +
+                      str(result['slots']).rjust(12) + " slots")
+            results.append(result)
+    finally:
+        if ownPool:
+            pool.close()
+    results.sort(key=lambda result: (result['case'], result['load'], result['setting'], result['replication']))
+    return {'metadata': {'time': time.time(), 'host': socket.gethostname(), 'rootSeed': rootSeed},
+            'results': results}
+
+
+##
+# Summarise the results per setting (over every case, load and replication, or per (setting, case, load) with
+# @perCase): mean bias relative to the exact answer, mean and worst relative error, mean slots, and the number of
+# rounds that hit T_max or failed. A setting is on the Pareto front if no other setting is at least as accurate and at
+# least as cheap, and strictly better in one of the two.
+##
+def summarize(results, perCase=False):
+    groups = {}
+    for result in results:
+        key = (result['setting'], result['case'], result['load']) if perCase else (result['setting'],)
+        groups.setdefault(key, []).append(result)
+    rows = []
+    for key, group in groups.items():
+        ran = [result for result in group if 'error' not in result]
+        row = dict(zip(('setting', 'case', 'load'), key))
+        row.update({'rounds': len(group), 'failed': len(group) - len(ran),
+                    'unconverged': len([result for result in ran if not result['converged']]),
+                    'relativeBias': None, 'relativeError': None, 'maxRelativeError': None, 'slots': None})
+        if ran:
+            row['relativeBias'] = float(np.mean([result['bias'] / result['exact'] for result in ran]))
+            row['relativeError'] = float(np.mean([result['relativeError'] for result in ran]))
+            row['maxRelativeError'] = float(np.max([result['relativeError'] for result in ran]))
+            row['slots'] = float(np.mean([result['slots'] for result in ran]))
+        rows.append(row)
+    for row in rows:
+        rivals = [other for other in rows if other['slots'] is not None and
+                  (other.get('case'), other.get('load')) == (row.get('case'), row.get('load'))]
+        row['pareto'] = row['slots'] is not None and not any(dominates(other, row) for other in rivals)
+    return sorted(rows, key=lambda row: (row.get('case'), row.get('load'),
+                                         row['slots'] if row['slots'] is not None else float('inf')))
+
+
+def dominates(row, other):
+    return row['relativeError'] <= other['relativeError'] and row['slots'] <= other['slots'] and \
+        (row['relativeError'] < other['relativeError'] or row['slots'] < other['slots'])
+
+
+##
+# Format summary rows as a text table, cheapest first; Pareto-optimal settings are starred.
+##
+def formatSummary(rows):
+    columns = [column for column in ('setting', 'case', 'load') if column in rows[0]] + \
+        ['slots', 'relativeError', 'maxRelativeError', 'relativeBias', 'unconverged', 'failed', 'pareto']
+    cells = [[formatCell(row[column] if column != 'pareto' else ('*' if row['pareto'] else '')) for column in columns]
+             for row in rows]
+    widths = [max([len(column)] + [len(line[i]) for line in cells]) + 2 for i, column in enumerate(columns)]
+    lines = ["".join(column.rjust(width) for column, width in zip(columns, widths))]
+    for line in cells:
+        lines.append("".join(cell.rjust(width) for cell, width in zip(line, widths)))
+    return "\n".join(lines)
+
+
+def formatCell(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "%.4g" % value
+    return str(value)
+
+
+def writeResults(filename, benchmark):
+    with open(filename, "w") as fd:
+        json.dump(benchmark, fd, indent=1, sort_keys=True)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestConvergenceBenchmark(ut.TestCase):
+    def runTest(self):
+        from WorkerPool import WorkerPool
+        # Unit jobs are served in the slot they arrive in.
+        self.assertEqual(getMeanWorkload(0.5, [1], [1.0]), 0.0)
+        self.assertEqual(getMeanWorkload(1.0, [1], [1.0]), float('inf'))
+        case = {'policy': 'RandomQueueStrategy', 'params': {'alpha': 2, 'beta': 4, 'p': 0.5}, 'size': 2}
+        # Two queues at half the arrival rate each.
+        self.assertAlmostEqual(getKnownWorkload(case, 0.4), 2 * getMeanWorkload(0.2, [2, 4], [0.5, 0.5]))
+        oneQueue = {'policy': 'OneQueueFixedServiceRateStrategy', 'params': {'alpha': 10, 'mu': 1.0 / 55, 'p': 0.5},
+                    'size': 1}
+        self.assertAlmostEqual(getKnownWorkload(oneQueue, 0.01), getKnownWorkload(CASES[1], 0.01))
+        settings = [('VarianceConvergenceStrategy', {'epsilon': 1e-2}),
+                    ('DeltaConvergenceStrategy', {'epsilon': 1e-2}),
+                    ('RunForXSlotsConvergenceStrategy', {'x': 60000})]
+        (rounds, rootSeed) = getRounds([case], settings, loads=[0.5], replications=2, rootSeed=3,
+                                       historyWindowSize=1000, T_max=60000)
+        self.assertEqual(len(rounds), 6)
+        with WorkerPool(processes=2) as pool:
+            benchmark = runConvergenceBenchmark(rounds, rootSeed, pool=pool)
+        results = benchmark['results']
+        self.assertEqual(len(results), 6)
+        rows = dict((row['setting'], row) for row in summarize(results))
+        # The slot loop keeps a single window, which the window delta condition cannot use.
+        self.assertEqual(rows['Delta(epsilon=0.01)']['failed'], 2)
+        self.assertFalse(rows['Delta(epsilon=0.01)']['pareto'])
+        longRun = rows['RunForXSlots(x=60000)']
+        self.assertEqual(longRun['slots'], 60000)
+        self.assertLess(longRun['relativeError'], 0.2)
+        self.assertTrue(rows['Variance(epsilon=0.01)']['pareto'] or longRun['pareto'])
+        self.assertEqual(len(summarize(results, perCase=True)), 3)
+        self.assertIn("relativeError", formatSummary(summarize(results)))
+        print("TestConvergenceBenchmark: OK.")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        ut.main()
+    parser = argparse.ArgumentParser(description="Measure the accuracy and cost of the convergence conditions on "
+                                                 "cases with known mean workloads.")
+    parser.add_argument('--loads', nargs='*', type=float, default=LOADS)
+    parser.add_argument('--replications', type=int, default=5)
+    parser.add_argument('--root-seed', type=int)
+    parser.add_argument('--window', type=int, default=10000, help="history window size")
+    parser.add_argument('--T-max', type=int, default=10 ** 7)
+    parser.add_argument('--per-case', action='store_true', help="a Pareto table per case and load")
+    parser.add_argument('--output', help="write the results (JSON) to this file")
+    args = parser.parse_args()
+    (rounds, rootSeed) = getRounds(loads=args.loads, replications=args.replications, rootSeed=args.root_seed,
+                                   historyWindowSize=args.window, T_max=args.T_max)
+    benchmark = runConvergenceBenchmark(rounds, rootSeed, verbose=True)
+    benchmark['summary'] = summarize(benchmark['results'], perCase=args.per_case)
+    print(formatSummary(benchmark['summary']))
+    if args.output:
+        writeResults(args.output, benchmark)
@@ -6,12 +6,9 @@ import math
 ########################################################################################################################
 #   INTERFACE
 ########################################################################################################################
-class ConvergenceConditionStrategyAbstract:
+class ConvergenceConditionStrategyAbstract(metaclass=abc.ABCMeta):
     """An abstract class from which all convergence conditions need to inherit."""
 
-    # This is how you define abstract classes in Python.
-    __metaclass__ = abc.ABCMeta
-
     ##
     # Initialize a convergence condition instance.
     # @epsilon is the precision of the convergence check.
@@ -30,9 +27,23 @@ class ConvergenceConditionStrategyAbstract:
     def getName(self):
         """Required Method"""
 
+    ##
+    # Gets the same arguments as hasConverged and returns the statistic it compares against the precision (for
+    # progress reporting). Conditions without such a statistic return None.
+    ##
+    def getStatistic(self, network, stats):
+        return None
+
     def getPrecision(self):
         return self.epsilon
 
+    ##
+    # Get the constructor arguments of the condition, so an equivalent condition can be built from its class and
+    # params.
+    ##
+    def getParams(self):
+        return {'epsilon': self.epsilon}
+
 
 ########################################################################################################################
 #   IMPLEMENTATIONS
@@ -53,6 +64,12 @@ class STDVConvergenceStrategy(ConvergenceConditionStrategyAbstract):
     def getName(self):
         return "standard deviation convergence"
 
+    def getStatistic(self, network, stats):
+        avg = np.mean(stats)
+        if float(avg) <= 0.00001:
+            return float('inf')
+        return float(np.std(stats)) / float(avg)
+
 
 class DeltaConvergenceStrategy(ConvergenceConditionStrategyAbstract):
     """Checks if (window delta / average) is small enough."""
@@ -78,6 +95,11 @@ class DeltaConvergenceStrategy(ConvergenceConditionStrategyAbstract):
     def getName(self):
         return "window delta convergence"
 
+    def getStatistic(self, network, stats):
+        if len(stats) < 2 or float(np.mean(stats[1])) <= 0.00001:
+            return float('inf')
+        return math.fabs((float(np.mean(stats[0])) - float(np.mean(stats[1]))) / float(np.mean(stats[1])))
+
 
 class VarianceConvergenceStrategy(ConvergenceConditionStrategyAbstract):
     """Checks if variance of window is small enough."""
@@ -96,6 +118,9 @@ class VarianceConvergenceStrategy(ConvergenceConditionStrategyAbstract):
     def getName(self):
         return "average workload variance convergence"
 
+    def getStatistic(self, network, stats):
+        return float(np.var(stats[0]))
+
 
 class RunForXSlotsConvergenceStrategy(ConvergenceConditionStrategyAbstract):
     """Checks if variance of window is small enough."""
@@ -112,3 +137,9 @@ class RunForXSlotsConvergenceStrategy(ConvergenceConditionStrategyAbstract):
 
     def getName(self):
         return "run for x slots"
+
+    def getStatistic(self, network, stats):
+        return float(network.getTime() + 1)
+
+    def getParams(self):
+        return {'x': self.epsilon}
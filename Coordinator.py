@@ -0,0 +1,260 @@
+import sys
+import socket
+import threading
+import itertools
+import traceback
+import queue
+import multiprocessing
+import unittest as ut
+from multiprocessing.managers import BaseManager
+from WorkerPool import warmUp, getFailureRecord
+
+DEFAULT_AUTHKEY = b'queue_net_sim'
+
+
+class RemoteBlock:
+    """Stands in for the driver's SharedSweepBlock on a remote worker. A remote worker cannot map the driver's shared
+    memory, so every write to the block (result, diagnostics, progress, artifact) is forwarded to the coordinator,
+    which applies it to the real block on the driver."""
+
+    def __init__(self, ticket, messages, artifactLength):
+        self.ticket = ticket
+        self.messages = messages
+        self.artifactLength = artifactLength
+
+    def forward(self, method, *args):
+        self.messages.put((self.ticket, method, args))
+
+    def startTask(self, index, arrivalRate):
+        self.forward('startTask', index, arrivalRate)
+
+    def updateProgress(self, index, slots, statistic):
+        self.forward('updateProgress', index, slots, statistic)
+
+    def writeResult(self, index, arrivalRate, estimate, diagnostics):
+        self.forward('writeResult', index, arrivalRate, estimate, diagnostics)
+
+    def markFailed(self, index):
+        self.forward('markFailed', index)
+
+    def writeArtifact(self, index, values):
+        if self.artifactLength > 0:
+            self.forward('writeArtifact', index, list(values))
+
+
+class SweepCoordinator:
+    """Serves the rounds of parallel sweeps to workers on any number of hosts.
+    The coordinator runs a manager server (multiprocessing.managers over TCP) holding a task queue and a message
+    queue. Workers (see serveTasks / runWorkers, or run this module on each host) connect to it, pull one task at a
+    time, run it on a warm simulation and push back its block writes and its result.
+    A coordinator has the submit interface of WorkerPool, so it can be passed as the pool of parSweep/parRun and of
+    any number of back-to-back sweeps. Tasks are not leased: the coordinator does not watch remote workers, so a task
+    held by a worker that dies is only given up on (and resubmitted) by the driver at its deadline (see
+    parSim.parSweep)."""
+
+    ##
+    # Listen on @address (host, port); port 0 picks a free port (see getAddress). Workers must use the same
+    # @authkey.
+    ##
+    def __init__(self, address=('', 0), authkey=DEFAULT_AUTHKEY):
+        tasks = queue.Queue()
+        messages = queue.Queue()
+
+        class CoordinatorManager(BaseManager):
+            pass
+        CoordinatorManager.register('getTasks', callable=lambda: tasks)
+        CoordinatorManager.register('getMessages', callable=lambda: messages)
+        self.manager = CoordinatorManager(address=address, authkey=authkey)
+        self.manager.start()
+        self.tasks = self.manager.getTasks()
+        self.messages = self.manager.getMessages()
+        self.tickets = itertools.count()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.closed = False
+        self.collector = threading.Thread(target=self.collect)
+        self.collector.daemon = True
+        self.collector.start()
+
+    ##
+    # Get the address workers should connect to.
+    ##
+    def getAddress(self):
+        (host, port) = self.manager.address
+        if host in ('', '0.0.0.0'):
+            host = socket.gethostname()
+        return host, port
+
+    ##
+    # Submit a task. @func is a module-level function taking (block, task), like parSim.singleRun; it is run by a
+    # worker with a RemoteBlock in place of @args' block. @callback is called (in the driver) with its result once
+    # all its block writes were applied. Returns the ticket of the task.
+    ##
+    def submit(self, func, args, callback):
+        (block, task) = args
+        ticket = next(self.tickets)
+        with self.lock:
+            self.pending[ticket] = (block, task, callback)
+        self.tasks.put((ticket, func, task, block.artifactLength))
+        return ticket
+
+    ##
+    # Remote workers are not watched (see isWorkerAlive of WorkerPool); their tasks have a deadline instead.
+    ##
+    def isWorkerAlive(self, pid):
+        return True
+
+    ##
+    # Give up on the task @ticket (see submit): its late block writes and result, if any, are ignored.
+    ##
+    def dropTask(self, ticket, pid):
+        with self.lock:
+            self.pending.pop(ticket, None)
+
+    ##
+    # Driver thread: apply the workers' block writes and hand finished tasks to their callbacks. A task that raised in
+    # a remote worker is handed to its callback as (task, failure record).
+    ##
+    def collect(self):
+        while not self.closed:
+            try:
+                (ticket, method, args) = self.messages.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, IOError):
+                return
+            with self.lock:
+                if ticket not in self.pending:
+                    continue
+                (block, task, callback) = self.pending[ticket]
+                if method in ('done', 'error'):
+                    del self.pending[ticket]
+            if method == 'done':
+                callback(args[0])
+            elif method == 'error':
+                message = args[0].strip().splitlines()[-1] if args[0].strip() else ''
+                callback((task.task, getFailureRecord(task, 'RemoteTaskError', message, args[0])))
+            else:
+                getattr(block, method)(*args)
+
+    ##
+    # Stop the workers (they exit once they see the stop marker or lose the connection) and the server.
+    ##
+    def close(self):
+        if self.closed:
+            return
+        self.tasks.put(None)
+        self.closed = True
+        self.collector.join()
+        self.manager.shutdown()
+        # Proxies reconnect to the server in forked children, so none may outlive it.
+        self.tasks = None
+        self.messages = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+##
+# Worker loop: connect to the coordinator at @address and run its tasks one at a time until it stops.
+##
+def serveTasks(address, authkey=DEFAULT_AUTHKEY):
+    class WorkerManager(BaseManager):
+        pass
+    WorkerManager.register('getTasks')
+    WorkerManager.register('getMessages')
+    manager = WorkerManager(address=tuple(address), authkey=authkey)
+    manager.connect()
+    tasks = manager.getTasks()
+    messages = manager.getMessages()
+    warmUp()
+    while True:
+        try:
+            item = tasks.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        except (EOFError, IOError):
+            return
+        if item is None:
+            # Leave the stop marker for the other workers.
+            tasks.put(None)
+            return
+        (ticket, func, task, artifactLength) = item
+        try:
+            result = func((RemoteBlock(ticket, messages, artifactLength), task))
+        except Exception:
+            messages.put((ticket, 'error', (traceback.format_exc(),)))
+            continue
+        messages.put((ticket, 'done', (result,)))
+
+
+##
+# Run @processes worker processes (one per CPU by default) on this host, serving the coordinator at @address.
+##
+def runWorkers(address, processes=None, authkey=DEFAULT_AUTHKEY):
+    from TaskScheduler import getNumOfCPUs
+    workers = [multiprocessing.Process(target=serveTasks, args=(address, authkey))
+               for i in range(processes if processes else getNumOfCPUs())]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+def raiseInWorker(args):
+    raise ValueError("Broken round")
+
+
+class TestSweepCoordinator(ut.TestCase):
+    def runTest(self):
+        import parSim
+        import DispatchPolicyStrategy
+        import ConvergenceConditionStrategy
+        from WorkerPool import WorkerPool
+
+        def makeSim():
+            return parSim.parSim(3, DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=100, p=0.8, d=2),
+                                 ConvergenceConditionStrategy.RunForXSlotsConvergenceStrategy(2000), numOfRounds=4,
+                                 historyWindowSize=1000, T_min=1000)
+
+        with SweepCoordinator(address=('127.0.0.1', 0)) as coordinator:
+            workers = [multiprocessing.Process(target=serveTasks, args=(coordinator.getAddress(),)) for i in range(3)]
+            for worker in workers:
+                worker.start()
+            remote = sorted((rate, estimate) for rate, estimate, diagnostics in
+                            makeSim().parSweep(pool=coordinator, replications=2, rootSeed=11, artifactLength=4))
+            # A task that raises in a worker is handed back as a failure record, and its ticket is dropped.
+            from SharedResults import SharedSweepBlock
+            from SimulationSpec import SimulationSpec
+            block = SharedSweepBlock(1)
+            results = queue.Queue()
+            coordinator.submit(raiseInWorker, (block, SimulationSpec(3, "RandomQueueStrategy", {}, "", {}, 0.1, 1.0,
+                                                                      seed=4, task=7)), results.put)
+            (task, failure) = results.get(timeout=30)
+            self.assertEqual((task, failure['error'], failure['seed']), (7, 'RemoteTaskError', 4))
+            self.assertIn("Broken round", failure['message'])
+            self.assertEqual(coordinator.pending, {})
+            block.unlink()
+        for worker in workers:
+            worker.join(10)
+            self.assertFalse(worker.is_alive())
+        # Remote workers run the same streams as a local pool.
+        with WorkerPool(processes=2) as pool:
+            local = sorted((rate, estimate) for rate, estimate, diagnostics in
+                           makeSim().parSweep(pool=pool, replications=2, rootSeed=11))
+        self.assertEqual(remote, local)
+        print("TestSweepCoordinator: OK.")
+
+
+if __name__ == '__main__':
+    # Worker host: python Coordinator.py <coordinator host> <port> [processes]
+    if len(sys.argv) >= 3:
+        runWorkers((sys.argv[1], int(sys.argv[2])), int(sys.argv[3]) if len(sys.argv) > 3 else None)
+    else:
+        ut.main()
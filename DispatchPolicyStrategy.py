@@ -1,16 +1,27 @@
 import abc  # Python's built-in abstract class library
 import numpy as np
 import math
+import unittest as ut
+from RandomStreams import RandomPermutation, sampleDistinctBatch
+from JobSizeDistribution import BimodalJobSizes, ShiftedGeometricJobSizes, getJobSizes
 
 
 ########################################################################################################################
 #   INTERFACE
 ########################################################################################################################
-class DispatchPolicyStrategyAbstract:
+class DispatchPolicyStrategyAbstract(metaclass=abc.ABCMeta):
     """An abstract class from which all dispatching policies need to inherit."""
 
-    # This is how you define abstract classes in Python.
-    __metaclass__ = abc.ABCMeta
+    # The random generator (numpy.random.Generator) the policy draws from, see setGenerator.
+    generator = None
+    # Number of arrivals whose queues sampleQueues draws at once, and the samples not used yet (see sampleQueues).
+    sampleBatch = 1024
+    samples = None
+    # The distribution of job sizes (see setJobSizes), the number of job sizes drawJobSizes draws at once and the
+    # sizes drawn but not used yet.
+    jobSizes = None
+    jobSizeBatch = 4096
+    jobSizeBuffer = None
 
     ##
     # Upon an arrival gets a queue network instance and outputs which queues receive it and what's the workload each
@@ -41,12 +52,100 @@ class DispatchPolicyStrategyAbstract:
     def getOneQueueMu(self):
         """Required Method"""
 
+    ##
+    # Get the constructor arguments of the policy, so an equivalent policy can be built from its class and params.
+    ##
+    @abc.abstractmethod
+    def getParams(self):
+        """Required Method"""
+
+    ##
+    # Set the random generator the policy draws from. A policy owns no random stream: the simulation running it sets
+    # its own (see QueueNetworkSimulation.setGenerator), so all random numbers of a round come from one stream.
+    ##
+    def setGenerator(self, generator):
+        self.generator = generator
+        self.samples = None
+        self.jobSizeBuffer = None
+        if self.jobSizes is not None:
+            self.jobSizes.reset()
+
+    ##
+    # Get @d distinct queues out of @n, uniformly. Samples are drawn from the generator sampleBatch arrivals at a time
+    # (see RandomStreams.sampleDistinctBatch), so an arrival costs O(1) and a batch O(d^2), independent of n.
+    ##
+    def sampleQueues(self, n, d):
+        if not self.samples or self.samplesKey != (n, d):
+            self.samples = sampleDistinctBatch(self.generator, n, d, self.sampleBatch).tolist()
+            self.samples.reverse()
+            self.samplesKey = (n, d)
+        return self.samples.pop()
+
+    ##
+    # Set the job sizes of the policy to @jobSizes, a JobSizeDistribution or its description (see
+    # JobSizeDistribution.getJobSizes). If it is None, jobs are of size @alpha with probability @p and @beta otherwise.
+    # The job size params (as given) are kept for getParams, and mu is the service rate of a queue.
+    ##
+    def setJobSizes(self, alpha=None, beta=None, p=None, jobSizes=None):
+        if jobSizes is None:
+            if alpha is None or beta is None or p is None:
+                raise Exception("Either alpha, beta and p or jobSizes must be given")
+            self.jobSizes = BimodalJobSizes(alpha, beta, p)
+            self.jobSizeParams = {'alpha': alpha, 'beta': beta, 'p': p}
+        else:
+            self.jobSizes = getJobSizes(jobSizes)
+            self.jobSizeParams = {'jobSizes': self.jobSizes.getDescription()}
+        self.jobSizeBuffer = None
+        self.mu = 1.0 / self.jobSizes.getMean()
+
+    ##
+    # Raise if one of the required constructor arguments @params (name: value) is missing. Arguments that follow the
+    # optional job size params (alpha, beta, p) have a default of None, but most of them are required.
+    ##
+    def requireParams(self, **params):
+        for name in sorted(params):
+            if params[name] is None:
+                raise Exception("Missing argument " + name + " for " + type(self).__name__)
+
+    ##
+    # Draw @k job sizes. Sizes are drawn from the generator jobSizeBatch at a time, so a job costs no NumPy call.
+    ##
+    def drawJobSizes(self, k):
+        if not self.jobSizeBuffer or len(self.jobSizeBuffer) < k:
+            self.fillJobSizes(max(k, self.jobSizeBatch))
+        sizes = self.jobSizeBuffer[-k:]
+        del self.jobSizeBuffer[-k:]
+        sizes.reverse()
+        return sizes
+
+    def drawJobSize(self):
+        if not self.jobSizeBuffer:
+            self.fillJobSizes(self.jobSizeBatch)
+        return self.jobSizeBuffer.pop()
+
+    ##
+    # Draw @k more job sizes into the buffer. The buffer is kept reversed, so sizes are used in the order they were
+    # drawn (a trace replays its sizes in order, see JobSizeDistribution.TraceJobSizes).
+    ##
+    def fillJobSizes(self, k):
+        sizes = self.jobSizes.sample(self.generator, k).tolist()
+        sizes.reverse()
+        self.jobSizeBuffer = sizes + (self.jobSizeBuffer or [])
+
     ##
     # Get level of redundancy for the policy.
     ##
     def getRedundancy(self):
         return 1
 
+    ##
+    # Get the classes of queues the policy treats alike in a network of @n queues: every dispatch either sends the
+    # same workload to all the queues of a class or none of them, so queues of a class that start alike stay alike and
+    # the network can keep one workload per class (see QueueNetwork.lump). None if the policy has no such classes.
+    ##
+    def getSymmetricClasses(self, n):
+        return None
+
     ##
     # Get policy params string for logging.
     ##
@@ -60,11 +159,9 @@ class DispatchPolicyStrategyAbstract:
 class FixedSubsetsStrategy(DispatchPolicyStrategyAbstract):
     """A fixed subsets dispatching policy."""
 
-    def __init__(self, redundancy, alpha, beta, p):
+    def __init__(self, redundancy, alpha=None, beta=None, p=None, jobSizes=None):
         self.redundancy = redundancy
-        self.alpha = alpha
-        self.beta = beta
-        self.p = p
+        self.setJobSizes(alpha, beta, p, jobSizes)
 
     ##
     # Randomly choose one of the fixed subsets and determine the workload each one of the queues in it will get.
@@ -74,13 +171,12 @@ class FixedSubsetsStrategy(DispatchPolicyStrategyAbstract):
         n = network.getSize()
         # Choose the subset.
         numOfSubsets = int(math.ceil(n / float(self.redundancy)))
-        chosenSubset = np.random.randint(numOfSubsets)
-        queuesChosen = filter(lambda x: x < n,
-                              range(chosenSubset * self.redundancy, (chosenSubset + 1) * self.redundancy))
+        chosenSubset = self.generator.integers(numOfSubsets)
+        queuesChosen = [x for x in range(chosenSubset * self.redundancy, (chosenSubset + 1) * self.redundancy) if x < n]
         # Randomize the incoming job's workload for each queue chosen.
-        randWorkload = np.random.choice([self.alpha, self.beta], self.redundancy, p=[self.p, 1.0 - self.p])
+        randWorkload = self.drawJobSizes(self.redundancy)
         # Determine the total increment of workload in every queue chosen.
-        currWorkload = [network.getWorkloads()[q] for q in queuesChosen]
+        currWorkload = [network.getWorkload(q) for q in queuesChosen]
         min_i = 0
         for i in range(len(currWorkload)):
             if currWorkload[i] + randWorkload[i] < currWorkload[min_i] + randWorkload[min_i]:
@@ -89,43 +185,49 @@ class FixedSubsetsStrategy(DispatchPolicyStrategyAbstract):
         addedWorkload = [np.max(maxTotalWorkloadInQueue - currWorkload[i], 0) for i in range(len(currWorkload))]
         return queuesChosen, addedWorkload
 
+    def getParams(self):
+        return dict(self.jobSizeParams, redundancy=self.redundancy)
+
     def getName(self):
         return "fixed subsets"
 
     def getEffectiveServiceRate(self, network):
-        muEffective = 1.0 / (float(self.alpha) * (1.0 - (1.0 - float(self.p))**self.redundancy) +
-                             float(self.beta) * (1.0 - self.p)**self.redundancy)
+        muEffective = 1.0 / self.jobSizes.getMinMean(self.redundancy)
         return muEffective * (float(network.getSize()) / float(self.redundancy))
 
     def getOneQueueMu(self):
-        return 1.0 / (self.alpha*self.p + self.beta*(1.0 - self.p))
+        return self.mu
 
     def getRedundancy(self):
         return self.redundancy
 
+    ##
+    # A job goes to a whole subset, and its queues all end up with the workload of the copy that finishes first.
+    ##
+    def getSymmetricClasses(self, n):
+        return [list(range(start, min(start + self.redundancy, n))) for start in range(0, n, self.redundancy)]
+
     ##
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta) + \
-               ", d = " + str(self.redundancy)
+        return self.jobSizes.getParamStr() + ", d = " + str(self.redundancy)
 
 
 class RandomQueueStrategy(DispatchPolicyStrategyAbstract):
     """A random dispatching policy. A random queue will get the job."""
 
-    def __init__(self, alpha, beta, p):
-        self.alpha = alpha
-        self.beta = beta
-        self.p = p
-        self.mu = 1.0 / (float(alpha) * float(p) + float(beta) * (1.0 - p))
+    def __init__(self, alpha=None, beta=None, p=None, jobSizes=None):
+        self.setJobSizes(alpha, beta, p, jobSizes)
 
     ##
     # Randomly choose a queue and determine the workload it will get.
     ##
     def getDispatch(self, network):
-        return [np.random.choice(range(network.getSize()))], [np.random.choice([self.alpha, self.beta],
-                                                                             p=[self.p, 1.0 - self.p])]
+        return [self.generator.integers(network.getSize())], [self.drawJobSize()]
+
+    def getParams(self):
+        return dict(self.jobSizeParams)
 
     def getName(self):
         return "random queue"
@@ -140,7 +242,7 @@ class RandomQueueStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta)
+        return self.jobSizes.getParamStr()
 
 
 class OneQueueFixedServiceRateStrategy(DispatchPolicyStrategyAbstract):
@@ -157,16 +259,16 @@ class OneQueueFixedServiceRateStrategy(DispatchPolicyStrategyAbstract):
         self.beta = ((1.0/mu) - float(alpha)*p) / (1.0 - p)
         self.p = p
         self.mu = mu
+        self.jobSizes = BimodalJobSizes(self.alpha, self.beta, self.p)
 
     ##
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
-        workload = self.alpha
-        if np.random.binomial(1, self.p) == 0:
-            workload = self.beta
-        return [0], [workload]
-        # return [0], [np.random.choice([self.alpha, self.beta], p=[self.p, 1.0 - self.p])]
+        return [0], [self.drawJobSize()]
+
+    def getParams(self):
+        return {'alpha': self.alpha, 'mu': self.mu, 'p': self.p}
 
     def getName(self):
         return "one queue fixed service rate"
@@ -179,12 +281,16 @@ class OneQueueFixedServiceRateStrategy(DispatchPolicyStrategyAbstract):
             raise Exception("Invalid probability given")
         self.p = p
         self.beta = ((1.0/self.mu) - float(self.alpha)*p) / (1.0 - p)
+        self.jobSizes = BimodalJobSizes(self.alpha, self.beta, self.p)
+        self.jobSizeBuffer = None
 
     def setBeta(self, beta):
         if beta <= self.alpha:
             raise Exception("Invalid beta, should be greater than alpha")
         self.p = (beta - (1.0/self.mu)) / (beta - self.alpha)
         self.beta = beta
+        self.jobSizes = BimodalJobSizes(self.alpha, self.beta, self.p)
+        self.jobSizeBuffer = None
 
     def getOneQueueMu(self):
         return self.mu
@@ -203,22 +309,19 @@ class OnlyFirstQueueGetsJobsStrategy(DispatchPolicyStrategyAbstract):
     # Initialize policy with @alpha being small workload for a job, @mu being the total service rate and @p being the
     # probability to choose alpha.
     ##
-    def __init__(self, alpha, beta, p, n):
-        self.alpha = alpha
-        self.beta = beta
-        self.p = p
-        self.mu = 1.0 / (float(alpha)*float(p) + float(beta)*(1.0 - p))
+    def __init__(self, alpha=None, beta=None, p=None, n=None, jobSizes=None):
+        self.requireParams(n=n)
+        self.setJobSizes(alpha, beta, p, jobSizes)
         self.n = n
 
     ##
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
-        workload = self.alpha
-        if np.random.binomial(1, self.p) == 0:
-            workload = self.beta
-        return [0], [workload]
-        # return [0], [np.random.choice([self.alpha, self.beta], p=[self.p, 1.0 - self.p])]
+        return [0], [self.drawJobSize()]
+
+    def getParams(self):
+        return dict(self.jobSizeParams, n=self.n)
 
     def getName(self):
         return "only first queue gets jobs"
@@ -233,8 +336,7 @@ class OnlyFirstQueueGetsJobsStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta) + \
-               ", n = " + str(self.n)
+        return self.jobSizes.getParamStr() + ", n = " + str(self.n)
 
 
 class JoinShortestWorkloadStrategy(DispatchPolicyStrategyAbstract):
@@ -244,22 +346,19 @@ class JoinShortestWorkloadStrategy(DispatchPolicyStrategyAbstract):
     # Initialize policy with @alpha being small workload for a job, @beta being unusual workload for a job and @p being
     # the probability to choose @alpha.
     ##
-    def __init__(self, alpha, beta, p):
-        self.alpha = alpha
-        self.mu = 1.0 / (float(alpha)*p + float(beta)*(1.0 - p))
-        if 1.0 / self.mu <= float(alpha):
+    def __init__(self, alpha=None, beta=None, p=None, jobSizes=None):
+        self.setJobSizes(alpha, beta, p, jobSizes)
+        if jobSizes is None and 1.0 / self.mu <= float(alpha):
             raise Exception("Error: must be [ (1.0 / mu) > alpha ] in order to dispatch correctly.")
-        self.beta = beta
-        self.p = p
 
     ##
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
-        workload = self.alpha
-        if np.random.binomial(1, self.p) == 0:
-            workload = self.beta
-        return [np.argmin(network.getWorkloads())], [workload]
+        return [network.getShortestQueue()], [self.drawJobSize()]
+
+    def getParams(self):
+        return dict(self.jobSizeParams)
 
     def getName(self):
         return "join shortest workload"
@@ -274,7 +373,7 @@ class JoinShortestWorkloadStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta)
+        return self.jobSizes.getParamStr()
 
 
 class RouteToAllStrategy(DispatchPolicyStrategyAbstract):
@@ -284,13 +383,10 @@ class RouteToAllStrategy(DispatchPolicyStrategyAbstract):
     # Initialize policy with @alpha being small workload for a job, @beta being unusual workload for a job and @p being
     # the probability to choose @alpha.
     ##
-    def __init__(self, alpha, beta, p):
-        self.alpha = alpha
-        self.mu = 1.0 / (float(alpha)*p + float(beta)*(1.0 - p))
-        if 1.0 / self.mu <= float(alpha):
+    def __init__(self, alpha=None, beta=None, p=None, jobSizes=None):
+        self.setJobSizes(alpha, beta, p, jobSizes)
+        if jobSizes is None and 1.0 / self.mu <= float(alpha):
             raise Exception("Error: must be [ (1.0 / mu) > alpha ] in order to dispatch correctly.")
-        self.beta = beta
-        self.p = p
         self.n = -1
 
     ##
@@ -298,16 +394,18 @@ class RouteToAllStrategy(DispatchPolicyStrategyAbstract):
     ##
     def getDispatch(self, network):
         self.n = network.getSize()
-        workload = np.min(np.random.choice([self.alpha, self.beta], network.getSize(), p=[self.p, 1.0 - self.p]))
-        return range(network.getSize()), [workload for i in range(network.getSize())]
+        workload = min(self.drawJobSizes(network.getSize()))
+        return list(range(network.getSize())), [workload for i in range(network.getSize())]
+
+    def getParams(self):
+        return dict(self.jobSizeParams)
 
     def getName(self):
         return "route to all"
 
     def getEffectiveServiceRate(self, network):
         self.n = network.getSize()
-        return 1.0 / (float(self.beta)*(1.0-self.p)**network.getSize() +
-                      float(self.alpha)*(1.0-(1.0-self.p)**network.getSize()))
+        return 1.0 / self.jobSizes.getMinMean(network.getSize())
 
     def getOneQueueMu(self):
         return self.mu
@@ -315,11 +413,14 @@ class RouteToAllStrategy(DispatchPolicyStrategyAbstract):
     def getRedundancy(self):
         return self.n
 
+    def getSymmetricClasses(self, n):
+        return [list(range(n))]
+
     ##
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta)
+        return self.jobSizes.getParamStr()
 
 
 class VolunteerOrTeamworkStrategy(DispatchPolicyStrategyAbstract):
@@ -330,20 +431,28 @@ class VolunteerOrTeamworkStrategy(DispatchPolicyStrategyAbstract):
     # Initialize policy with @alpha being small workload for a job, @beta being unusual workload for a job and @p being
     # the probability to choose @alpha. @q is the probability to route to all.
     ##
-    def __init__(self, alpha, beta, p, q):
-        self.routeToAll = RouteToAllStrategy(alpha, beta, p)
+    def __init__(self, alpha=None, beta=None, p=None, q=None, jobSizes=None):
+        self.requireParams(q=q)
+        self.routeToAll = RouteToAllStrategy(alpha, beta, p, jobSizes)
+        self.jobSizes = self.routeToAll.jobSizes
         self.q = q
 
+    def setGenerator(self, generator):
+        DispatchPolicyStrategyAbstract.setGenerator(self, generator)
+        self.routeToAll.setGenerator(generator)
+
     ##
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
         # FIXME: wrong assumption in route-to-all. Not all queues have the same workload!
-        if np.random.binomial(1, self.q) == 0:
+        if self.generator.random() >= self.q:
             return self.routeToAll.getDispatch(network)
-        return [np.random.choice(range(network.getSize()))], \
-               [np.random.choice([self.routeToAll.alpha, self.routeToAll.beta],
-                                 p=[self.routeToAll.p, 1.0 - self.routeToAll.p])]
+        # Both paths draw from the one buffer of routeToAll, so job sizes are used in the order they are drawn.
+        return [self.generator.integers(network.getSize())], [self.routeToAll.drawJobSize()]
+
+    def getParams(self):
+        return dict(self.routeToAll.getParams(), q=self.q)
 
     def getName(self):
         return "volunteer or teamwork"
@@ -364,8 +473,7 @@ class VolunteerOrTeamworkStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.routeToAll.p) + ", alpha = " + str(self.routeToAll.alpha) + \
-               ", beta = " + str(self.routeToAll.beta) + ", q = " + str(self.q)
+        return self.jobSizes.getParamStr() + ", q = " + str(self.q)
 
 
 class RandomDStrategy(DispatchPolicyStrategyAbstract):
@@ -375,13 +483,14 @@ class RandomDStrategy(DispatchPolicyStrategyAbstract):
     # Initialize policy with @alpha being small workload for a job, @beta being unusual workload for a job and @p being
     # the probability to choose @alpha. @d is the redundancy level.
     ##
-    def __init__(self, alpha, beta, p, d, bias=0.0):
-        self.alpha = int(alpha)
-        self.mu = 1.0 / (float(alpha) * p + float(beta) * (1.0 - p))
-        if 1.0 / self.mu <= float(alpha):
+    def __init__(self, alpha=None, beta=None, p=None, d=None, bias=0.0, jobSizes=None):
+        self.requireParams(d=d)
+        if jobSizes is None:
+            self.requireParams(alpha=alpha, beta=beta, p=p)
+            (alpha, beta, p) = (int(alpha), int(beta), float(p))
+        self.setJobSizes(alpha, beta, p, jobSizes)
+        if jobSizes is None and 1.0 / self.mu <= float(alpha):
             raise Exception("Error: must be [ (1.0 / mu) > alpha ] in order to dispatch correctly.")
-        self.beta = int(beta)
-        self.p = float(p)
         self.d = int(d)
         self.bias = bias
 
@@ -389,18 +498,20 @@ class RandomDStrategy(DispatchPolicyStrategyAbstract):
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
-        # get network state.
-        currWlds = network.getWorkloads()
-        n = network.getSize()
         # choose queues to receive the job.
-        chosenQueues = np.random.choice(range(n), self.d, replace=False, p=[1.0/n]*n)
+        chosenQueues = self.sampleQueues(network.getSize(), self.d)
+        # get their state.
+        currWlds = [network.getWorkload(q) for q in chosenQueues]
         # randomize incoming workload for each queue.
-        incomingWlds = np.random.choice([self.alpha, self.beta], self.d, p=[self.p, 1.0 - self.p])
-        speculation = [currWlds[chosenQueues[i]] + incomingWlds[i] for i in range(self.d)]
+        incomingWlds = self.drawJobSizes(self.d)
+        speculation = [currWlds[i] + incomingWlds[i] for i in range(self.d)]
         min_i = int(np.argmin(speculation))
-        added = [np.max([speculation[min_i] - currWlds[chosenQueues[i]], 0]) for i in range(self.d)]
+        added = [np.max([speculation[min_i] - currWlds[i], 0]) for i in range(self.d)]
         return chosenQueues, added
 
+    def getParams(self):
+        return dict(self.jobSizeParams, d=self.d, bias=self.bias)
+
     def getName(self):
         return "random-d out of n"
 
@@ -420,8 +531,7 @@ class RandomDStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta) + \
-               ", d = " + str(self.d)
+        return self.jobSizes.getParamStr() + ", d = " + str(self.d)
 
 
 class GeometricDeltaRandomDStrategy(DispatchPolicyStrategyAbstract):
@@ -433,34 +543,37 @@ class GeometricDeltaRandomDStrategy(DispatchPolicyStrategyAbstract):
     # which a job's random workload part will be drawn, @n being the number of servers in the system. @d is the
     # redundancy level.
     ##
-    def __init__(self, alpha, p, d, n):
-        if p >= 1.0 / 2.0*int(n):
-            raise Exception("Error: must be [ (1.0 / 2*n) > p ] in order to dispatch correctly.")
-        self.p = float(p)
+    def __init__(self, alpha=None, p=None, d=None, n=None, jobSizes=None):
+        self.requireParams(d=d, n=n)
+        if jobSizes is None:
+            self.requireParams(alpha=alpha, p=p)
+            if p >= 1.0 / 2.0*int(n):
+                raise Exception("Error: must be [ (1.0 / 2*n) > p ] in order to dispatch correctly.")
+            self.setJobSizes(jobSizes=ShiftedGeometricJobSizes(alpha, p))
+            self.jobSizeParams = {'alpha': int(alpha), 'p': float(p)}
+        else:
+            self.setJobSizes(jobSizes=jobSizes)
         self.n = int(n)
-        self.alpha = int(alpha)
-        self.delta = np.random.RandomState()
-        self.mu = 1.0 / (int(alpha) + (1.0 / float(p)))
-        if 1.0 / self.mu <= float(alpha):
-            raise Exception("Error: must be [ (1.0 / mu) > alpha ] in order to dispatch correctly.")
         self.d = int(d)
 
     ##
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
-        # get network state.
-        currWlds = network.getWorkloads()
-        n = network.getSize()
         # choose queues to receive the job.
-        chosenQueues = np.random.choice(range(n), self.d, replace=False, p=[1.0/n]*n)
+        chosenQueues = self.sampleQueues(network.getSize(), self.d)
+        # get their state.
+        currWlds = [network.getWorkload(q) for q in chosenQueues]
         # randomize incoming workload for each queue.
-        incomingWlds = self.alpha + self.delta.geometric(p=self.p, size=self.d)
-        speculation = [currWlds[chosenQueues[i]] + incomingWlds[i] for i in range(self.d)]
+        incomingWlds = self.drawJobSizes(self.d)
+        speculation = [currWlds[i] + incomingWlds[i] for i in range(self.d)]
         min_i = int(np.argmin(speculation))
-        added = [np.max([speculation[min_i] - currWlds[chosenQueues[i]], 0]) for i in range(self.d)]
+        added = [np.max([speculation[min_i] - currWlds[i], 0]) for i in range(self.d)]
         return chosenQueues, added
 
+    def getParams(self):
+        return dict(self.jobSizeParams, d=self.d, n=self.n)
+
     def getName(self):
         return "geometric delta random-d"
 
@@ -480,7 +593,7 @@ class GeometricDeltaRandomDStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", d = " + str(self.d)
+        return self.jobSizes.getParamStr() + ", d = " + str(self.d)
 
 
 class RouteToIdleQueuesStrategy(DispatchPolicyStrategyAbstract):
@@ -491,35 +604,30 @@ class RouteToIdleQueuesStrategy(DispatchPolicyStrategyAbstract):
     # Initialize policy with @alpha being small workload for a job, @beta being unusual workload for a job and @p being
     # the probability to choose @alpha.
     ##
-    def __init__(self, alpha, beta, p, bias=0.0):
-        self.alpha = int(alpha)
-        self.mu = 1.0 / (float(alpha) * p + float(beta) * (1.0 - p))
-        if 1.0 / self.mu <= float(alpha):
+    def __init__(self, alpha=None, beta=None, p=None, bias=0.0, jobSizes=None):
+        if jobSizes is None:
+            self.requireParams(alpha=alpha, beta=beta, p=p)
+            (alpha, beta, p) = (int(alpha), int(beta), float(p))
+        self.setJobSizes(alpha, beta, p, jobSizes)
+        if jobSizes is None and 1.0 / self.mu <= float(alpha):
             raise Exception("Error: must be [ (1.0 / mu) > alpha ] in order to dispatch correctly.")
-        self.beta = int(beta)
-        self.p = float(p)
         self.bias = bias
 
     ##
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
-        # get network state.
-        currWlds = network.getWorkloads()
-        n = network.getSize()
         # choose queues to receive the job.
-        chosenQueues = []
-        for i in np.argsort(currWlds):
-            if currWlds[i] > 0:
-                break
-            chosenQueues.append(i)
+        chosenQueues = network.getIdleQueues()
         if not chosenQueues:
-            chosenQueues = [np.random.choice(range(n))]
+            chosenQueues = [self.generator.integers(network.getSize())]
         # randomize incoming workload for each queue.
-        added = [np.min(np.random.choice([self.alpha, self.beta], len(chosenQueues), p=[self.p, 1.0 - self.p]))] * \
-                len(chosenQueues)
+        added = [min(self.drawJobSizes(len(chosenQueues)))] * len(chosenQueues)
         return chosenQueues, added
 
+    def getParams(self):
+        return dict(self.jobSizeParams, bias=self.bias)
+
     def getName(self):
         return "route to idle queues"
 
@@ -536,50 +644,88 @@ class RouteToIdleQueuesStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta)
-
-
-import itertools
+        return self.jobSizes.getParamStr()
+
+
+##
+# Get the @d-subset of {0, 1, ... , @n-1} of rank @rank (0 <= rank < C(n, d)) in colexicographic order, in ascending
+# order. A subset c_1 < ... < c_d has rank C(c_1, 1) + ... + C(c_d, d) (the combinatorial number system), so its
+# largest element is the largest c with C(c, d) <= rank, and so on down. Takes O(d log n) binomials, no tables.
+##
+def unrankCombination(rank, n, d):
+    if not 0 <= rank < math.comb(n, d):
+        raise Exception("Rank " + str(rank) + " out of range for subsets of size " + str(d) + " of " + str(n))
+    subset = []
+    high = n
+    for i in range(d, 0, -1):
+        # The largest c in [i - 1, high) with C(c, i) <= rank.
+        (low, top) = (i - 1, high - 1)
+        while low < top:
+            middle = (low + top + 1) // 2
+            if math.comb(middle, i) <= rank:
+                low = middle
+            else:
+                top = middle - 1
+        subset.append(low)
+        rank -= math.comb(low, i)
+        high = low
+    subset.reverse()
+    return subset
 
 
 class RoundRobinRedundancyDStrategy(DispatchPolicyStrategyAbstract):
     """A dispatching policy that routes to a subset of d queues from a random permutation of all possible d-sized
-    subsets of {0, 1, ... , n-1}. Once the permutation is decided, the policy will do a round robin on them."""
+    subsets of {0, 1, ... , n-1}. Once the permutation is decided, the policy will do a round robin on them.
+    The subsets are never materialized: the k-th subset of the round robin is the subset whose rank is the image of k
+    under a RandomPermutation of the C(n, d) ranks (see unrankCombination), so memory and setup are O(d)."""
 
     ##
     # Initialize policy with @alpha being small workload for a job, @beta being unusual workload for a job and @p being
     # the probability to choose @alpha. @d is the redundancy level. @n is the number of queues.
     ##
-    def __init__(self, alpha, beta, p, d, n, bias=0.0):
-        self.alpha = int(alpha)
-        self.mu = 1.0 / (float(alpha) * p + float(beta) * (1.0 - p))
-        if 1.0 / self.mu <= float(alpha):
+    def __init__(self, alpha=None, beta=None, p=None, d=None, n=None, bias=0.0, jobSizes=None):
+        self.requireParams(d=d, n=n)
+        if jobSizes is None:
+            self.requireParams(alpha=alpha, beta=beta, p=p)
+            (alpha, beta, p) = (int(alpha), int(beta), float(p))
+        self.setJobSizes(alpha, beta, p, jobSizes)
+        if jobSizes is None and 1.0 / self.mu <= float(alpha):
             raise Exception("Error: must be [ (1.0 / mu) > alpha ] in order to dispatch correctly.")
-        self.beta = int(beta)
-        self.p = float(p)
         self.d = int(d)
         self.n = n
         self.bias = bias
-        self.order = [list(i) for i in itertools.combinations(range(n), d)]
-        np.random.shuffle(self.order)
+        self.subsets = math.comb(int(n), self.d)
+        self.order = None
+        self.round = 0
+
+    ##
+    # The permutation of the subsets is drawn from the policy's generator whenever one is set, so it only depends on
+    # that generator.
+    ##
+    def setGenerator(self, generator):
+        DispatchPolicyStrategyAbstract.setGenerator(self, generator)
+        self.order = RandomPermutation(self.subsets, generator)
         self.round = 0
 
     ##
     # Randomize arriving job's workload.
     ##
     def getDispatch(self, network):
-        # get network state.
-        currWlds = network.getWorkloads()
         # choose queues to receive the job.
-        chosenQueues = self.order[self.round]
-        self.round = (self.round + 1) % self.n
+        chosenQueues = unrankCombination(self.order.permute(self.round), self.n, self.d)
+        self.round = (self.round + 1) % self.subsets
+        # get their state.
+        currWlds = [network.getWorkload(q) for q in chosenQueues]
         # randomize incoming workload for each queue.
-        incomingWlds = np.random.choice([self.alpha, self.beta], self.d, p=[self.p, 1.0 - self.p])
-        speculation = [currWlds[chosenQueues[i]] + incomingWlds[i] for i in range(self.d)]
+        incomingWlds = self.drawJobSizes(self.d)
+        speculation = [currWlds[i] + incomingWlds[i] for i in range(self.d)]
         min_i = int(np.argmin(speculation))
-        added = [np.max([speculation[min_i] - currWlds[chosenQueues[i]], 0]) for i in range(self.d)]
+        added = [np.max([speculation[min_i] - currWlds[i], 0]) for i in range(self.d)]
         return chosenQueues, added
 
+    def getParams(self):
+        return dict(self.jobSizeParams, d=self.d, n=self.n, bias=self.bias)
+
     def getName(self):
         return "round robin redundancy-d"
 
@@ -599,5 +745,110 @@ class RoundRobinRedundancyDStrategy(DispatchPolicyStrategyAbstract):
     # Get policy params string for logging.
     ##
     def getParamStr(self):
-        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta) + \
-               ", d = " + str(self.d)
+        return self.jobSizes.getParamStr() + ", d = " + str(self.d)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestRoundRobinRedundancyDStrategy(ut.TestCase):
+    def runTest(self):
+        import itertools
+        from QueueNetwork import QueueNetwork
+        from RandomStreams import getGenerator
+        # Ranks follow the colexicographic order.
+        for (n, d) in [(1, 1), (5, 2), (6, 3), (7, 7)]:
+            colex = sorted((list(subset) for subset in itertools.combinations(range(n), d)),
+                           key=lambda subset: subset[::-1])
+            self.assertEqual([unrankCombination(rank, n, d) for rank in range(len(colex))], colex)
+        with self.assertRaises(Exception):
+            unrankCombination(10, 5, 2)
+        # Every subset is visited exactly once per cycle of C(n, d) arrivals.
+        policy = RoundRobinRedundancyDStrategy(alpha=10, beta=100, p=0.8, d=3, n=7)
+        policy.setGenerator(getGenerator(1))
+        network = QueueNetwork(7)
+        cycles = [[tuple(policy.getDispatch(network)[0]) for i in range(35)] for cycle in range(2)]
+        self.assertEqual(sorted(cycles[0]), list(itertools.combinations(range(7), 3)))
+        self.assertEqual(cycles[0], cycles[1])
+        self.assertNotEqual(cycles[0], sorted(cycles[0]))
+        # Sizes far too large to enumerate.
+        policy = RoundRobinRedundancyDStrategy(alpha=10, beta=100, p=0.8, d=8, n=64)
+        policy.setGenerator(getGenerator(2))
+        chosen = policy.getDispatch(QueueNetwork(64))[0]
+        self.assertEqual((len(set(chosen)), policy.subsets), (8, 4426165368))
+        print("TestRoundRobinRedundancyDStrategy: OK.")
+
+
+class TestPolicyJobSizes(ut.TestCase):
+    def runTest(self):
+        from QueueNetwork import QueueNetwork
+        from SimulationSpec import SimulationSpec
+        from EventSkippingEngine import EventSkippingEngine
+        network = QueueNetwork(4)
+        # Policies built from alpha, beta and p keep their params and rates.
+        policy = RouteToAllStrategy(alpha=10, beta=100, p=0.8)
+        self.assertEqual(policy.getParams(), {'alpha': 10, 'beta': 100, 'p': 0.8})
+        self.assertAlmostEqual(policy.getEffectiveServiceRate(network), 1.0 / (100 * 0.2 ** 4 + 10 * (1 - 0.2 ** 4)))
+        self.assertEqual(policy.getParamStr(), "p = 0.8, alpha = 10, beta = 100")
+        # Or from a job size distribution, given by its description.
+        pareto = {'kind': 'pareto', 'scale': 5, 'shape': 2.5}
+        policy = RandomDStrategy(d=2, jobSizes=pareto)
+        self.assertEqual(policy.getParams(), {'jobSizes': dict(pareto, scale=5.0), 'd': 2, 'bias': 0.0})
+        self.assertEqual(RandomDStrategy(**policy.getParams()).getParams(), policy.getParams())
+        self.assertAlmostEqual(1.0 / policy.getOneQueueMu(), policy.jobSizes.getMean())
+        policy = FixedSubsetsStrategy(redundancy=2, jobSizes={'kind': 'shiftedGeometric', 'alpha': 1, 'p': 0.5})
+        self.assertAlmostEqual(policy.getEffectiveServiceRate(network), 2.0 / (1 + 1.0 / 0.75))
+        with self.assertRaises(Exception):
+            RandomDStrategy(alpha=10, beta=100, p=0.8)
+        with self.assertRaises(Exception):
+            JoinShortestWorkloadStrategy(alpha=10, beta=100)
+        # A whole round, on both engines.
+        spec = SimulationSpec(4, "RandomDStrategy", {'d': 2, 'jobSizes': pareto}, "RunForXSlotsConvergenceStrategy",
+                              {'x': 5000}, 0.3, 1.0, seed=3, historyWindowSize=1000, T_max=5000)
+        (estimate, diagnostics) = spec.run()
+        self.assertGreater(estimate, 0)
+        self.assertEqual(EventSkippingEngine().run(spec)[0], estimate)
+        # A trace of sizes 1, 2, 3, ... is replayed in order whichever way a job goes.
+        import os
+        import tempfile
+        from TraceSource import writeTrace
+        from RandomStreams import getGenerator
+        prefix = os.path.join(tempfile.mkdtemp(), "trace")
+        writeTrace(prefix, [1] * 10, list(range(1, 10001)))
+        policy = VolunteerOrTeamworkStrategy(q=0.5, jobSizes={'kind': 'trace', 'trace': prefix})
+        policy.setGenerator(getGenerator(2))
+        nextSize = 1
+        for i in range(50):
+            (queues, sizes) = policy.getDispatch(network)
+            self.assertEqual(sizes, [nextSize] * len(queues))
+            nextSize += 1 if len(queues) == 1 else network.getSize()
+        print("TestPolicyJobSizes: OK.")
+
+
+class TestSymmetricClasses(ut.TestCase):
+    def runTest(self):
+        from SimulationSpec import SimulationSpec
+        self.assertEqual(FixedSubsetsStrategy(redundancy=2, alpha=1, beta=10, p=0.5).getSymmetricClasses(5),
+                         [[0, 1], [2, 3], [4]])
+        self.assertIsNone(RandomDStrategy(alpha=1, beta=10, p=0.5, d=2).getSymmetricClasses(5))
+        # A lumped round gives the statistics of an unlumped one, to the last bit.
+        for (policyName, policyParams) in [("RouteToAllStrategy", {'alpha': 10, 'beta': 100, 'p': 0.8}),
+                                           ("FixedSubsetsStrategy", {'redundancy': 2, 'alpha': 10, 'beta': 100,
+                                                                     'p': 0.8})]:
+            spec = SimulationSpec(9, policyName, policyParams, "RunForXSlotsConvergenceStrategy", {'x': 20000}, 0.05,
+                                  0.1, seed=11, historyWindowSize=1000, T_max=20000)
+            sim = spec.prepare()
+            (estimate, diagnostics) = spec.run(sim)
+            self.assertTrue(sim.network.isLumped())
+            workloads = sim.network.getWorkloads()
+            sim = spec.prepare()
+            sim.dispatchPolicyStrategy.getSymmetricClasses = lambda n: None
+            (unlumped, unlumpedDiagnostics) = spec.run(sim)
+            self.assertFalse(sim.network.isLumped())
+            self.assertEqual((unlumped, unlumpedDiagnostics['slots']), (estimate, diagnostics['slots']))
+            self.assertEqual(sim.network.getWorkloads(), workloads)
+        print("TestSymmetricClasses: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
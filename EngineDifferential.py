@@ -0,0 +1,232 @@
+import sys
+import copy
+import math
+import argparse
+import numpy as np
+import unittest as ut
+from RandomStreams import SeedStreams
+from StatsCollector import T_QUANTILES_95
+from EventSkippingEngine import EventSkippingEngine
+
+# Alternative engines to check against the reference slot loop. An engine has getName(), supports(spec), an 'exact'
+# attribute and run(spec, recorder=None), which returns (estimate, diagnostics) like SimulationSpec.run.
+ENGINES = dict((engine.getName(), engine) for engine in [EventSkippingEngine(),
+                                                         EventSkippingEngine(exactArrivals=False)])
+
+
+class TrajectoryProbe:
+    """A TrajectoryRecorder that keeps every slot in memory: the total workload and, with @perQueue, the workload of
+    every queue at the end of the slot."""
+
+    def __init__(self, perQueue=True):
+        self.perQueue = perQueue
+        self.totals = []
+        self.workloads = []
+
+    def start(self, network, arrivalRate, maxSlots):
+        self.totals = []
+        self.workloads = []
+
+    def record(self, t, network):
+        if t != len(self.totals):
+            raise Exception("Slot " + str(t) + " recorded out of order")
+        self.totals.append(int(network.getTotalWorkload()))
+        if self.perQueue:
+            self.workloads.append([int(workload) for workload in network.getWorkloads()])
+
+    def finish(self):
+        pass
+
+
+##
+# Run the round of @spec on the reference slot loop (QueueNetworkSimulation.runPoint), recording it to @probe.
+##
+def runReference(spec, probe=None):
+    spec = copy.copy(spec)
+    spec.trajectoryRecorder = probe
+    return spec.run()
+
+
+def runEngine(engine, spec, probe=None):
+    return engine.run(spec, probe)
+
+
+##
+# Get the first slot at which two probes differ and how, or None if they recorded the same trajectory.
+##
+def findMismatch(reference, candidate):
+    for t in range(min(len(reference.totals), len(candidate.totals))):
+        if reference.totals[t] != candidate.totals[t]:
+            return t, "total workload " + str(reference.totals[t]) + " != " + str(candidate.totals[t])
+        if reference.perQueue and candidate.perQueue and reference.workloads[t] != candidate.workloads[t]:
+            return t, "workloads " + str(reference.workloads[t]) + " != " + str(candidate.workloads[t])
+    if len(reference.totals) != len(candidate.totals):
+        t = min(len(reference.totals), len(candidate.totals))
+        return t, "trajectory length " + str(len(reference.totals)) + " != " + str(len(candidate.totals))
+    return None
+
+
+##
+# Check that @engine reproduces the reference round of @spec exactly: the same workload trajectory (total and per
+# queue, slot by slot), the same slots, convergence and estimate.
+##
+def compareExact(engine, spec, perQueue=True):
+    (referenceProbe, candidateProbe) = (TrajectoryProbe(perQueue), TrajectoryProbe(perQueue))
+    (referenceEstimate, referenceDiagnostics) = runReference(spec, referenceProbe)
+    (estimate, diagnostics) = runEngine(engine, spec, candidateProbe)
+    mismatches = []
+    mismatch = findMismatch(referenceProbe, candidateProbe)
+    if mismatch is not None:
+        mismatches.append("slot " + str(mismatch[0]) + ": " + mismatch[1])
+    for field in ('slots', 'converged', 'convergenceChecks'):
+        if referenceDiagnostics[field] != diagnostics[field]:
+            mismatches.append(field + " " + str(referenceDiagnostics[field]) + " != " + str(diagnostics[field]))
+    if referenceEstimate != estimate:
+        mismatches.append("estimate " + repr(float(referenceEstimate)) + " != " + repr(float(estimate)))
+    return {'mode': 'exact', 'engine': engine.getName(), 'spec': describeSpec(spec), 'ok': not mismatches,
+            'mismatches': mismatches, 'slots': referenceDiagnostics['slots']}
+
+
+##
+# Check that @engine is statistically equivalent to the reference on @spec: both run @replications rounds on the
+# same seeds, and the difference of their mean estimates must lie within the 95% confidence interval of the
+# difference (Welch), widened by @tolerance (relative to the reference mean) for estimator bias that is acceptable.
+##
+def compareStatistical(engine, spec, replications=10, rootSeed=None, tolerance=0.0):
+    streams = SeedStreams(rootSeed)
+    (reference, candidate) = ([], [])
+    for r in range(replications):
+        replica = copy.copy(spec)
+        replica.seed = streams.getSeed(r)
+        reference.append(float(runReference(replica)[0]))
+        candidate.append(float(runEngine(engine, replica)[0]))
+    difference = float(np.mean(candidate) - np.mean(reference))
+    (referenceVariance, candidateVariance) = (np.var(reference, ddof=1) / replications,
+                                              np.var(candidate, ddof=1) / replications)
+    standardError = math.sqrt(referenceVariance + candidateVariance)
+    # Welch-Satterthwaite degrees of freedom.
+    degrees = len(T_QUANTILES_95)
+    if standardError > 0:
+        degrees = (referenceVariance + candidateVariance) ** 2 / \
+            ((referenceVariance ** 2 + candidateVariance ** 2) / (replications - 1))
+    quantile = T_QUANTILES_95[max(int(degrees), 1) - 1] if degrees <= len(T_QUANTILES_95) else 1.96
+    halfWidth = quantile * standardError + tolerance * abs(float(np.mean(reference)))
+    return {'mode': 'statistical', 'engine': engine.getName(), 'spec': describeSpec(spec),
+            'ok': abs(difference) <= halfWidth, 'referenceMean': float(np.mean(reference)),
+            'candidateMean': float(np.mean(candidate)), 'difference': difference, 'halfWidth': halfWidth,
+            'rootSeed': streams.getRootSeed(),
+            'mismatches': [] if abs(difference) <= halfWidth else
+            ["mean estimate differs by " + "%.4g" % difference + " (95% half-width " + "%.4g" % halfWidth + ")"]}
+
+
+def describeSpec(spec):
+    return spec.policyName + "(" + ",".join(name + "=" + str(spec.policyParams[name])
+                                           for name in sorted(spec.policyParams)) + "),n=" + str(spec.size) + \
+        ",arrivalRate=" + "%.6g" % spec.arrivalRate + ",convergence=" + spec.convergenceName
+
+
+##
+# Get the specs to compare on: every policy (all of them by default, see ThroughputBenchmark.getPolicyParams) on
+# every size, redundancy and load, with @convergence (name, params) ending the rounds.
+##
+def getDifferentialSpecs(policies=None, sizes=(1, 3, 4), redundancies=(1, 2), loads=(0.3, 0.9), slots=5000,
+                         convergence=None, historyWindowSize=1000, rootSeed=None):
+    import DispatchPolicyStrategy
+    from QueueNetwork import QueueNetwork
+    from SimulationSpec import SimulationSpec
+    from ThroughputBenchmark import getPolicyNames, getPolicyParams
+    (convergenceName, convergenceParams) = convergence if convergence else \
+        ('RunForXSlotsConvergenceStrategy', {'x': slots})
+    streams = SeedStreams(rootSeed)
+    specs = []
+    for policyName in (policies if policies else getPolicyNames()):
+        for n in sizes:
+            for d in redundancies:
+                params = getPolicyParams(policyName, n, d)
+                if params is None:
+                    continue
+                policy = getattr(DispatchPolicyStrategy, policyName)(**params)
+                effectiveServiceRate = policy.getEffectiveServiceRate(QueueNetwork(n))
+                for load in loads:
+                    specs.append(SimulationSpec(n, policyName, params, convergenceName, convergenceParams,
+                                                min(load * effectiveServiceRate, 1.0), effectiveServiceRate,
+                                                index=len(specs), seed=streams.getSeed(len(specs)),
+                                                historyWindowSize=historyWindowSize, T_max=slots))
+    return specs
+
+
+##
+# Compare every engine (all of ENGINES by default) with the reference on @specs: exactly for exact engines,
+# statistically (@replications rounds per spec) for the others. Specs an engine does not support are skipped.
+##
+def runDifferential(specs, engines=None, replications=10, rootSeed=None, tolerance=0.0, verbose=False):
+    results = []
+    for name in (engines if engines else sorted(ENGINES)):
+        engine = ENGINES[name]
+        for spec in specs:
+            if not engine.supports(spec):
+                continue
+            if engine.exact:
+                result = compareExact(engine, spec)
+            else:
+                result = compareStatistical(engine, spec, replications, rootSeed, tolerance)
+            if verbose:
+                print(("INFO:    " if result['ok'] else "ERROR:   ") + name.ljust(24) + result['spec'] +
+                      ("" if result['ok'] else "\n         " + "\n         ".join(result['mismatches'])))
+            results.append(result)
+    return results
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestEngineDifferential(ut.TestCase):
+    def runTest(self):
+        from ThroughputBenchmark import getPolicyNames
+        # Every policy, exactly, including rounds that end by convergence rather than T_max.
+        specs = getDifferentialSpecs(sizes=[1, 4], redundancies=[1, 2], loads=[0.9], slots=2000,
+                                     historyWindowSize=500, rootSeed=1)
+        specs += getDifferentialSpecs(policies=['RandomDStrategy', 'JoinShortestWorkloadStrategy'], sizes=[3],
+                                      redundancies=[1, 2], loads=[0.3], slots=20000, historyWindowSize=500,
+                                      convergence=('VarianceConvergenceStrategy', {'epsilon': 1e-2}), rootSeed=2)
+        self.assertEqual(set(spec.policyName for spec in specs), set(getPolicyNames()))
+        results = runDifferential(specs, engines=['eventSkipping'])
+        self.assertEqual(len(results), len(specs))
+        for result in results:
+            self.assertTrue(result['ok'], result['spec'] + ": " + "; ".join(result['mismatches']))
+        self.assertTrue(any(result['slots'] < 20000 for result in results[-3:]))
+        # A mismatch is reported at the slot where it happens.
+        (reference, candidate) = (TrajectoryProbe(), TrajectoryProbe())
+        (reference.totals, candidate.totals) = ([1, 2, 3], [1, 2, 4])
+        (reference.workloads, candidate.workloads) = ([[1], [2], [3]], [[1], [2], [4]])
+        self.assertEqual(findMismatch(reference, candidate)[0], 2)
+        self.assertIsNone(findMismatch(reference, reference))
+        # The geometric engine draws different random numbers, so it is only equal in distribution.
+        spec = getDifferentialSpecs(policies=['RandomQueueStrategy'], sizes=[3], redundancies=[1], loads=[0.3],
+                                    slots=20000, rootSeed=3)[0]
+        self.assertFalse(compareExact(ENGINES['eventSkippingGeometric'], spec)['ok'])
+        result = compareStatistical(ENGINES['eventSkippingGeometric'], spec, replications=10, rootSeed=4)
+        self.assertTrue(result['ok'], "; ".join(result['mismatches']))
+        print("TestEngineDifferential: OK.")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        ut.main()
+    parser = argparse.ArgumentParser(description="Check alternative engines against the reference slot loop.")
+    parser.add_argument('--engines', nargs='*', help="engines (default: all of " + ", ".join(sorted(ENGINES)) + ")")
+    parser.add_argument('--policies', nargs='*', help="dispatch policy class names (default: all)")
+    parser.add_argument('--sizes', nargs='*', type=int, default=[1, 3, 4])
+    parser.add_argument('--redundancies', nargs='*', type=int, default=[1, 2])
+    parser.add_argument('--loads', nargs='*', type=float, default=[0.3, 0.9])
+    parser.add_argument('--slots', type=int, default=5000, help="slots per round")
+    parser.add_argument('--replications', type=int, default=10, help="rounds per spec for approximate engines")
+    parser.add_argument('--tolerance', type=float, default=0.0, help="relative bias allowed for approximate engines")
+    parser.add_argument('--root-seed', type=int)
+    args = parser.parse_args()
+    differential = runDifferential(getDifferentialSpecs(args.policies, args.sizes, args.redundancies, args.loads,
+                                                        args.slots, rootSeed=args.root_seed),
+                                   args.engines, args.replications, args.root_seed, args.tolerance, verbose=True)
+    failed = [result for result in differential if not result['ok']]
+    print("INFO:    " + str(len(differential) - len(failed)) + " of " + str(len(differential)) + " comparisons passed.")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,258 @@
+import numpy as np
+import unittest as ut
+from timeit import default_timer as timer
+from StatsCollector import Stats
+from TelemetryLedger import getPeakRSS
+from RandomStreams import getGenerator
+from QueueNetworkSimulation import SimulationTimeout, drawArrivals
+
+
+class LazyNetwork:
+    """Stands in for the QueueNetwork of a round run by EventSkippingEngine. Queues are only served when something
+    looks at them (a dispatch, a convergence check, a recorder or the end of the round), and then for all the slots
+    since the last time at once. Like QueueNetwork, the total workload is book-kept by what was added and served, not
+    recomputed from the queues."""
+
+    def __init__(self, size, workloads=None):
+        self.size = int(size)
+        self.workloads = np.array(workloads if workloads else [0] * self.size, dtype=np.int64)
+        # Total workload minus the sum of the queues (see addWorkload).
+        self.offset = 0
+        self.time = 0
+
+    def getSize(self):
+        return self.size
+
+    def getTime(self):
+        return self.time
+
+    def getWorkloads(self):
+        return self.workloads.tolist()
+
+    def getWorkload(self, i):
+        return int(self.workloads[i])
+
+    def getTotalWorkload(self):
+        return int(self.workloads.sum()) + self.offset
+
+    def getShortestQueue(self):
+        return int(np.argmin(self.workloads))
+
+    def getIdleQueues(self):
+        return np.flatnonzero(self.workloads == 0).tolist()
+
+    ##
+    # Same as QueueNetwork.addWorkload: a queue never goes below 0, but the total counts the workload as given.
+    ##
+    def addWorkload(self, chosen, workloads):
+        if len(chosen) < 1 or len(chosen) != len(workloads):
+            raise Exception("Illegal size of queues or workloads for addWorkload")
+        _workloads = [int(workload) for workload in workloads]
+        if np.sum(workloads) != np.sum(_workloads):
+            raise Exception("OUCH!!!")
+        for i in range(len(chosen)):
+            current = int(self.workloads[chosen[i]])
+            added = max(current + _workloads[i], 0) - current
+            self.workloads[chosen[i]] += added
+            self.offset += _workloads[i] - added
+
+    ##
+    # Serve @slots slots without arrivals (service of 1 per queue per slot). Returns the total workload at the end of
+    # each of them.
+    ##
+    def serve(self, slots):
+        if slots <= 0:
+            return []
+        busy = np.sort(self.workloads[self.workloads > 0])
+        if len(busy) == 0:
+            return [self.offset] * slots
+        # The number of queues still busy in the m-th slot is the number of queues holding at least m.
+        steps = min(slots, int(busy[-1]))
+        stillBusy = len(busy) - np.searchsorted(busy, np.arange(1, steps + 1), side='left')
+        totals = int(busy.sum()) + self.offset - np.cumsum(stillBusy)
+        self.workloads = np.maximum(self.workloads - slots, 0)
+        return totals.tolist() + [self.offset] * (slots - steps)
+
+
+class EventSkippingEngine:
+    """Runs the round of a SimulationSpec with the semantics of QueueNetworkSimulation.runPoint, doing per-queue work
+    only in slots with an arrival (see LazyNetwork) instead of in every slot.
+    With @exactArrivals (the default) the arrivals of every window are drawn exactly like the slot loop does (see
+    drawArrivals), so a round consumes the random stream identically and its workload trajectory, estimate and slots
+    equal the slot loop's. Without it the gap to the next arrival is drawn at once (geometric), which is only equal in
+    distribution. Both skip the slots without an arrival.
+    An arrival trace of the spec is replayed like the slot loop does (exact arrivals only).
+    Only networks with unit service rates are supported (see supports)."""
+
+    def __init__(self, exactArrivals=True):
+        self.exact = exactArrivals
+
+    def getName(self):
+        return "eventSkipping" if self.exact else "eventSkippingGeometric"
+
+    def supports(self, spec):
+        return all(int(service) == 1 for service in spec.services) and (self.exact or spec.arrivalTrace is None)
+
+    ##
+    # Run the round of @spec. Returns (estimate, diagnostics) like SimulationSpec.run. A @recorder (see
+    # TrajectoryRecorder), if given, is called for every slot.
+    ##
+    def run(self, spec, recorder=None):
+        if not self.supports(spec):
+            raise Exception(self.getName() + " only supports unit service rates (and arrival traces with exact " +
+                            "arrivals)")
+        generator = getGenerator(spec.seed)
+        policy = spec.buildDispatchPolicy()
+        policy.setGenerator(generator)
+        condition = spec.buildConvergenceCondition()
+        network = LazyNetwork(spec.size, spec.workloads)
+        arrivalRate = spec.arrivalRate
+        arrivalTrace = spec.buildArrivalTrace()
+        drawArrival = arrivalTrace.getArrivalStream().draw if arrivalTrace is not None else drawArrivals
+        windowSize = spec.historyWindowSize
+        T_min = spec.T_min if spec.T_min != 0 else windowSize
+        T_max = spec.T_max
+        self.stats = Stats(windowSize=windowSize)
+        self.averaged = 0
+        self.average = 0.0
+        diagnostics = {'arrivalRate': float(arrivalRate),
+                       'load': float(arrivalRate) / spec.effectiveServiceRate if spec.effectiveServiceRate else 0.0,
+                       'slots': 0,
+                       'converged': True,
+                       'wallTime': 0.0,
+                       'convergenceChecks': 0,
+                       'peakRSS': getPeakRSS(),
+                       'engine': self.getName(),
+                       'index': spec.index,
+                       'replication': spec.replication}
+        if arrivalRate <= 0:
+            return 0.0, diagnostics
+        start = timer()
+        deadline = start + spec.timeout if spec.timeout is not None else None
+        if recorder is not None:
+            recorder.start(network, arrivalRate, T_max)
+        getDispatch = policy.getDispatch
+        hasConverged = condition.hasConverged
+        window = [self.stats.getWindow()]
+        converged = False
+        convergenceChecks = 0
+        # Slots served lazily, the last of them being slot t.
+        pending = 0
+        # Exact arrivals: the arrival slots of the current window, from slot @first to the end of the window.
+        (first, windowEnd, upcoming) = (0, 0, iter([]))
+        nextArrival = -1 if self.exact else generator.geometric(arrivalRate) - 1
+        t = 0
+        while t < T_max:
+            if self.exact and t == windowEnd:
+                first = t
+                windowEnd = t - t % windowSize + windowSize
+                upcoming = iter((first + np.flatnonzero(drawArrival(generator, windowEnd - first,
+                                                                    arrivalRate))).tolist())
+                nextArrival = next(upcoming, windowEnd)
+            if nextArrival > t:
+                # Jump to the next arrival, window boundary or the last slot, whichever comes first.
+                skipTo = min(nextArrival, t - t % windowSize + windowSize - 1, T_max - 1)
+                pending += skipTo - t
+                t = skipTo
+            if t == nextArrival:
+                nextArrival = next(upcoming, windowEnd) if self.exact else t + generator.geometric(arrivalRate)
+                self.insertAverages(self.serve(network, pending, t - 1, recorder))
+                pending = 0
+                network.time = t
+                queues, newWork = getDispatch(network)
+                network.addWorkload(queues, newWork)
+            pending += 1
+            if deadline is not None and (t + 1) % windowSize == 0 and timer() > deadline:
+                if recorder is not None:
+                    recorder.finish()
+                raise SimulationTimeout("Round with arrival rate " + str(arrivalRate) + " exceeded its wall-clock " +
+                                        "limit of " + str(spec.timeout) + " seconds at time slot " + str(t + 1))
+            check = t >= T_min and (t + 1) % windowSize == 0
+            if check or recorder is not None:
+                totals = self.serve(network, pending, t, recorder)
+                pending = 0
+                self.insertAverages(totals[:-1])
+                if check:
+                    convergenceChecks += 1
+                    network.time = t
+                    # As in the slot loop, the window holds the averages up to the previous slot.
+                    if hasConverged(network, window, T_min, T_max):
+                        self.insertAverages(totals[-1:])
+                        converged = True
+                        break
+                self.insertAverages(totals[-1:])
+            t += 1
+        if not converged:
+            self.insertAverages(self.serve(network, pending, t - 1, recorder))
+        end = timer()
+        if recorder is not None:
+            recorder.finish()
+        network.time = t
+        diagnostics['slots'] = t + 1 if converged else t
+        diagnostics['converged'] = converged
+        diagnostics['wallTime'] = float(end) - float(start)
+        diagnostics['convergenceChecks'] = convergenceChecks
+        diagnostics['peakRSS'] = getPeakRSS()
+        return np.mean(self.stats.getWindow()), diagnostics
+
+    ##
+    # Serve the @slots slots ending with slot @t, recording every one of them if there is a @recorder. Returns their
+    # total workloads.
+    ##
+    @staticmethod
+    def serve(network, slots, t, recorder):
+        if recorder is None:
+            return network.serve(slots)
+        totals = []
+        for slot in range(t - slots + 1, t + 1):
+            totals += network.serve(1)
+            network.time = slot
+            recorder.record(slot, network)
+        return totals
+
+    ##
+    # Insert the running averages of the next slots, given their total workloads, into the window. The arithmetic is
+    # QueueNetworkSimulation.calcAvgWorkLoad's, so the window is the slot loop's to the last bit.
+    ##
+    def insertAverages(self, totals):
+        insert = self.stats.insert
+        average = self.average
+        T = self.averaged
+        for total in totals:
+            T += 1
+            slots = float(T)
+            average = (1.0 / slots) * ((slots - 1) * average + float(total))
+            insert(average)
+        self.average = average
+        self.averaged = T
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestEventSkippingEngine(ut.TestCase):
+    def runTest(self):
+        from QueueNetwork import QueueNetwork
+        from SimulationSpec import SimulationSpec
+        # Serving lazily gives the totals of serving slot by slot.
+        (lazy, network) = (LazyNetwork(3, [0, 2, 5]), QueueNetwork(3, workloads=[0, 2, 5]))
+        totals = []
+        for t in range(7):
+            network.endTimeSlot()
+            totals.append(network.getTotalWorkload())
+        self.assertEqual(lazy.serve(7), totals)
+        self.assertEqual(lazy.getWorkloads(), [0, 0, 0])
+        lazy.addWorkload([0, 1], [4, -1])
+        self.assertEqual((lazy.getWorkloads(), lazy.getTotalWorkload()), ([4, 0, 0], 3))
+        spec = SimulationSpec(3, "RandomDStrategy", {'alpha': 10, 'beta': 100, 'p': 0.8, 'd': 2},
+                              "VarianceConvergenceStrategy", {'epsilon': 0.01}, 0.05, 0.1, seed=7,
+                              historyWindowSize=1000, T_max=50000)
+        self.assertEqual(EventSkippingEngine().run(spec)[0], spec.run()[0])
+        with self.assertRaises(Exception):
+            spec.services = [1, 2, 1]
+            EventSkippingEngine().run(spec)
+        print("TestEventSkippingEngine: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,392 @@
+import os
+import sys
+import json
+import inspect
+import hashlib
+import argparse
+import datetime
+import itertools
+import threading
+import traceback
+import unittest as ut
+from ResultLog import readResultLog
+from WorkerPool import WorkerPool
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# The fields of an experiment file. 'policies' and 'convergence' map class names (of DispatchPolicyStrategy and
+# ConvergenceConditionStrategy) to their constructor arguments; an argument given as a list is a grid axis. 'n' and
+# 'd' (network sizes and redundancies) are grid axes too. 'loads' is the load schedule of every sweep: a number of
+# equally spaced loads in [0, 1) or a list of loads (fractions of the effective service rate).
+# Instead of alpha, beta and p, a policy can take 'jobSizes': the description of a job size distribution, e.g.
+# {"kind": "pareto", "scale": 10, "shape": 1.5} (see JobSizeDistribution.getJobSizes), or {"kind": "trace", "trace":
+# prefix} to replay the sizes of a recorded trace (see TraceSource).
+EXPERIMENT_FIELDS = {'name': None,
+                     'output': None,
+                     'policies': None,
+                     'n': None,
+                     'd': None,
+                     'loads': 30,
+                     'convergence': {'VarianceConvergenceStrategy': {'epsilon': 5e-5}},
+                     'historyWindowSize': 20000,
+                     'T_min': 500000,
+                     'T_max': 1000000000,
+                     'replications': 1,
+                     'rootSeed': None,
+                     'resources': {}}
+# resources: worker processes (one per CPU by default), the wall-clock limit of a round in seconds, the retries of a
+# failed round and the number of sweeps run at once on the shared pool (0 runs all of them at once).
+RESOURCE_FIELDS = {'processes': None,
+                   'timeout': None,
+                   'maxRetries': 0,
+                   'sweeps': 0}
+# Policy arguments a redundancy is given as, and the one a network size is given as.
+REDUNDANCY_PARAMS = ('d', 'redundancy')
+SIZE_PARAM = 'n'
+MANIFEST_FILE = "experiment.json"
+
+
+##
+# Read an experiment file, JSON or (if PyYAML is installed) YAML, and fill in the defaults of missing fields.
+##
+def readExperiment(filename):
+    with open(filename, "r") as fd:
+        if filename.endswith(".yaml") or filename.endswith(".yml"):
+            if yaml is None:
+                raise Exception("Reading YAML experiment files needs PyYAML; use JSON or install it")
+            experiment = yaml.safe_load(fd)
+        else:
+            experiment = json.load(fd)
+    if experiment.get('name') is None:
+        experiment['name'] = os.path.splitext(os.path.basename(filename))[0]
+    return getExperiment(experiment)
+
+
+##
+# Check the fields of @experiment (a dictionary as in an experiment file) and fill in the defaults of missing ones.
+##
+def getExperiment(experiment):
+    unknown = set(experiment) - set(EXPERIMENT_FIELDS)
+    if unknown:
+        raise Exception("Unknown experiment fields: " + ", ".join(sorted(unknown)))
+    unknown = set(experiment.get('resources', {})) - set(RESOURCE_FIELDS)
+    if unknown:
+        raise Exception("Unknown resource fields: " + ", ".join(sorted(unknown)))
+    for field in ('policies', 'n'):
+        if not experiment.get(field):
+            raise Exception("An experiment needs '" + field + "'")
+    filled = dict(EXPERIMENT_FIELDS)
+    filled.update(experiment)
+    filled['resources'] = dict(RESOURCE_FIELDS, **experiment.get('resources', {}))
+    if filled['output'] is None:
+        filled['output'] = filled['name'] if filled['name'] is not None else "experiment"
+    return filled
+
+
+def getList(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+##
+# Expand @params, where a list value is a grid axis, into the list of all their combinations.
+##
+def expandGrid(params):
+    names = sorted(params)
+    return [dict(zip(names, values)) for values in itertools.product(*[getList(params[name]) for name in names])]
+
+
+##
+# Get the constructor arguments of policy @policyName with the grid point @params on a network of @n queues with
+# redundancy @d (None to leave the redundancy to @params). A policy that takes no redundancy argument only exists for
+# d = 1. Returns None if the policy has no such configuration.
+##
+def getPolicyParams(policyName, params, n, d):
+    import DispatchPolicyStrategy
+    if not hasattr(DispatchPolicyStrategy, policyName):
+        raise Exception("Unknown dispatch policy " + policyName)
+    arguments = inspect.signature(getattr(DispatchPolicyStrategy, policyName)).parameters
+    params = dict(params)
+    if SIZE_PARAM in arguments:
+        params[SIZE_PARAM] = n
+    if d is not None:
+        redundancy = [name for name in REDUNDANCY_PARAMS if name in arguments]
+        if redundancy:
+            params[redundancy[0]] = d
+        elif d != 1:
+            return None
+    d = max([params[name] for name in REDUNDANCY_PARAMS if name in params] + [1])
+    if d > n:
+        return None
+    # Fixed subsets partition the queues (see FixedSubsetsStrategy.getDispatch).
+    if policyName == 'FixedSubsetsStrategy' and n % d != 0:
+        return None
+    return params
+
+
+def getLoads(loads):
+    if isinstance(loads, (list, tuple)):
+        return [float(load) for load in loads]
+    return [float(i) / int(loads) for i in range(int(loads))]
+
+
+##
+# Expand @experiment into its tasks, one sweep per cell of the grid. A task is a dictionary of everything that
+# determines the results of its sweep (and nothing else, so resources can change without invalidating results).
+# Cells that describe the same sweep (e.g. a policy without a redundancy argument for several 'd') are one task.
+##
+def getTasks(experiment):
+    tasks = []
+    keys = set()
+    convergences = [(name, params) for name in sorted(experiment['convergence'])
+                    for params in expandGrid(experiment['convergence'][name])]
+    for policyName in sorted(experiment['policies']):
+        for point in expandGrid(experiment['policies'][policyName]):
+            for n in getList(experiment['n']):
+                for d in getList(experiment['d']) if experiment['d'] is not None else [None]:
+                    params = getPolicyParams(policyName, point, int(n), d)
+                    if params is None:
+                        continue
+                    for (convergenceName, convergenceParams) in convergences:
+                        task = {'size': int(n),
+                                'policyName': policyName,
+                                'policyParams': params,
+                                'convergenceName': convergenceName,
+                                'convergenceParams': convergenceParams,
+                                'loads': getLoads(experiment['loads']),
+                                'historyWindowSize': int(experiment['historyWindowSize']),
+                                'T_min': int(experiment['T_min']),
+                                'T_max': int(experiment['T_max']),
+                                'replications': int(experiment['replications']),
+                                'rootSeed': getTaskRootSeed(experiment['rootSeed'], policyName, params, int(n))}
+                        key = getTaskKey(task)
+                        if key not in keys:
+                            keys.add(key)
+                            tasks.append(task)
+    return tasks
+
+
+##
+# Get the root seed of the sweep of a policy configuration from the experiment's @rootSeed (None leaves it to the
+# sweep, which records the seed it drew in its result log). Sweeps of one configuration share their seed (common
+# random numbers across convergence settings), and adding cells to the grid does not change the seeds of others.
+##
+def getTaskRootSeed(rootSeed, policyName, params, n):
+    if rootSeed is None:
+        return None
+    description = json.dumps([int(rootSeed), policyName, params, n], sort_keys=True)
+    return int(hashlib.sha256(description.encode('utf-8')).hexdigest()[:15], 16)
+
+
+def getTaskKey(task):
+    return hashlib.sha1(json.dumps(task, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+##
+# Get the file name (without extension) of the results of @task: readable, and unique through its key.
+##
+def getTaskName(task):
+    params = task['policyParams']
+    d = max([params[name] for name in REDUNDANCY_PARAMS if name in params] + [1])
+    return task['policyName'] + "-n=" + str(task['size']) + "-d=" + str(d) + "-" + getTaskKey(task)[:10]
+
+
+##
+# Get how much of @task the result log @logFile already holds: 'done' (every point completed), 'partial' or 'new'.
+##
+def getTaskStatus(task, logFile):
+    if not os.path.exists(logFile):
+        return 'new'
+    completed = [point for point in readResultLog(logFile)[1] if point.get('status', 'ok') == 'ok']
+    if len(completed) >= len(task['loads']):
+        return 'done'
+    return 'partial' if completed else 'new'
+
+
+##
+# Build the parallel simulation of the sweep of @task.
+##
+def buildSimulation(task, verbose=False):
+    import DispatchPolicyStrategy
+    import ConvergenceConditionStrategy
+    from parSim import parSim
+    sim = parSim(task['size'], getattr(DispatchPolicyStrategy, task['policyName'])(**task['policyParams']),
+                 getattr(ConvergenceConditionStrategy, task['convergenceName'])(**task['convergenceParams']),
+                 historyWindowSize=task['historyWindowSize'], numOfRounds=len(task['loads']), verbose=verbose,
+                 T_min=task['T_min'], T_max=task['T_max'])
+    sim.setLoads(task['loads'])
+    return sim
+
+
+##
+# Run the sweep of @task on @pool, resuming from its result log in @directory if it has one.
+##
+def runTask(task, directory, pool, resources, verbose=False):
+    name = getTaskName(task)
+    sim = buildSimulation(task, verbose)
+    sim.parRun(pool=pool, timeout=resources['timeout'], maxRetries=resources['maxRetries'],
+               resumeFrom=os.path.join(directory, name + ".log"), replications=task['replications'],
+               rootSeed=task['rootSeed'], dumpFile=os.path.join(directory, name + ".dump"))
+
+
+##
+# Run @experiment (see getExperiment): expand it into tasks (see getTasks), skip those whose results already exist in
+# the output directory, resume the partial ones and run the rest. All sweeps share one pool of warm workers (@pool,
+# or one created for the experiment with the 'processes' resource), and up to the 'sweeps' resource of them run at
+# once so their rounds fill the pool together. With @force every task is rerun from scratch; with @dryRun nothing is
+# run. The output directory gets a manifest (MANIFEST_FILE) of the experiment and the files of every task.
+# Returns {task name: 'done' | 'ran' | 'failed' | 'pending'}, 'pending' for tasks a dry run would run.
+##
+def runExperiment(experiment, pool=None, force=False, dryRun=False, verbose=False):
+    experiment = getExperiment(experiment)
+    directory = experiment['output']
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tasks = getTasks(experiment)
+    status = {}
+    pending = []
+    for task in tasks:
+        name = getTaskName(task)
+        logFile = os.path.join(directory, name + ".log")
+        if force and not dryRun:
+            for extension in (".log", ".dump"):
+                if os.path.exists(os.path.join(directory, name + extension)):
+                    os.remove(os.path.join(directory, name + extension))
+        taskStatus = getTaskStatus(task, logFile)
+        if verbose:
+            print("INFO:    " + name.ljust(64) + taskStatus)
+        if taskStatus == 'done':
+            status[name] = 'done'
+        else:
+            status[name] = 'pending'
+            pending.append(task)
+    writeManifest(experiment, tasks, directory)
+    if dryRun or not pending:
+        return status
+
+    resources = experiment['resources']
+    ownPool = pool is None
+    if ownPool:
+        pool = WorkerPool(processes=resources['processes'])
+    slots = threading.Semaphore(resources['sweeps'] if resources['sweeps'] > 0 else len(pending))
+
+    def runPending(task):
+        name = getTaskName(task)
+        try:
+            runTask(task, directory, pool, resources, verbose)
+            status[name] = 'ran'
+        except Exception:
+            status[name] = 'failed'
+            print("ERROR:   Sweep [ " + name + " ] failed:\n" + traceback.format_exc())
+        finally:
+            slots.release()
+
+    threads = []
+    try:
+        for task in pending:
+            slots.acquire()
+            threads.append(threading.Thread(target=runPending, args=(task,)))
+            threads[-1].daemon = True
+            threads[-1].start()
+        for thread in threads:
+            # A timed join keeps the driver responsive to KeyboardInterrupt.
+            while thread.is_alive():
+                thread.join(1.0)
+    finally:
+        if ownPool:
+            pool.terminate()
+    return status
+
+
+##
+# Write the manifest of @experiment to @directory: the experiment with its defaults filled in and, for every task,
+# its name, key, result log and dump, so plotting and analysis can find the results of a grid cell.
+##
+def writeManifest(experiment, tasks, directory):
+    manifest = {'experiment': experiment,
+                'written': str(datetime.datetime.now()),
+                'tasks': [{'name': getTaskName(task),
+                           'key': getTaskKey(task),
+                           'task': task,
+                           'log': getTaskName(task) + ".log",
+                           'dump': getTaskName(task) + ".dump"} for task in tasks]}
+    with open(os.path.join(directory, MANIFEST_FILE), "w") as fd:
+        json.dump(manifest, fd, indent=1, sort_keys=True)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestExperiment(ut.TestCase):
+    def runTest(self):
+        import tempfile
+        directory = tempfile.mkdtemp()
+        experiment = {'name': 'test',
+                      'output': os.path.join(directory, "results"),
+                      'policies': {'RandomQueueStrategy': {'alpha': 10, 'beta': 100, 'p': 0.8},
+                                   'RandomDStrategy': {'alpha': 10, 'beta': 100, 'p': 0.8, 'bias': [0.0, 0.5]},
+                                   'FixedSubsetsStrategy': {'alpha': 10, 'beta': 100, 'p': 0.8}},
+                      'n': [3],
+                      'd': [1, 2],
+                      'loads': [0.2, 0.6],
+                      'convergence': {'RunForXSlotsConvergenceStrategy': {'x': 2000}},
+                      'historyWindowSize': 500,
+                      'T_min': 0,
+                      'T_max': 2000,
+                      'rootSeed': 11,
+                      'resources': {'processes': 2}}
+        with open(os.path.join(directory, "test.json"), "w") as fd:
+            json.dump(experiment, fd)
+        self.assertEqual(readExperiment(os.path.join(directory, "test.json"))['replications'], 1)
+        with self.assertRaises(Exception):
+            getExperiment(dict(experiment, rounds=30))
+        # RandomQueue has no redundancy (d = 1 only), RandomD every (d, bias) and fixed subsets of 2 do not divide 3.
+        tasks = getTasks(getExperiment(experiment))
+        self.assertEqual(sorted((task['policyName'], task['policyParams'].get('d', 1)) for task in tasks),
+                         [('FixedSubsetsStrategy', 1)] + [('RandomDStrategy', 1)] * 2 + [('RandomDStrategy', 2)] * 2 +
+                         [('RandomQueueStrategy', 1)])
+        self.assertEqual(len(set(getTaskName(task) for task in tasks)), len(tasks))
+        # A duplicate axis value describes the same sweeps.
+        self.assertEqual(len(getTasks(getExperiment(dict(experiment, d=[1, 2, 1])))), len(tasks))
+        self.assertTrue(all(value == 'pending' for value in runExperiment(experiment, dryRun=True).values()))
+        status = runExperiment(experiment)
+        self.assertEqual(sorted(status.values()), ['ran'] * len(tasks))
+        for task in tasks:
+            header, points = readResultLog(os.path.join(experiment['output'], getTaskName(task) + ".log"))
+            self.assertEqual(header['root seed'], task['rootSeed'])
+            sim = buildSimulation(task)
+            self.assertEqual([point['arrivalRate'] for point in points],
+                             list(sim.getArrivalRates(sim.getEffectiveServiceRate())))
+        # Results that exist are not simulated again, and more cells only add tasks.
+        self.assertEqual(sorted(runExperiment(experiment).values()), ['done'] * len(tasks))
+        experiment['n'] = [3, 4]
+        status = runExperiment(experiment)
+        self.assertEqual(sorted(status.values()).count('done'), len(tasks))
+        self.assertEqual(len(status), len(getTasks(getExperiment(experiment))))
+        with open(os.path.join(experiment['output'], MANIFEST_FILE), "r") as fd:
+            self.assertEqual(len(json.load(fd)['tasks']), len(status))
+        print("TestExperiment: OK.")
+
+
+if __name__ == '__main__':
+    # Run an experiment file: python Experiment.py <experiment.json|yaml> [--dry-run] [--force] [--processes N]
+    if len(sys.argv) == 1:
+        ut.main()
+    parser = argparse.ArgumentParser(description="Run the grid of sweeps described by an experiment file.")
+    parser.add_argument('experiment', help="JSON (or YAML) experiment file")
+    parser.add_argument('--output', help="results directory (default: the experiment's 'output')")
+    parser.add_argument('--processes', type=int, help="worker processes (default: the experiment's resources)")
+    parser.add_argument('--dry-run', action='store_true', help="only list the tasks and whether they would run")
+    parser.add_argument('--force', action='store_true', help="rerun tasks whose results already exist")
+    args = parser.parse_args()
+    definition = readExperiment(args.experiment)
+    if args.output is not None:
+        definition['output'] = args.output
+    if args.processes is not None:
+        definition['resources']['processes'] = args.processes
+    results = runExperiment(definition, force=args.force, dryRun=args.dry_run, verbose=True)
+    print("INFO:    " + ", ".join(str(list(results.values()).count(value)) + " " + value
+                                  for value in ('done', 'ran', 'failed', 'pending') if value in results.values()))
+    sys.exit(1 if 'failed' in results.values() else 0)
@@ -0,0 +1,388 @@
+import abc  # Python's built-in abstract class library
+import math
+import numpy as np
+import unittest as ut
+from TraceSource import openTrace
+
+
+########################################################################################################################
+#   INTERFACE
+########################################################################################################################
+class JobSizeDistributionAbstract(metaclass=abc.ABCMeta):
+    """An abstract class from which all job size distributions need to inherit. Job sizes are whole numbers of slots
+    of work. A distribution is described by its KIND and constructor params (see getDescription and getJobSizes), so
+    it can be given to a policy in an experiment file."""
+
+    # The name of the distribution in descriptions.
+    KIND = None
+
+    ##
+    # Draw a job size from @generator (a numpy.random.Generator), or an array of @size job sizes.
+    ##
+    @abc.abstractmethod
+    def sample(self, generator, size=None):
+        """Required Method"""
+
+    ##
+    # Get the mean job size.
+    ##
+    @abc.abstractmethod
+    def getMean(self):
+        """Required Method"""
+
+    ##
+    # Get the mean squared job size.
+    ##
+    @abc.abstractmethod
+    def getSecondMoment(self):
+        """Required Method"""
+
+    ##
+    # Get the mean of the smallest of @d independent job sizes (the work a job leaves when it is sent to d idle
+    # queues and the first copy to finish cancels the others).
+    ##
+    @abc.abstractmethod
+    def getMinMean(self, d):
+        """Required Method"""
+
+    ##
+    # Get the constructor arguments of the distribution.
+    ##
+    @abc.abstractmethod
+    def getParams(self):
+        """Required Method"""
+
+    ##
+    # Start the job sizes over. Only distributions that replay a sequence (see TraceJobSizes) have anything to do.
+    ##
+    def reset(self):
+        pass
+
+    def getVariance(self):
+        return self.getSecondMoment() - self.getMean() ** 2
+
+    def getDescription(self):
+        return dict(self.getParams(), kind=self.KIND)
+
+    ##
+    # Get distribution params string for logging.
+    ##
+    def getParamStr(self):
+        params = self.getParams()
+        return self.KIND + "(" + ", ".join(name + " = " + str(params[name]) for name in sorted(params)) + ")"
+
+
+########################################################################################################################
+#   IMPLEMENTATIONS
+########################################################################################################################
+class DiscreteJobSizes(JobSizeDistributionAbstract):
+    """Job sizes @values drawn with @probabilities, sampled with the alias method: after an O(k) setup (Vose), a draw
+    takes one uniform number, whatever the number k of values."""
+
+    KIND = 'discrete'
+
+    def __init__(self, values, probabilities):
+        values = list(values)
+        probabilities = np.asarray(probabilities, dtype=float)
+        if len(values) < 1 or len(values) != len(probabilities):
+            raise Exception("Illegal number of values or probabilities for DiscreteJobSizes")
+        if np.any(probabilities < 0) or abs(probabilities.sum() - 1.0) > 1e-9 or min(values) < 0:
+            raise Exception("Illegal values or probabilities for DiscreteJobSizes")
+        self.values = values
+        self.probabilities = probabilities / probabilities.sum()
+        self.table = np.asarray(values)
+        self.buildAliasTables()
+
+    ##
+    # Build the alias tables: value i is kept if the fraction of the uniform number is below threshold[i], and
+    # replaced by value alias[i] otherwise.
+    ##
+    def buildAliasTables(self):
+        k = len(self.values)
+        scaled = list(self.probabilities * k)
+        self.threshold = [1.0] * k
+        self.alias = list(range(k))
+        small = [i for i in range(k) if scaled[i] < 1.0]
+        large = [i for i in range(k) if scaled[i] >= 1.0]
+        while small and large:
+            (i, j) = (small.pop(), large.pop())
+            self.threshold[i] = scaled[i]
+            self.alias[i] = j
+            scaled[j] -= 1.0 - scaled[i]
+            (small if scaled[j] < 1.0 else large).append(j)
+        self.thresholdTable = np.asarray(self.threshold)
+        self.aliasTable = np.asarray(self.alias)
+
+    def sample(self, generator, size=None):
+        k = len(self.values)
+        if size is None:
+            scaled = generator.random() * k
+            i = min(int(scaled), k - 1)
+            return self.values[i if scaled - i < self.threshold[i] else self.alias[i]]
+        scaled = generator.random(size) * k
+        i = np.minimum(scaled.astype(np.int64), k - 1)
+        return self.table[np.where(scaled - i < self.thresholdTable[i], i, self.aliasTable[i])]
+
+    def getValues(self):
+        return list(self.values)
+
+    def getProbabilities(self):
+        return self.probabilities.tolist()
+
+    def getMean(self):
+        return float(np.dot(self.probabilities, np.asarray(self.values, dtype=float)))
+
+    def getSecondMoment(self):
+        return float(np.dot(self.probabilities, np.asarray(self.values, dtype=float) ** 2))
+
+    ##
+    # With values v_1 < ... < v_m and tails T_j = P(S >= v_j): E[min] = sum_j v_j (T_j^d - T_{j+1}^d).
+    ##
+    def getMinMean(self, d):
+        order = np.argsort(self.values, kind='stable')
+        values = np.asarray(self.values, dtype=float)[order]
+        tails = np.append(np.cumsum(self.probabilities[order][::-1])[::-1], 0.0)
+        return float(np.sum(values * (tails[:-1] ** d - tails[1:] ** d)))
+
+    def getParams(self):
+        return {'values': self.getValues(), 'probabilities': self.getProbabilities()}
+
+
+class BimodalJobSizes(DiscreteJobSizes):
+    """Job sizes of @alpha with probability @p and @beta otherwise (the sizes of the original policies)."""
+
+    KIND = 'bimodal'
+
+    def __init__(self, alpha, beta, p):
+        if p < 0 or p > 1:
+            raise Exception("Invalid probability given")
+        DiscreteJobSizes.__init__(self, [alpha, beta], [p, 1.0 - p])
+        self.alpha = alpha
+        self.beta = beta
+        self.p = p
+
+    def sample(self, generator, size=None):
+        if size is None:
+            return self.alpha if generator.random() < self.p else self.beta
+        return np.where(generator.random(size) < self.p, self.alpha, self.beta)
+
+    def getParams(self):
+        return {'alpha': self.alpha, 'beta': self.beta, 'p': self.p}
+
+    def getParamStr(self):
+        return "p = " + str(self.p) + ", alpha = " + str(self.alpha) + ", beta = " + str(self.beta)
+
+
+class EmpiricalJobSizes(DiscreteJobSizes):
+    """Job sizes drawn from observed @sizes (e.g. of a trace), each with its frequency among them."""
+
+    KIND = 'empirical'
+
+    def __init__(self, sizes):
+        if len(sizes) < 1:
+            raise Exception("No sizes given to EmpiricalJobSizes")
+        self.sizes = [int(size) for size in sizes]
+        (values, counts) = np.unique(self.sizes, return_counts=True)
+        DiscreteJobSizes.__init__(self, values.tolist(), counts / float(counts.sum()))
+
+    def getParams(self):
+        return {'sizes': list(self.sizes)}
+
+
+class ShiftedGeometricJobSizes(JobSizeDistributionAbstract):
+    """Job sizes of @alpha plus a geometric number of slots (on 1, 2, ... with success probability @p)."""
+
+    KIND = 'shiftedGeometric'
+
+    def __init__(self, alpha, p):
+        if p <= 0 or p > 1:
+            raise Exception("Invalid probability given")
+        self.alpha = int(alpha)
+        self.p = float(p)
+
+    def sample(self, generator, size=None):
+        if size is None:
+            return self.alpha + int(generator.geometric(self.p))
+        return self.alpha + generator.geometric(self.p, size)
+
+    def getMean(self):
+        return self.alpha + 1.0 / self.p
+
+    def getSecondMoment(self):
+        return self.alpha ** 2 + 2.0 * self.alpha / self.p + (2.0 - self.p) / self.p ** 2
+
+    ##
+    # The smallest of d geometric numbers is geometric with success probability 1 - (1 - p)^d.
+    ##
+    def getMinMean(self, d):
+        return self.alpha + 1.0 / (1.0 - (1.0 - self.p) ** d)
+
+    def getParams(self):
+        return {'alpha': self.alpha, 'p': self.p}
+
+    def getParamStr(self):
+        return "p = " + str(self.p) + ", alpha = " + str(self.alpha)
+
+
+##
+# The Hurwitz zeta function sum_{k >= q} k^-s for s > 1 and a whole q >= 1: the first terms, then the Euler-Maclaurin
+# expansion of the rest.
+##
+def hurwitzZeta(s, q):
+    terms = 16
+    head = sum((q + k) ** -s for k in range(terms))
+    m = float(q + terms)
+    tail = m ** (1 - s) / (s - 1) + m ** -s / 2.0 + s * m ** (-s - 1) / 12.0 - \
+        s * (s + 1) * (s + 2) * m ** (-s - 3) / 720.0 + \
+        s * (s + 1) * (s + 2) * (s + 3) * (s + 4) * m ** (-s - 5) / 30240.0
+    return head + tail
+
+
+class ParetoJobSizes(JobSizeDistributionAbstract):
+    """Heavy-tailed job sizes: a Pareto number with minimum @scale and tail index @shape (> 1, for a finite mean),
+    rounded up to a whole number of slots. Sampled by inversion."""
+
+    KIND = 'pareto'
+
+    def __init__(self, scale, shape):
+        if scale <= 0 or shape <= 1:
+            raise Exception("Illegal scale or shape for ParetoJobSizes, must be [ scale > 0, shape > 1 ]")
+        self.scale = float(scale)
+        self.shape = float(shape)
+        # The smallest k with P(S > k) < 1.
+        self.first = int(math.ceil(self.scale))
+
+    def sample(self, generator, size=None):
+        if size is None:
+            return int(math.ceil(self.scale * (1.0 - generator.random()) ** (-1.0 / self.shape)))
+        return np.ceil(self.scale * (1.0 - generator.random(size)) ** (-1.0 / self.shape)).astype(np.int64)
+
+    ##
+    # The sum over k >= 0 of P(S > k)^d: 1 below the scale, (scale / k)^(shape d) from there.
+    ##
+    def getMinMean(self, d):
+        return self.first + self.scale ** (self.shape * d) * hurwitzZeta(self.shape * d, self.first)
+
+    def getMean(self):
+        return self.getMinMean(1)
+
+    ##
+    # E[S^2] is the sum over k >= 0 of (2k + 1) P(S > k).
+    ##
+    def getSecondMoment(self):
+        if self.shape <= 2:
+            return float('inf')
+        return self.first ** 2 + self.scale ** self.shape * (2.0 * hurwitzZeta(self.shape - 1, self.first) +
+                                                             hurwitzZeta(self.shape, self.first))
+
+    def getParams(self):
+        return {'scale': self.scale, 'shape': self.shape}
+
+
+class TraceJobSizes(JobSizeDistributionAbstract):
+    """Job sizes replayed in order from the recorded trace @trace (its prefix, see TraceSource), wrapping around at
+    its end. Sizes are read from the memory-mapped trace in the chunks asked for, and the generator is not used. The
+    moments are the trace's; the min mean is that of its histogram of sizes, read once when first asked for."""
+
+    KIND = 'trace'
+
+    def __init__(self, trace):
+        self.trace = openTrace(trace)
+        if self.trace.getJobs() < 1:
+            raise Exception("Trace " + str(trace) + " has no job sizes")
+        self.position = 0
+        self.histogram = None
+
+    def reset(self):
+        self.position = 0
+
+    def sample(self, generator, size=None):
+        sizes = self.trace.getSizes(self.position, 1 if size is None else size)
+        self.position = (self.position + len(sizes)) % self.trace.getJobs()
+        return int(sizes[0]) if size is None else sizes
+
+    def getMean(self):
+        return self.trace.getMeanSize()
+
+    def getSecondMoment(self):
+        return self.trace.getSecondMoment()
+
+    def getMinMean(self, d):
+        if self.histogram is None:
+            self.histogram = DiscreteJobSizes(*self.trace.getSizeHistogram())
+        return self.histogram.getMinMean(d)
+
+    def getParams(self):
+        return {'trace': self.trace.getPrefix()}
+
+
+JOB_SIZE_DISTRIBUTIONS = dict((cls.KIND, cls) for cls in [DiscreteJobSizes, BimodalJobSizes, EmpiricalJobSizes,
+                                                         ShiftedGeometricJobSizes, ParetoJobSizes, TraceJobSizes])
+
+
+##
+# Get a job size distribution from @jobSizes: a distribution, or its description (a dictionary of its 'kind' and
+# constructor params, see getDescription), e.g. {'kind': 'pareto', 'scale': 10, 'shape': 1.5}.
+##
+def getJobSizes(jobSizes):
+    if isinstance(jobSizes, JobSizeDistributionAbstract):
+        return jobSizes
+    params = dict(jobSizes)
+    kind = params.pop('kind', None)
+    if kind not in JOB_SIZE_DISTRIBUTIONS:
+        raise Exception("Unknown job size distribution " + str(kind))
+    return JOB_SIZE_DISTRIBUTIONS[kind](**params)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestJobSizeDistribution(ut.TestCase):
+    def runTest(self):
+        from RandomStreams import getGenerator
+        distributions = [BimodalJobSizes(10, 100, 0.8),
+                         DiscreteJobSizes([1, 5, 20, 3], [0.1, 0.2, 0.3, 0.4]),
+                         EmpiricalJobSizes([3, 1, 3, 7, 3, 1]),
+                         ShiftedGeometricJobSizes(10, 0.05),
+                         ParetoJobSizes(2, 3.5)]
+        generator = getGenerator(1)
+        for distribution in distributions:
+            samples = distribution.sample(generator, 200000)
+            self.assertTrue(np.issubdtype(samples.dtype, np.integer))
+            self.assertIsInstance(distribution.sample(generator), (int, np.integer))
+            self.assertAlmostEqual(np.mean(samples) / distribution.getMean(), 1.0, delta=0.02)
+            self.assertAlmostEqual(np.mean(samples.astype(float) ** 2) / distribution.getSecondMoment(), 1.0,
+                                   delta=0.05)
+            minimums = np.min(distribution.sample(generator, (50000, 3)), axis=1)
+            self.assertAlmostEqual(np.mean(minimums) / distribution.getMinMean(3), 1.0, delta=0.02)
+            self.assertAlmostEqual(distribution.getMinMean(1), distribution.getMean())
+            self.assertEqual(getJobSizes(distribution.getDescription()).getDescription(), distribution.getDescription())
+        # The alias tables give the exact probabilities.
+        counts = np.bincount(distributions[1].sample(generator, 400000), minlength=21)[[1, 5, 20, 3]]
+        self.assertLess(np.max(np.abs(counts / 400000.0 - [0.1, 0.2, 0.3, 0.4])), 0.005)
+        self.assertEqual(distributions[2].getValues(), [1, 3, 7])
+        self.assertAlmostEqual(hurwitzZeta(3.0, 1), 1.2020569031595942, places=12)
+        self.assertEqual(ParetoJobSizes(2, 1.5).getSecondMoment(), float('inf'))
+        self.assertEqual(distributions[0].getParamStr(), "p = 0.8, alpha = 10, beta = 100")
+        with self.assertRaises(Exception):
+            getJobSizes({'kind': 'uniform'})
+        with self.assertRaises(Exception):
+            ParetoJobSizes(2, 1.0)
+        # A trace replays its sizes in order.
+        import os
+        import tempfile
+        from TraceSource import writeTrace
+        prefix = os.path.join(tempfile.mkdtemp(), "trace")
+        writeTrace(prefix, [1, 0, 1], [4, 1, 9, 1])
+        trace = getJobSizes({'kind': 'trace', 'trace': prefix})
+        self.assertEqual(trace.sample(generator, 3).tolist(), [4, 1, 9])
+        self.assertEqual([trace.sample(generator), trace.sample(generator)], [1, 4])
+        trace.reset()
+        self.assertEqual(trace.sample(generator), 4)
+        self.assertEqual((trace.getMean(), trace.getSecondMoment()), (3.75, 24.75))
+        self.assertAlmostEqual(trace.getMinMean(2), DiscreteJobSizes([1, 4, 9], [0.5, 0.25, 0.25]).getMinMean(2))
+        print("TestJobSizeDistribution: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
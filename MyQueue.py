@@ -116,7 +116,7 @@ class TestQueue(ut.TestCase):
         q.reset()
         self.assertEqual(q.getService(), 1)
         self.assertEqual(q.getWorkload(), 0)
-        print "TestQueue: OK."
+        print("TestQueue: OK.")
 
 
 if __name__ == '__main__':
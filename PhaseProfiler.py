@@ -0,0 +1,177 @@
+import numpy as np
+import unittest as ut
+from timeit import default_timer as timer
+
+# Phases of a time slot, in loop order (see QueueNetworkSimulation.runPoint).
+PHASES = ['drawArrival', 'getDispatch', 'addWorkload', 'endTimeSlot', 'calcAvgWorkLoad', 'insertToWindow',
+          'convergenceCheck', 'advanceTimeSlot']
+
+
+class PhaseProfiler:
+    """Attributes the time of a round to the phases of the slot loop.
+    A simulation with a profiler runs its loop through timed wrappers of the phase functions (see wrap); without one
+    the loop calls the functions directly, so a disabled profiler costs nothing. The fixed cost of a timed call is
+    measured once and subtracted, so cheap phases are not inflated by the timing itself."""
+
+    def __init__(self):
+        self.calls = dict((phase, 0) for phase in PHASES)
+        self.seconds = dict((phase, 0.0) for phase in PHASES)
+        self.overhead = 0.0
+        self.overhead = self.calibrate()
+
+    ##
+    # Measure the cost of a timed call of a function that does nothing.
+    ##
+    def calibrate(self, samples=20000):
+        wrapped = self.wrap('calibration', lambda: None)
+        start = timer()
+        for i in range(samples):
+            wrapped()
+        overhead = (timer() - start) / samples
+        del self.calls['calibration'], self.seconds['calibration']
+        return overhead
+
+    def reset(self):
+        for phase in self.calls:
+            self.calls[phase] = 0
+            self.seconds[phase] = 0.0
+
+    ##
+    # Get a wrapper of @func that counts its calls and time under @phase.
+    ##
+    def wrap(self, phase, func):
+        calls = self.calls
+        seconds = self.seconds
+        calls.setdefault(phase, 0)
+        seconds.setdefault(phase, 0.0)
+
+        def timed(*args):
+            start = timer()
+            result = func(*args)
+            seconds[phase] += timer() - start
+            calls[phase] += 1
+            return result
+        return timed
+
+    ##
+    # Get {phase: {'calls', 'seconds', 'share'}} where share is the fraction of @wallTime spent in the phase. The
+    # time that no phase accounts for (loop bookkeeping, hooks, recording) is reported as 'other'.
+    ##
+    def getSummary(self, wallTime):
+        summary = {}
+        for phase in self.calls:
+            seconds = max(self.seconds[phase] - self.calls[phase] * self.overhead, 0.0)
+            summary[phase] = {'calls': self.calls[phase], 'seconds': seconds}
+        other = max(wallTime - sum(phase['seconds'] for phase in summary.values()), 0.0)
+        summary['other'] = {'calls': 0, 'seconds': other}
+        for phase in summary.values():
+            phase['share'] = phase['seconds'] / wallTime if wallTime > 0 else 0.0
+        return summary
+
+
+##
+# Merge the phase summaries of several rounds (e.g. the replications of a point).
+##
+def mergePhases(summaries):
+    merged = {}
+    for summary in summaries:
+        for phase, values in summary.items():
+            total = merged.setdefault(phase, {'calls': 0, 'seconds': 0.0})
+            total['calls'] += values['calls']
+            total['seconds'] += values['seconds']
+    wallTime = sum(values['seconds'] for values in merged.values())
+    for values in merged.values():
+        values['share'] = values['seconds'] / wallTime if wallTime > 0 else 0.0
+    return merged
+
+
+##
+# Flat diagnostics fields of the phases, for the numeric columns of a SharedSweepBlock.
+##
+def getPhaseFields():
+    return ['phase.' + phase + '.' + field for phase in PHASES + ['other'] for field in ('calls', 'seconds')]
+
+
+def flattenPhases(summary):
+    return dict(('phase.' + phase + '.' + field, summary[phase][field])
+                for phase in summary for field in ('calls', 'seconds'))
+
+
+##
+# Rebuild a phase summary from flat diagnostics fields (see flattenPhases). The fields are removed from
+# @diagnostics.
+##
+def unflattenPhases(diagnostics):
+    summary = {}
+    for field in list(diagnostics):
+        if field.startswith('phase.'):
+            (phase, name) = field[len('phase.'):].rsplit('.', 1)
+            summary.setdefault(phase, {})[name] = diagnostics.pop(field)
+    for values in summary.values():
+        values['calls'] = int(values['calls'])
+    return mergePhases([summary])
+
+
+##
+# Format a phase summary as a single line, phases by decreasing time.
+##
+def formatPhases(summary):
+    entries = []
+    for phase in sorted(summary, key=lambda phase: -summary[phase]['seconds']):
+        values = summary[phase]
+        entry = phase + " " + "%.1f%%" % (100.0 * values['share'])
+        if values['calls'] > 0:
+            entry += " (" + "%.3g" % (1e6 * values['seconds'] / values['calls']) + " us x " + str(values['calls']) + ")"
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestPhaseProfiler(ut.TestCase):
+    def runTest(self):
+        import time
+        profiler = PhaseProfiler()
+        self.assertGreater(profiler.overhead, 0.0)
+        sleep = profiler.wrap('getDispatch', time.sleep)
+        from RandomStreams import getGenerator
+        from QueueNetworkSimulation import drawArrivals
+        generator = getGenerator(0)
+        draw = profiler.wrap('drawArrival', drawArrivals)
+        start = timer()
+        for i in range(5):
+            sleep(0.01)
+            self.assertEqual(len(draw(generator, 10, 0.5)), 10)
+        summary = profiler.getSummary(timer() - start)
+        self.assertEqual(summary['getDispatch']['calls'], 5)
+        self.assertEqual(summary['drawArrival']['calls'], 5)
+        self.assertEqual(summary['addWorkload']['calls'], 0)
+        self.assertGreater(summary['getDispatch']['share'], 0.9)
+        self.assertAlmostEqual(sum(phase['share'] for phase in summary.values()), 1.0)
+        # Round trip through flat (shared block) fields.
+        flat = flattenPhases(summary)
+        self.assertTrue(set(flat) <= set(getPhaseFields()))
+        self.assertEqual(unflattenPhases(dict(flat))['getDispatch']['calls'], 5)
+        merged = mergePhases([summary, summary])
+        self.assertEqual(merged['getDispatch']['calls'], 10)
+        self.assertTrue(formatPhases(summary).startswith("getDispatch"))
+        profiler.reset()
+        self.assertEqual(profiler.getSummary(1.0)['getDispatch']['calls'], 0)
+        # A profiled round counts every slot of the loop.
+        from SimulationSpec import SimulationSpec
+        spec = SimulationSpec(3, "RandomQueueStrategy", {'alpha': 10, 'beta': 100, 'p': 0.8},
+                              "RunForXSlotsConvergenceStrategy", {'x': 3000}, 0.05, 0.1, seed=5,
+                              historyWindowSize=1000, profilePhases=True)
+        estimate, diagnostics = spec.run()
+        phases = diagnostics['phases']
+        self.assertEqual(phases['endTimeSlot']['calls'], diagnostics['slots'])
+        self.assertEqual(phases['getDispatch']['calls'], phases['addWorkload']['calls'])
+        self.assertEqual(phases['convergenceCheck']['calls'], 2)
+        spec.profilePhases = False
+        self.assertEqual(spec.run()[0], estimate)
+        print("TestPhaseProfiler: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
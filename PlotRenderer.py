@@ -0,0 +1,238 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import traceback
+import multiprocessing
+import numpy as np
+import unittest as ut
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from ResultLog import readDump, readResultLog
+
+# Bump to redraw every cached figure after a change to the drawing code.
+RENDERER_VERSION = 1
+CACHE_FILE = ".plotcache.json"
+
+
+##
+# Load the data of a stored result: a legacy dump (.dump) or a result log (any other file). Returns a dictionary of
+# 'arrivalRates', 'estimates', 'info' (metadata) and, for result logs, the 'diagnostics' of every point.
+##
+def loadResults(filename):
+    if filename.endswith(".dump"):
+        (arrivalRates, estimates, info) = readDump(filename)
+        return {'arrivalRates': arrivalRates, 'estimates': estimates, 'info': info, 'diagnostics': None}
+    (header, points) = readResultLog(filename)
+    return {'arrivalRates': [point['arrivalRate'] for point in points],
+            'estimates': [point['estimate'] if point['estimate'] is not None else float('nan') for point in points],
+            'info': header if header is not None else {},
+            'diagnostics': [point['diagnostics'] for point in points]}
+
+
+##
+# Draw average workload curves (one per result) on @axes, with a dashed line at the capacity @effectiveMu labelled
+# @muLabel (the plots of PLOTd1vsd2 and PLOTd1vsd2vsRIQ).
+##
+def drawWorkloadCurves(axes, xx, yy, labels=None, effectiveMu=None, muLabel=r'$d=1$'):
+    axes.set_xlabel(r'$\lambda$')
+    axes.set_ylabel(r'Average Workload')
+    if effectiveMu is not None:
+        axes.axvline(effectiveMu, linestyle="--")
+        axes.text(effectiveMu + (xx[0][1] - xx[0][0]) / 5.0, np.nanmax([np.nanmax(y) for y in yy]) / 2.0,
+                  s=muLabel, fontsize="x-large", verticalalignment='center', rotation=90)
+    for i, (x, y) in enumerate(zip(xx, yy)):
+        axes.plot(x, y, label=labels[i] if labels else r'$d=%d$' % (i + 1), linewidth=2)
+    axes.legend(loc="best", fontsize="x-large")
+
+
+def renderWorkload(figure, results, params):
+    drawWorkloadCurves(figure.add_subplot(111), [result['arrivalRates'] for result in results],
+                       [result['estimates'] for result in results], params.get('labels'), params.get('effectiveMu'),
+                       params.get('muLabel', r'$d=1$'))
+
+
+##
+# Plot a per-round diagnostic (e.g. 'wallTime' or 'slots') of result logs against the load (the plot of
+# QueueNetworkSimulation.run).
+##
+def renderDiagnostic(figure, results, params):
+    field = params.get('field', 'wallTime')
+    axes = figure.add_subplot(111)
+    for i, result in enumerate(results):
+        if result['diagnostics'] is None:
+            raise Exception("Diagnostics are only stored in result logs, not in dumps")
+        loads = [100.0 * diagnostics.get('load', 0.0) for diagnostics in result['diagnostics']]
+        values = [diagnostics.get(field, float('nan')) for diagnostics in result['diagnostics']]
+        axes.plot(loads, values, 'x', label=params['labels'][i] if params.get('labels') else None)
+    axes.set_xlabel("arrival rate as % of service effective rate")
+    defaultLabels = {'wallTime': "simulation time [sec]", 'slots': "time slots"}
+    axes.set_ylabel(params.get('ylabel', defaultLabels.get(field, field)))
+    if params.get('logy'):
+        axes.set_yscale('log')
+    if params.get('labels'):
+        axes.legend(loc="best")
+
+
+# Figure kinds: each draws a figure from the loaded results of its inputs and its params.
+RENDERERS = {'workload': renderWorkload,
+             'diagnostic': renderDiagnostic}
+
+
+##
+# Render the figure of @job (see renderJobs) to its output file, on the Agg canvas (no display needed). The format
+# follows the output's extension (png, pdf, svg...).
+##
+def renderFigure(job):
+    params = job.get('params', {})
+    figure = Figure(figsize=params.get('size', (8, 6)))
+    FigureCanvasAgg(figure)
+    RENDERERS[job['kind']](figure, [loadResults(filename) for filename in job['inputs']], params)
+    if params.get('title'):
+        figure.suptitle(params['title'])
+    directory = os.path.dirname(job['output'])
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    figure.savefig(job['output'], dpi=params.get('dpi', 100))
+
+
+##
+# Worker entry point: render a job, reporting a failure instead of raising.
+##
+def renderJob(job):
+    try:
+        renderFigure(job)
+    except Exception:
+        return job['output'], traceback.format_exc()
+    return job['output'], None
+
+
+##
+# Get the hash of everything a figure depends on: its kind, params, the renderer version and the contents of its
+# inputs.
+##
+def getJobHash(job):
+    description = {'kind': job['kind'], 'params': job.get('params', {}), 'version': RENDERER_VERSION, 'inputs': []}
+    for filename in job['inputs']:
+        with open(filename, "rb") as fd:
+            description['inputs'].append(hashlib.sha1(fd.read()).hexdigest())
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def getCachePath(output):
+    return os.path.join(os.path.dirname(os.path.abspath(output)), CACHE_FILE)
+
+
+def readCache(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as fd:
+            return json.load(fd)
+    except ValueError:
+        return {}
+
+
+##
+# Render @jobs in @processes worker processes (one per CPU by default). A job is a dictionary of 'output' (the figure
+# file), 'kind' (see RENDERERS), 'inputs' (result files) and optional 'params'. A figure whose output exists and
+# whose inputs and params did not change since it was drawn is not redrawn, unless @force. Each output directory
+# keeps the hashes of its figures in a cache file. Returns {output: 'rendered' | 'cached' | 'failed'}.
+##
+def renderJobs(jobs, processes=None, force=False, verbose=False):
+    hashes = dict((job['output'], getJobHash(job)) for job in jobs)
+    caches = dict((path, readCache(path)) for path in set(getCachePath(job['output']) for job in jobs))
+    status = {}
+    pending = []
+    for job in jobs:
+        cached = caches[getCachePath(job['output'])].get(os.path.basename(job['output']))
+        if not force and cached == hashes[job['output']] and os.path.exists(job['output']):
+            status[job['output']] = 'cached'
+        else:
+            pending.append(job)
+    if processes == 1 or len(pending) <= 1:
+        rendered = [renderJob(job) for job in pending]
+    else:
+        pool = multiprocessing.Pool(processes=min(processes or multiprocessing.cpu_count(), len(pending)))
+        try:
+            rendered = list(pool.imap_unordered(renderJob, pending))
+        finally:
+            pool.close()
+            pool.join()
+    for output, error in rendered:
+        cache = caches[getCachePath(output)]
+        if error is None:
+            status[output] = 'rendered'
+            cache[os.path.basename(output)] = hashes[output]
+        else:
+            status[output] = 'failed'
+            cache.pop(os.path.basename(output), None)
+            if verbose:
+                print("WARN:    Rendering [ " + output + " ] failed:\n" + error)
+    for path, cache in caches.items():
+        with open(path, "w") as fd:
+            json.dump(cache, fd, indent=1, sort_keys=True)
+    if verbose:
+        for output in sorted(status):
+            print("INFO:    " + output.ljust(72) + status[output])
+    return status
+
+
+def readJobs(filename):
+    with open(filename, "r") as fd:
+        return json.load(fd)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestPlotRenderer(ut.TestCase):
+    def runTest(self):
+        import tempfile
+        from ResultLog import ResultLog, writeDump
+        directory = tempfile.mkdtemp()
+        dumps = []
+        for d in [1, 2]:
+            dumps.append(os.path.join(directory, "d=" + str(d) + ".dump"))
+            writeDump(dumps[-1], [0.0, 0.1, 0.2], [0.0, 5.0 / d, 20.0 / d], [("redundancy", d)])
+        logFile = os.path.join(directory, "sweep.log")
+        log = ResultLog(logFile, header={'number of servers': 3})
+        for i, load in enumerate([0.1, 0.5, 0.9]):
+            log.append(i, load / 10.0, 1.0 + i, {'load': load, 'wallTime': 0.5 * (i + 1), 'slots': 1000 * (i + 1)})
+        log.close()
+        output = os.path.join(directory, "figures")
+        jobs = [{'output': os.path.join(output, "workload.png"), 'kind': 'workload', 'inputs': dumps,
+                 'params': {'effectiveMu': 0.25, 'labels': [r'$d=1$', r'$RIQ$']}},
+                {'output': os.path.join(output, "workload.pdf"), 'kind': 'workload', 'inputs': dumps + [logFile]},
+                {'output': os.path.join(output, "wallTime.png"), 'kind': 'diagnostic', 'inputs': [logFile]},
+                {'output': os.path.join(output, "broken.png"), 'kind': 'diagnostic', 'inputs': dumps}]
+        status = renderJobs(jobs, processes=2)
+        self.assertEqual([status[job['output']] for job in jobs], ['rendered', 'rendered', 'rendered', 'failed'])
+        with open(jobs[0]['output'], "rb") as fd:
+            self.assertEqual(fd.read(8), b'\x89PNG\r\n\x1a\n')
+        with open(jobs[1]['output'], "rb") as fd:
+            self.assertEqual(fd.read(4), b'%PDF')
+        # Nothing changed: nothing is redrawn.
+        modified = os.path.getmtime(jobs[0]['output'])
+        self.assertEqual(renderJobs(jobs[:3]), dict((job['output'], 'cached') for job in jobs[:3]))
+        self.assertEqual(os.path.getmtime(jobs[0]['output']), modified)
+        # Only the figures of a changed input are redrawn.
+        writeDump(dumps[1], [0.0, 0.1, 0.2], [0.0, 3.0, 9.0], [("redundancy", 2)])
+        status = renderJobs(jobs[:3], processes=1)
+        self.assertEqual([status[job['output']] for job in jobs[:3]], ['rendered', 'rendered', 'cached'])
+        self.assertEqual(renderJobs(jobs[2:3], force=True)[jobs[2]['output']], 'rendered')
+        print("TestPlotRenderer: OK.")
+
+
+if __name__ == '__main__':
+    # Render the figures of a job file: python PlotRenderer.py <jobs.json> [--processes N] [--force]
+    if len(sys.argv) == 1:
+        ut.main()
+    parser = argparse.ArgumentParser(description="Render figures from stored results, headless and in parallel.")
+    parser.add_argument('jobs', help="JSON file with a list of jobs ({output, kind, inputs, params})")
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--force', action='store_true', help="redraw figures even if their inputs did not change")
+    args = parser.parse_args()
+    status = renderJobs(readJobs(args.jobs), args.processes, args.force, verbose=True)
+    sys.exit(1 if 'failed' in status.values() else 0)
@@ -0,0 +1,200 @@
+import json
+import time
+import threading
+import http.server
+import socketserver
+import numpy as np
+import unittest as ut
+from SharedResults import SharedSweepBlock
+
+STATUS_NAMES = {SharedSweepBlock.PENDING: 'pending',
+                SharedSweepBlock.RUNNING: 'running',
+                SharedSweepBlock.DONE: 'done',
+                SharedSweepBlock.FAILED: 'failed'}
+
+
+class ProgressMonitor:
+    """Reports the live progress of a parallel sweep from its SharedSweepBlock: for every task (round/replication)
+    its current slot, slots per second, latest convergence statistic, seconds since its last update (a stuck round
+    stops updating) and ETA. Reading the block costs the workers nothing."""
+
+    ##
+    # @specs are the sweep's specs (indexed by task) and @costModel a CostModel predicting their slots (see
+    # TaskScheduler); without them there is no ETA but the bound given by T_max.
+    ##
+    def __init__(self, block, specs=None, costModel=None):
+        self.block = block
+        self.specs = dict((spec.task, spec) for spec in specs) if specs else {}
+        self.costModel = costModel
+        self.predictedSlots = {}
+
+    def getPredictedSlots(self, spec):
+        if spec.task not in self.predictedSlots:
+            self.predictedSlots[spec.task] = self.costModel.predictSlots(spec)
+        return self.predictedSlots[spec.task]
+
+    ##
+    # Get the progress of task @task at time @now.
+    ##
+    def getTaskProgress(self, task, now):
+        row = self.block.block[task]
+        column = self.block.columns
+        status = int(row[column['status']])
+        slots = int(row[column['progressSlots']])
+        elapsed = row[column['updateTime']] - row[column['startTime']]
+        statistic = row[column['statistic']]
+        if status == SharedSweepBlock.PENDING or np.isnan(statistic):
+            statistic = None
+        progress = {'task': task,
+                    'status': STATUS_NAMES.get(status, str(status)),
+                    'arrivalRate': float(row[column['arrivalRate']]),
+                    'slots': slots,
+                    'slotsPerSecond': slots / elapsed if slots > 0 and elapsed > 0 else None,
+                    'statistic': float(statistic) if statistic is not None else None,
+                    'secondsSinceUpdate': now - row[column['updateTime']] if status == SharedSweepBlock.RUNNING
+                    else None,
+                    'eta': None,
+                    'etaBound': None}
+        spec = self.specs.get(task)
+        if spec is not None:
+            progress['index'] = spec.index
+            progress['replication'] = spec.replication
+            progress['arrivalRate'] = spec.arrivalRate
+            if status == SharedSweepBlock.RUNNING and progress['slotsPerSecond']:
+                progress['etaBound'] = max(spec.T_max - slots, 0) / progress['slotsPerSecond']
+                if self.costModel is not None and self.getPredictedSlots(spec) > slots:
+                    progress['eta'] = (self.getPredictedSlots(spec) - slots) / progress['slotsPerSecond']
+        return progress
+
+    ##
+    # Get the progress of the whole sweep: the per-task progress and the number of tasks per status.
+    ##
+    def getSnapshot(self):
+        now = time.time()
+        tasks = [self.getTaskProgress(task, now) for task in range(self.block.numOfTasks)]
+        counts = dict((name, 0) for name in STATUS_NAMES.values())
+        for progress in tasks:
+            counts[progress['status']] = counts.get(progress['status'], 0) + 1
+        return {'time': now, 'counts': counts, 'tasks': tasks}
+
+    ##
+    # Format a snapshot as a plain text table (running tasks first).
+    ##
+    def getTable(self):
+        snapshot = self.getSnapshot()
+        lines = [", ".join(name + " = " + str(snapshot['counts'][name]) for name in sorted(snapshot['counts']))]
+        lines.append("task".rjust(6) + "arrival rate".rjust(16) + "status".rjust(10) + "slots".rjust(14) +
+                     "slots/sec".rjust(12) + "statistic".rjust(14) + "idle [s]".rjust(10) + "eta [s]".rjust(10))
+        order = {'running': 0, 'failed': 1, 'pending': 2, 'done': 3}
+        for progress in sorted(snapshot['tasks'], key=lambda progress: (order.get(progress['status'], 4),
+                                                                         progress['task'])):
+            lines.append(str(progress['task']).rjust(6) +
+                         ("%.6g" % progress['arrivalRate']).rjust(16) +
+                         progress['status'].rjust(10) +
+                         str(progress['slots']).rjust(14) +
+                         formatValue(progress['slotsPerSecond'], "%.0f").rjust(12) +
+                         formatValue(progress['statistic'], "%.4g").rjust(14) +
+                         formatValue(progress['secondsSinceUpdate'], "%.0f").rjust(10) +
+                         formatValue(progress['eta'], "%.0f").rjust(10))
+        return "\n".join(lines) + "\n"
+
+
+def formatValue(value, fmt):
+    return fmt % value if value is not None else "-"
+
+
+class ProgressRequestHandler(http.server.BaseHTTPRequestHandler):
+    """GET /progress gives the sweep's progress as JSON, GET / as a text table."""
+
+    def do_GET(self):
+        monitor = self.server.monitor
+        if self.path.rstrip('/') in ('/progress', '/progress.json'):
+            (body, contentType) = (json.dumps(monitor.getSnapshot()), "application/json")
+        elif self.path in ('/', '/text'):
+            (body, contentType) = (monitor.getTable(), "text/plain")
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ProgressHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class ProgressServer:
+    """Serves a ProgressMonitor over HTTP from a background thread of the driver."""
+
+    ##
+    # Listen on @address (host, port); port 0 picks a free port (see getAddress). The default only accepts local
+    # connections.
+    ##
+    def __init__(self, monitor, address=('127.0.0.1', 0)):
+        self.monitor = monitor
+        self.server = ProgressHTTPServer(tuple(address), ProgressRequestHandler)
+        self.server.monitor = monitor
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def getAddress(self):
+        return self.server.server_address
+
+    def getURL(self):
+        (host, port) = self.getAddress()[:2]
+        return "http://" + host + ":" + str(port) + "/"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestProgressServer(ut.TestCase):
+    def runTest(self):
+        import urllib.request
+        from SimulationSpec import SimulationSpec
+        from TaskScheduler import CostModel
+        specs = [SimulationSpec(3, "RandomQueueStrategy", {'alpha': 10, 'beta': 100, 'p': 0.8},
+                                "VarianceConvergenceStrategy", {'epsilon': 0.01}, arrivalRate, 1.0, index=i,
+                                historyWindowSize=1000, T_min=5000, T_max=10 ** 6)
+                 for i, arrivalRate in enumerate([0.2, 0.5, 0.9])]
+        block = SharedSweepBlock(len(specs))
+        block.startTask(0, 0.2)
+        block.updateProgress(0, 1000, None)
+        block.writeResult(0, 0.2, 1.5, {'slots': 1000})
+        block.startTask(1, 0.5)
+        block.updateProgress(1, 2000, 0.25)
+        block.getField('startTime')[1] -= 10.0
+        server = ProgressServer(ProgressMonitor(block, specs, CostModel()))
+        try:
+            snapshot = json.loads(urllib.request.urlopen(server.getURL() + "progress").read())
+            table = urllib.request.urlopen(server.getURL()).read().decode('utf-8')
+        finally:
+            server.close()
+            block.unlink()
+        self.assertEqual(snapshot['counts'], {'pending': 1, 'running': 1, 'done': 1, 'failed': 0})
+        running = snapshot['tasks'][1]
+        self.assertEqual((running['status'], running['slots'], running['statistic']), ('running', 2000, 0.25))
+        self.assertAlmostEqual(running['slotsPerSecond'], 200.0, places=0)
+        expected = (CostModel.getModelSlots(specs[1]) - 2000) / running['slotsPerSecond']
+        self.assertAlmostEqual(running['eta'], expected, places=3)
+        self.assertAlmostEqual(running['etaBound'], (10 ** 6 - 2000) / running['slotsPerSecond'], places=3)
+        self.assertEqual(snapshot['tasks'][2]['status'], 'pending')
+        self.assertTrue(table.splitlines()[2].split()[0] == '1')
+        print("TestProgressServer: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
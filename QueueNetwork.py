@@ -1,4 +1,5 @@
 from MyQueue import Queue
+import heapq
 import numpy as np
 import unittest as ut
 
@@ -35,6 +36,7 @@ class QueueNetwork:
         self.totalWorkload = np.sum(_workloads)
         self.size = _size
         self.time = 0
+        self.buildIndexes()
 
     ##
     # Resets all queues to @services and workload of 0.
@@ -49,6 +51,7 @@ class QueueNetwork:
             self.queues[i].reset(_services[i])
         self.time = 0
         self.totalWorkload = 0
+        self.buildIndexes()
         # assert self.totalWorkload == np.sum(self.getWorkloads()), "lhs = " + str(self.totalWorkload) + " rhs = " + str(np.sum(self.getWorkloads()))
 
     ##
@@ -59,6 +62,7 @@ class QueueNetwork:
             q.reset(q.getService())
         self.time = 0
         self.totalWorkload = 0
+        self.buildIndexes()
         # assert self.totalWorkload == np.sum(self.getWorkloads()), "lhs = " + str(self.totalWorkload) + " rhs = " + str(np.sum(self.getWorkloads()))
 
     ##
@@ -86,9 +90,25 @@ class QueueNetwork:
     # Returns a list of the current workloads.
     ##
     def getWorkloads(self):
+        if self.classOf is not None:
+            drained = self.drained
+            workloads = [key - drained if key else 0 for key in self.keys]
+            return [workloads[c] for c in self.classOf]
+        if self.uniform:
+            drained = self.drained
+            return [key - drained if key else 0 for key in self.keys]
         workloads = [q.getWorkload() for q in self.queues]
         return workloads
 
+    ##
+    # Returns the workload of queue @i.
+    ##
+    def getWorkload(self, i):
+        if self.uniform:
+            key = self.keys[i if self.classOf is None else self.classOf[i]]
+            return key - self.drained if key else 0
+        return self.queues[i].getWorkload()
+
     ##
     # Returns the total workload in the network.
     ##
@@ -111,8 +131,10 @@ class QueueNetwork:
         for i in range(self.size):
             if int(services[i]) < 1:
                 raise Exception("Illegal service rates for setServices")
+        self.syncQueues()
         for i in range(self.size):
             self.queues[i].setService(int(services[i]))
+        self.buildIndexes()
 
     ##
     # Sets the workloads to the given sizes. Workloads are integers and are >= 0.
@@ -123,10 +145,12 @@ class QueueNetwork:
         for i in range(self.size):
             if int(workloads[i]) < 0:
                 raise Exception("Illegal workloads for setWorkloads")
+        self.syncQueues()
         self.totalWorkload = 0
         for i in range(self.size):
             self.queues[i].setWorkload(int(workloads[i]))
             self.totalWorkload += int(workloads[i])
+        self.buildIndexes()
         # assert self.totalWorkload == np.sum(self.getWorkloads()), "lhs = " + str(self.totalWorkload) + " rhs = " + str(np.sum(self.getWorkloads()))
 
 
@@ -141,8 +165,20 @@ class QueueNetwork:
         _workloads = [int(workload) for workload in workloads]
         if np.sum(workloads) != np.sum(_workloads):
             raise Exception("OUCH!!!")
+        if self.classOf is not None:
+            added = self.getClassWorkloads(chosen, _workloads)
+            if added is not None:
+                for c in added:
+                    self.updateIndex(c, added[c])
+                self.totalWorkload += sum(_workloads)
+                return
+            # The dispatch treats queues of a class differently, so they are no longer alike.
+            self.lump(None)
         for i in range(len(chosen)):
-            self.queues[chosen[i]].addWorkload(_workloads[i])
+            if self.uniform:
+                self.updateIndex(int(chosen[i]), _workloads[i])
+            else:
+                self.queues[chosen[i]].addWorkload(_workloads[i])
             self.totalWorkload += _workloads[i]
         # assert self.totalWorkload == np.sum(self.getWorkloads()), "lhs = " + str(self.totalWorkload) + " rhs = " + str(np.sum(self.getWorkloads())) + " added = " + str(_workloads)
 
@@ -150,16 +186,172 @@ class QueueNetwork:
     # Reduces the amount of workload in every queue by its service.
     ##
     def endTimeSlot(self):
-        for q in self.queues:
-            self.totalWorkload -= q.endTimeSlot()
+        if not self.uniform:
+            for q in self.queues:
+                self.totalWorkload -= q.endTimeSlot()
+            return
+        # Like Queue.endTimeSlot, every busy queue takes 1 off the total.
+        self.totalWorkload -= self.size - self.idleQueues
+        self.drained += self.service
+        heap = self.busyHeap
+        while heap and heap[0][0] <= self.drained:
+            (key, i) = heapq.heappop(heap)
+            if self.keys[i] == key:
+                self.setIdle(i)
         # assert self.totalWorkload == np.sum(self.getWorkloads()), "lhs = " + str(self.totalWorkload) + " rhs = " + str(np.sum(self.getWorkloads()))
 
+    ##
+    # Get the queue with the shortest workload (the first one among equals, like np.argmin of getWorkloads).
+    ##
+    def getShortestQueue(self):
+        if not self.uniform:
+            return int(np.argmin(self.getWorkloads()))
+        if self.idle:
+            heap = self.idleHeap
+            while heap[0] not in self.idle:
+                heapq.heappop(heap)
+            return heap[0] if self.classOf is None else self.classes[heap[0]][0]
+        heap = self.busyHeap
+        while self.keys[heap[0][1]] != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][1] if self.classOf is None else self.classes[heap[0][1]][0]
+
+    ##
+    # Get the idle queues (workload 0) in ascending order.
+    ##
+    def getIdleQueues(self):
+        if not self.uniform:
+            return [i for i, workload in enumerate(self.getWorkloads()) if workload == 0]
+        if self.classOf is not None:
+            return sorted(i for c in self.idle for i in self.classes[c])
+        return sorted(self.idle)
+
+    ##
+    # Build the indexes of the queues from their workloads. When all queues have the same service (uniform draining)
+    # the workloads are kept by the indexes instead of the queues, and a slot costs only the queues that became idle;
+    # otherwise every queue is served every slot and getShortestQueue and getIdleQueues scan the workloads.
+    # Idle queues are kept in a set (and a heap of their numbers for the first of them). A busy queue is keyed by its
+    # workload plus the service drained from every queue so far (self.drained): draining all queues by the same
+    # service keeps the keys and their order, so the busy queues are a heap of (key, queue) whose top is the shortest
+    # one. Outdated heap entries are skipped when they reach the top (a queue's current key is in self.keys, 0 when it
+    # is idle).
+    # A lumped network (see lump) indexes classes of queues instead, with self.weights queues each.
+    ##
+    def buildIndexes(self, classes=None):
+        services = set(q.getService() for q in self.queues)
+        self.uniform = len(services) == 1
+        self.service = services.pop() if self.uniform else None
+        self.drained = 0
+        self.classes = classes
+        self.classOf = None
+        self.lumpedSlots = 0
+        if classes is None:
+            self.keys = [q.getWorkload() for q in self.queues]
+            self.weights = [1] * self.size
+        else:
+            self.classOf = [0] * self.size
+            for c in range(len(classes)):
+                for i in classes[c]:
+                    self.classOf[i] = c
+            self.keys = [self.queues[members[0]].getWorkload() for members in classes]
+            self.weights = [len(members) for members in classes]
+        self.idle = set(c for c in range(len(self.keys)) if self.keys[c] == 0)
+        self.idleQueues = sum(self.weights[c] for c in self.idle)
+        self.idleHeap = sorted(self.idle)
+        self.busyHeap = sorted((self.keys[c], c) for c in range(len(self.keys)) if self.keys[c] > 0)
+
+    ##
+    # Lump the queues into @classes (lists of queue numbers that partition the network, see
+    # DispatchPolicyStrategy.getSymmetricClasses): a class has a single workload for all its queues, so a slot costs
+    # the classes instead of the queues. Queues are lumped only if all have the same service and the queues of every
+    # class have the same workload; a dispatch that treats queues of a class differently unlumps them again (see
+    # addWorkload), so a lumped network gives the workloads of an unlumped one. @classes of None unlumps the network.
+    # Returns whether the network is lumped.
+    ##
+    def lump(self, classes):
+        self.syncQueues()
+        if classes is not None:
+            classes = sorted(sorted(int(i) for i in members) for members in classes)
+            if not self.uniform or sorted(i for members in classes for i in members) != list(range(self.size)) or \
+                    any(self.queues[i].getWorkload() != self.queues[members[0]].getWorkload()
+                        for members in classes for i in members):
+                classes = None
+        self.buildIndexes(classes)
+        return classes is not None
+
+    def isLumped(self):
+        return self.classOf is not None
+
+    ##
+    # Get the workload added to every class by adding @workloads to the queues @chosen, if every class is either
+    # chosen whole with the same workload or not at all; None otherwise.
+    ##
+    def getClassWorkloads(self, chosen, workloads):
+        added = {}
+        queues = 0
+        for i in range(len(chosen)):
+            c = self.classOf[chosen[i]]
+            if c not in added:
+                added[c] = workloads[i]
+                queues += self.weights[c]
+            elif added[c] != workloads[i]:
+                return None
+        if queues != len(chosen) or len(set(chosen)) != len(chosen):
+            return None
+        return added
+
+    ##
+    # Write the workloads kept by the indexes back to the queues.
+    ##
+    def syncQueues(self):
+        if self.uniform:
+            for q, workload in zip(self.queues, self.getWorkloads()):
+                q.setWorkload(workload)
+        # The time of the queues is not advanced while lumped.
+        if self.lumpedSlots:
+            for q in self.queues:
+                q.timePassed += self.lumpedSlots
+            self.lumpedSlots = 0
+
+    ##
+    # Add @workload to queue (or class) @i (uniform draining only), keeping it >= 0 like Queue.addWorkload.
+    ##
+    def updateIndex(self, i, workload):
+        key = self.keys[i]
+        workload = max((key - self.drained if key else 0) + workload, 0)
+        if workload == 0:
+            if key != 0:
+                self.setIdle(i)
+            return
+        if workload + self.drained == key:
+            return
+        if key == 0:
+            self.idle.discard(i)
+            self.idleQueues -= self.weights[i]
+        self.keys[i] = workload + self.drained
+        heapq.heappush(self.busyHeap, (self.keys[i], i))
+        # Drop the outdated entries once they outnumber the queues.
+        if len(self.busyHeap) > 2 * len(self.keys):
+            self.busyHeap = [(self.keys[j], j) for j in range(len(self.keys)) if self.keys[j] > 0]
+            heapq.heapify(self.busyHeap)
+
+    def setIdle(self, i):
+        self.keys[i] = 0
+        self.idle.add(i)
+        self.idleQueues += self.weights[i]
+        heapq.heappush(self.idleHeap, i)
+        if len(self.idleHeap) > 2 * len(self.keys):
+            self.idleHeap = sorted(self.idle)
+
     ##
     # Increments the time that passed.
     ##
     def advanceTimeSlot(self):
-        for q in self.queues:
-            q.advanceTimeSlot()
+        if self.classOf is not None:
+            self.lumpedSlots += 1
+        else:
+            for q in self.queues:
+                q.advanceTimeSlot()
         self.time += 1
 
 
@@ -196,7 +388,7 @@ class TestQueueNetwork(ut.TestCase):
         q. setTime(0)
         self.assertEqual(q.getTime(), 0)
         self.assertEqual(q.getTotalWorkload(), 300)
-        q.addWorkload(index=range(len(wlds)), workloads=[-199] * len(wlds))
+        q.addWorkload(index=list(range(len(wlds))), workloads=[-199] * len(wlds))
         self.assertEqual(q.getWorkloads(), [0, 1])
         self.assertEqual(q.getTotalWorkload(), 1)
         q.endTimeSlot()
@@ -221,7 +413,64 @@ class TestQueueNetwork(ut.TestCase):
         self.assertEqual(q.getWorkloads(), [0] * len(wlds))
         self.assertEqual(q.getTime(), 0)
         self.assertEqual(q.getTotalWorkload(), 0)
-        print "TestQueueNetwork: OK."
+        print("TestQueueNetwork: OK.")
+
+
+class TestQueueNetworkIndexes(ut.TestCase):
+    def runTest(self):
+        generator = np.random.default_rng(5)
+        for services in [[1] * 8, [2] * 8, [1, 2] * 4]:
+            q = QueueNetwork(size=8, services=list(services), workloads=[0, 3, 0, 1, 7, 7, 0, 2])
+            for t in range(2000):
+                for i in range(generator.integers(3)):
+                    q.addWorkload([generator.integers(8)], [generator.integers(-3, 12)])
+                workloads = q.getWorkloads()
+                self.assertEqual(q.getShortestQueue(), np.argmin(workloads))
+                self.assertEqual([q.getWorkload(i) for i in range(8)], workloads)
+                self.assertEqual(q.getIdleQueues(), [i for i in range(8) if workloads[i] == 0])
+                q.endTimeSlot()
+                if t == 1000:
+                    q.setWorkloads([5, 0, 5, 0, 1, 1, 9, 9])
+            self.assertEqual(q.uniform, len(set(services)) == 1)
+            self.assertLessEqual(len(q.busyHeap), 2 * q.getSize())
+            # Changing the services keeps the workloads, wherever they were kept.
+            workloads = q.getWorkloads()
+            q.setServices([1] * 4 + [2] * 4)
+            self.assertEqual((q.getWorkloads(), q.uniform), (workloads, False))
+        q.flush()
+        self.assertEqual((q.getShortestQueue(), q.getIdleQueues()), (0, list(range(8))))
+        print("TestQueueNetworkIndexes: OK.")
+
+
+class TestQueueNetworkLumping(ut.TestCase):
+    def runTest(self):
+        generator = np.random.default_rng(3)
+        classes = [[4, 5, 6, 7], [0, 2], [1, 3]]
+        (lumped, q) = (QueueNetwork(size=8), QueueNetwork(size=8))
+        self.assertTrue(lumped.lump(classes))
+        for t in range(3000):
+            members = classes[generator.integers(3)]
+            workload = int(generator.integers(-3, 12))
+            for network in (lumped, q):
+                network.addWorkload(list(members), [workload] * len(members))
+            workloads = q.getWorkloads()
+            self.assertEqual((lumped.getWorkloads(), lumped.getTotalWorkload()), (workloads, q.getTotalWorkload()))
+            self.assertEqual(lumped.getShortestQueue(), np.argmin(workloads))
+            self.assertEqual(lumped.getIdleQueues(), q.getIdleQueues())
+            self.assertEqual(lumped.getWorkload(7), workloads[7])
+            lumped.endTimeSlot()
+            q.endTimeSlot()
+        self.assertTrue(lumped.isLumped())
+        # A dispatch to part of a class unlumps the network and keeps its workloads.
+        for network in (lumped, q):
+            network.addWorkload([4, 5], [9, 9])
+        self.assertFalse(lumped.isLumped())
+        self.assertEqual((lumped.getWorkloads(), lumped.getTotalWorkload()), (q.getWorkloads(), q.getTotalWorkload()))
+        # Queues are lumped only if their class is alike.
+        self.assertFalse(lumped.lump([[0, 1, 2, 3], [4, 5, 6, 7]]))
+        self.assertFalse(QueueNetwork(size=2, services=[1, 2]).lump([[0, 1]]))
+        self.assertFalse(QueueNetwork(size=3).lump([[0, 1]]))
+        print("TestQueueNetworkLumping: OK.")
 
 
 if __name__ == '__main__':
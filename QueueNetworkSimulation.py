@@ -1,6 +1,11 @@
 from QueueNetwork import QueueNetwork
 from StatsCollector import *
-import matplotlib.pyplot as plt
+from ResultLog import ResultLog, writeDump
+from PhaseProfiler import formatPhases
+from TelemetryLedger import getPeakRSS
+from RandomStreams import getGenerator
+# Plotting (matplotlib, PlotRenderer) is imported where it is used: workers import the engine with numpy only.
+import os
 import datetime
 from timeit import default_timer as timer
 import math
@@ -8,11 +13,23 @@ import math
 import cProfile
 
 
+class SimulationTimeout(Exception):
+    """Raised by a round that exceeds its wall-clock limit."""
+
+
 def guessAvgWorkload(arrivalRate, oneQmu, systemMuEffective):
     if arrivalRate >= systemMuEffective:
         return 0.0
     return arrivalRate * math.exp(arrivalRate) / (oneQmu*(systemMuEffective - arrivalRate))
 
+
+##
+# Draw the arrivals of the next @slots time slots from @generator: a job arrives in a slot with probability
+# @arrivalRate. Returns a boolean array, one entry per slot. The slot loop draws the arrivals of a window at once.
+##
+def drawArrivals(generator, slots, arrivalRate):
+    return generator.random(slots) < arrivalRate
+
 ########################################################################################################################
 #   STATS CLASS
 ########################################################################################################################
@@ -123,6 +140,15 @@ class QueueNetworkSimulation:
         self.numOfRounds = numOfRounds
         self.guessAvgWorkload = guess
         self.box = 0.0
+        self.trajectoryRecorder = None
+        self.progressHook = None
+        self.wallClockLimit = None
+        self.phaseProfiler = None
+        self.telemetryLedger = None
+        self.plotDirectory = None
+        self.loads = None
+        self.arrivalTrace = None
+        self.setGenerator(getGenerator())
 
     ##
     # Resets the simulation.
@@ -131,15 +157,25 @@ class QueueNetworkSimulation:
         self.network.flush()
         self.statsCollector.resetAll()
         if self.verbose:
-            print "INFO:    Simulation reset."
+            print("INFO:    Simulation reset.")
 
     ##
     # Set the dispatch policy.
     ##
     def setDispatchPolicy(self, dispatchPolicyStrategy):
         self.dispatchPolicyStrategy = dispatchPolicyStrategy
+        self.dispatchPolicyStrategy.setGenerator(self.generator)
         if self.verbose:
-            print "INFO:    Simulation dispatch policy set."
+            print("INFO:    Simulation dispatch policy set.")
+
+    ##
+    # Set the random generator (numpy.random.Generator) of the simulation. The simulation owns it: arrivals and the
+    # dispatch policy draw from it, nothing draws from NumPy's global state. A new simulation has a generator seeded
+    # from the OS; seed one with RandomStreams.getGenerator (SimulationSpec does).
+    ##
+    def setGenerator(self, generator):
+        self.generator = generator
+        self.dispatchPolicyStrategy.setGenerator(generator)
 
     ##
     # Set the convergence check function.
@@ -147,7 +183,7 @@ class QueueNetworkSimulation:
     def setConvergenceCondition(self, convergenceConditionStrategy):
         self.convergenceConditionStrategy = convergenceConditionStrategy
         if self.verbose:
-            print "INFO:    Simulation convergence condition set."
+            print("INFO:    Simulation convergence condition set.")
 
     ##
     # Set the plotting function.
@@ -155,7 +191,90 @@ class QueueNetworkSimulation:
     def setPlot(self, plotStrategy):
         self.plotStrategy = plotStrategy
         if self.verbose:
-            print "INFO:    Simulation plotting scheme set."
+            print("INFO:    Simulation plotting scheme set.")
+
+    ##
+    # Set an optional trajectory recorder (see TrajectoryRecorder). None disables recording.
+    ##
+    def setTrajectoryRecorder(self, trajectoryRecorder):
+        self.trajectoryRecorder = trajectoryRecorder
+        if self.verbose:
+            print("INFO:    Simulation trajectory recorder set.")
+
+    ##
+    # Set an optional progress hook. It is called as hook(slots, statistic) at every convergence check of a round,
+    # where statistic is the convergence condition's current statistic. None disables it.
+    ##
+    def setProgressHook(self, progressHook):
+        self.progressHook = progressHook
+
+    ##
+    # Set an optional wall-clock limit (in seconds) for a single round. A round that exceeds it raises
+    # SimulationTimeout at its next window boundary. None disables the limit.
+    ##
+    def setWallClockLimit(self, seconds):
+        self.wallClockLimit = seconds
+
+    ##
+    # Set an optional arrival trace (see TraceSource.Trace). With a trace, every round replays its recorded arrivals
+    # from its first slot instead of drawing them from the generator, and slots after its end have no arrivals. None
+    # draws them at random.
+    ##
+    def setArrivalTrace(self, arrivalTrace):
+        self.arrivalTrace = arrivalTrace
+
+    ##
+    # Set an optional phase profiler (see PhaseProfiler). With a profiler, every round reports the time and calls of
+    # each phase of the slot loop in diagnostics['phases']. None disables profiling.
+    ##
+    def setPhaseProfiler(self, phaseProfiler):
+        self.phaseProfiler = phaseProfiler
+
+    ##
+    # Set an optional directory for the figures of run. With one, run renders its figures there from the results it
+    # stored (headless, see PlotRenderer) instead of showing them; None shows them.
+    ##
+    def setPlotDirectory(self, plotDirectory):
+        self.plotDirectory = plotDirectory
+        if self.verbose:
+            print("INFO:    Simulation plot directory set.")
+
+    ##
+    # Set an optional load schedule: the arrival rates of the sweep as fractions of the effective service rate, one per
+    # round (numOfRounds of them). None sweeps numOfRounds equally spaced rates (see getArrivalRates).
+    ##
+    def setLoads(self, loads):
+        if loads is not None and len(loads) != self.numOfRounds:
+            raise Exception("A load schedule needs one load per round (" + str(self.numOfRounds) + "), got " +
+                            str(len(loads)))
+        self.loads = [float(load) for load in loads] if loads is not None else None
+        if self.verbose:
+            print("INFO:    Simulation load schedule set.")
+
+    ##
+    # Set an optional telemetry ledger (see TelemetryLedger). Every round of sweep/run/singleRun is recorded in it.
+    # None disables it.
+    ##
+    def setTelemetryLedger(self, telemetryLedger):
+        self.telemetryLedger = telemetryLedger
+
+    ##
+    # Get the spec of the round about to run, for the telemetry ledger (None without a ledger). It must be taken
+    # before the round: the round changes the workloads of the network, which are part of the spec (and its hash).
+    ##
+    def getTelemetrySpec(self, arrivalRate, effectiveServiceRate, index=0):
+        if self.telemetryLedger is None:
+            return None
+        from SimulationSpec import SimulationSpec
+        return SimulationSpec.fromSimulation(self, arrivalRate, effectiveServiceRate, index=index)
+
+    ##
+    # Record a completed round of @spec (see getTelemetrySpec) in the telemetry ledger, if there is one.
+    ##
+    def recordTelemetry(self, spec, diagnostics):
+        if self.telemetryLedger is None:
+            return
+        self.telemetryLedger.record(spec, diagnostics)
 
     # calculate the next average workload in the avg workload vector
     def calcAvgWorkLoad(self, T, AvgWorkLoad_prev, TotalWorkLoad):
@@ -167,214 +286,269 @@ class QueueNetworkSimulation:
     def getEffectiveServiceRate(self):
         return self.dispatchPolicyStrategy.getEffectiveServiceRate(self.network)
 
-    def singleRun(self, arrivalRate, effectiveServiceRate, resultQueue=None, resultNum=None):
+    ##
+    # Returns the arrival rates swept by run/parRun: numOfRounds equally spaced rates in [0, effectiveServiceRate), or
+    # the rates of the load schedule if one is set (see setLoads).
+    ##
+    def getArrivalRates(self, effectiveServiceRate):
+        if self.loads is not None:
+            return np.array([min(load * effectiveServiceRate, 1.0) for load in self.loads])
+        if effectiveServiceRate == 0:
+            return [0] * self.numOfRounds
+        # Floating point rounding can make arange overshoot by one rate.
+        arrivalRates = np.arange(0, effectiveServiceRate, float(effectiveServiceRate) / float(self.numOfRounds))
+        return arrivalRates[:self.numOfRounds]
+
+    ##
+    # Returns the sweep metadata that is written to result logs and dump files.
+    ##
+    def getMetadata(self):
+        return {'number of servers': self.network.getSize(),
+                'dispatch policy': self.dispatchPolicyStrategy.getName(),
+                'redundancy': self.dispatchPolicyStrategy.getRedundancy(),
+                'params': self.dispatchPolicyStrategy.getParamStr(),
+                'convergence condition': self.convergenceConditionStrategy.getName(),
+                'convergence precision': self.convergenceConditionStrategy.getPrecision(),
+                'history window size': self.statsCollector.getWindowStats().getWindowSize(),
+                'T_min': self.T_min,
+                'T_max': self.T_max,
+                'loads': self.loads}
+
+    ##
+    # Simulate a single arrival rate until convergence (or until T_max) starting from the current network state.
+    # Returns the estimated average workload and a diagnostics dictionary of the round.
+    ##
+    def runPoint(self, arrivalRate, effectiveServiceRate):
+        diagnostics = {'arrivalRate': float(arrivalRate),
+                       'load': float(arrivalRate) / float(effectiveServiceRate) if effectiveServiceRate else 0.0,
+                       'slots': 0,
+                       'converged': True,
+                       'wallTime': 0.0,
+                       'convergenceChecks': 0,
+                       'peakRSS': getPeakRSS()}
         if self.verbose:
-            print "INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " + str(100.0 * arrivalRate /
-                                                                                  effectiveServiceRate) + "% ]"
-            print "INFO:    Round Started at  :   " + str(datetime.datetime.now()) + "\n"
+            print("INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " + str(100.0 * arrivalRate /
+                                                                                  effectiveServiceRate) + "% ]")
+            print("INFO:    Round Started at  :   " + str(datetime.datetime.now()) + "\n")
         if arrivalRate <= 0:
             if self.verbose:
-                print "INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " + str(100.0 * arrivalRate /
-                                                                                      effectiveServiceRate) + "% ]"
-                print "INFO:    Round ended at    :   " + str(datetime.datetime.now())
-                print "INFO:    Time slot         :   " + str(self.network.getTime()) + "\n"
-            if resultQueue is not None:
-                resultQueue.put([resultNum, 0.0])
-                return
-            else:
-                self.box = 0.0
-                return 0.0
+                print("INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " + str(100.0 * arrivalRate /
+                                                                                      effectiveServiceRate) + "% ]")
+                print("INFO:    Round ended at    :   " + str(datetime.datetime.now()))
+                print("INFO:    Time slot         :   " + str(self.network.getTime()) + "\n")
+            return 0.0, diagnostics
+        # Keep one workload per class of queues the policy treats alike (see QueueNetwork.lump).
+        self.network.lump(self.dispatchPolicyStrategy.getSymmetricClasses(self.network.getSize()))
         start = timer()
-        # runningAvg = [0]
+        converged = False
+        convergenceChecks = 0
+        deadline = None
+        if self.wallClockLimit is not None:
+            deadline = start + self.wallClockLimit
+        recorder = self.trajectoryRecorder
+        if recorder is not None:
+            recorder.start(self.network, arrivalRate, self.T_max)
+        # Phases of the slot loop; the profiler, if any, replaces them with timed wrappers.
+        drawArrival = drawArrivals
+        if self.arrivalTrace is not None:
+            drawArrival = self.arrivalTrace.getArrivalStream().draw
+        getDispatch = self.dispatchPolicyStrategy.getDispatch
+        addWorkload = self.network.addWorkload
+        endTimeSlot = self.network.endTimeSlot
+        calcAvgWorkLoad = self.calcAvgWorkLoad
+        insertToWindow = self.statsCollector.insertToWindow
+        hasConverged = self.convergenceConditionStrategy.hasConverged
+        advanceTimeSlot = self.network.advanceTimeSlot
+        profiler = self.phaseProfiler
+        if profiler is not None:
+            profiler.reset()
+            drawArrival = profiler.wrap('drawArrival', drawArrival)
+            getDispatch = profiler.wrap('getDispatch', getDispatch)
+            addWorkload = profiler.wrap('addWorkload', addWorkload)
+            endTimeSlot = profiler.wrap('endTimeSlot', endTimeSlot)
+            calcAvgWorkLoad = profiler.wrap('calcAvgWorkLoad', calcAvgWorkLoad)
+            insertToWindow = profiler.wrap('insertToWindow', insertToWindow)
+            hasConverged = profiler.wrap('convergenceCheck', hasConverged)
+            advanceTimeSlot = profiler.wrap('advanceTimeSlot', advanceTimeSlot)
+        windowSize = self.statsCollector.getWindowStats().getWindowSize()
+        generator = self.generator
+        # Arrivals of the slots from slot @first to the end of its window.
+        first = self.network.getTime()
+        arrivals = []
         # Time-slot operating loop.
         while self.network.getTime() < self.T_max:
             t = self.network.getTime()
             # Determine whether a new job arrived or not.
-            if np.random.binomial(1, arrivalRate) == 1:
-                queues, newWork = self.dispatchPolicyStrategy.getDispatch(self.network)
-                self.network.addWorkload(queues, newWork)
+            if t - first == len(arrivals):
+                first = t
+                arrivals = drawArrival(generator, windowSize - t % windowSize, arrivalRate).tolist()
+            if arrivals[t - first]:
+                queues, newWork = getDispatch(self.network)
+                addWorkload(queues, newWork)
             # End the time-slot.
-            self.network.endTimeSlot()
+            endTimeSlot()
+            if recorder is not None:
+                recorder.record(t, self.network)
+            # Enforce the wall-clock limit once per window.
+            if deadline is not None and (t + 1) % windowSize == 0 and timer() > deadline:
+                if recorder is not None:
+                    recorder.finish()
+                raise SimulationTimeout("Round with arrival rate " + str(arrivalRate) + " exceeded its wall-clock " +
+                                        "limit of " + str(self.wallClockLimit) + " seconds at time slot " + str(t + 1))
             # Check for convergence.
-            if t >= self.T_min and (t + 1) % self.statsCollector.getWindowStats().getWindowSize() == 0:
+            if t >= self.T_min and (t + 1) % windowSize == 0:
+                convergenceChecks += 1
+                if self.progressHook is not None:
+                    self.progressHook(t + 1, self.convergenceConditionStrategy.getStatistic(
+                        self.network, [self.statsCollector.getWindowStats().getWindow()]))
                 # If converged, record stats and end round.
-                if self.convergenceConditionStrategy.hasConverged(self.network,
-                                                                  [self.statsCollector.getWindowStats().getWindow()],
-                                                                  self.T_min, self.T_max):
-                    self.statsCollector.insertToWindow(
-                        self.calcAvgWorkLoad(
+                if hasConverged(self.network, [self.statsCollector.getWindowStats().getWindow()], self.T_min,
+                                self.T_max):
+                    insertToWindow(
+                        calcAvgWorkLoad(
                             t + 1,
                             self.statsCollector.getLastWindowEntry(),
                             self.network.getTotalWorkload()
                         )
                     )
-                    if self.verbose:
-                        print "INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " + \
-                              str(100.0 * arrivalRate / effectiveServiceRate) + "% ]"
-                        print "INFO:    Round ended at    :   " + str(datetime.datetime.now())
-                        print "INFO:    Time slot         :   " + str(self.network.getTime() + 1) + "\n"
-                    if resultQueue is not None:
-                        resultQueue.put([resultNum, np.mean(self.statsCollector.getWindowStats().getWindow())])
-                        return
-                    else:
-                        self.box = np.mean(self.statsCollector.getWindowStats().getWindow())
-                        return np.mean(self.statsCollector.getWindowStats().getWindow())
+                    converged = True
+                    break
 
             # Gather stats of this time-slot.
-            self.statsCollector.insertToWindow(
-                self.calcAvgWorkLoad(
+            insertToWindow(
+                calcAvgWorkLoad(
                     t+1,
                     self.statsCollector.getLastWindowEntry(),
                     self.network.getTotalWorkload()
                 )
             )
-            # runningAvg.append(self.calcAvgWorkLoad(t+1, runningAvg[t], self.network.getTotalWorkload()))
             # Advance simulation time.
-            self.network.advanceTimeSlot()
-
-        if self.verbose:
-            print "INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " + \
-                  str(100.0 * arrivalRate / effectiveServiceRate) + "% ]"
-            print "INFO:    Round ended at  :   " + str(datetime.datetime.now())
-            print "INFO:    Time slot       :   " + str(self.network.getTime() + 1)
+            advanceTimeSlot()
         end = timer()   # Time in seconds
-        # if (arrivalRate / effectiveServiceRate == 0.2) or (arrivalRate / effectiveServiceRate == 0.75) or \
-        #     (arrivalRate / effectiveServiceRate == 0.9) or (arrivalRate / effectiveServiceRate == 0.95):
-        #     plt.plot(runningAvg)
-        #     plt.show()
+        if recorder is not None:
+            recorder.finish()
+
+        diagnostics['slots'] = self.network.getTime() + 1 if converged else self.network.getTime()
+        diagnostics['converged'] = converged
+        diagnostics['wallTime'] = float(end) - float(start)
+        diagnostics['convergenceChecks'] = convergenceChecks
+        diagnostics['peakRSS'] = getPeakRSS()
+        if profiler is not None:
+            diagnostics['phases'] = profiler.getSummary(diagnostics['wallTime'])
+        if self.verbose:
+            print("INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " +
+                  str(100.0 * arrivalRate / effectiveServiceRate) + "% ]")
+            print("INFO:    Round ended at    :   " + str(datetime.datetime.now()))
+            print("INFO:    Time slot         :   " + str(diagnostics['slots']))
+            print("INFO:    Time in seconds   :   " + str(diagnostics['wallTime']) + "\n")
+        return np.mean(self.statsCollector.getWindowStats().getWindow()), diagnostics
+
+    def singleRun(self, arrivalRate, effectiveServiceRate, resultQueue=None, resultNum=None):
+        spec = self.getTelemetrySpec(arrivalRate, effectiveServiceRate, index=resultNum or 0)
+        estimate, diagnostics = self.runPoint(arrivalRate, effectiveServiceRate)
+        self.recordTelemetry(spec, diagnostics)
         if resultQueue is not None:
-            print "INFO:    Time in seconds :   " + str(float(end) - float(start))
-            resultQueue.put([resultNum, np.mean(self.statsCollector.getWindowStats().getWindow())])
-            print "XXX\n"
+            resultQueue.put([resultNum, estimate])
             return
-        else:
-            return np.mean(self.statsCollector.getWindowStats().getWindow())
+        self.box = estimate
+        return estimate
 
     ##
-    # Run the simulation.
-    # NOTICE: Edit this to make your simulation advance through time as you expect it to.
+    # Sweep over the arrival rates and yield (arrival rate, estimate, diagnostics) as soon as each point completes.
+    # If @resultLog is given, every point is appended to it (and flushed) before it is yielded.
     ##
-    def run(self):
-        start_time = datetime.datetime.now()
-        initialWorkloadStr = str(self.network.getWorkloads())
-        if self.verbose:
-            print "INFO:    Starting simulation:"
-            print "INFO:        time                            :   " + str(start_time)
-            print "INFO:        number of servers               :   " + str(self.network.getSize())
-            print "INFO:        starting in time slot           :   " + str(self.network.getTime())
-            print "INFO:        policy                          :   " + self.dispatchPolicyStrategy.getName()
-            print "INFO:        servers service per time slot   :   " + str(self.network.getServices())
-            print "INFO:        servers initial workload        :   " + str(self.network.getWorkloads()) + "\n"
-
-        effectiveServiceRate = self.dispatchPolicyStrategy.getEffectiveServiceRate(self.network)
-        arrivalRates = [0]*self.numOfRounds
-        if effectiveServiceRate != 0:
-            arrivalRates = np.arange(0, effectiveServiceRate, float(effectiveServiceRate) / float(self.numOfRounds))
-
-        # Round operating loop.
-        simTimeAnalysis = []
-        for arrivalRate in arrivalRates:
-            if self.verbose:
-                print "INFO:    arrival rate  =   " + str(arrivalRate) + "  [ " + str(100.0 * arrivalRate /
-                                                                                      effectiveServiceRate) + "% ]"
-                print "INFO:    Round Started at  :   " + str(datetime.datetime.now())
-            start = timer()
+    def sweep(self, resultLog=None):
+        effectiveServiceRate = self.getEffectiveServiceRate()
+        for i, arrivalRate in enumerate(self.getArrivalRates(effectiveServiceRate)):
             # Try and guess avg workload for faster convergence.
             # TODO: test this feature and this guess function.
             if self.guessAvgWorkload:
                 guess = int(guessAvgWorkload(arrivalRate, self.dispatchPolicyStrategy.getOneQueueMu(),
                                              effectiveServiceRate))
-                initWorkloads = [int(guess / self.network.getSize()) for i in range(self.network.getSize())]
+                initWorkloads = [int(guess / self.network.getSize()) for k in range(self.network.getSize())]
                 self.network.setWorkloads(initWorkloads)
                 if self.verbose:
-                    print "INFO:    Guessed avg workload  =   " + str(guess)
-
-            # runningAvg = [0]
-            # Time-slot operating loop.
-            while self.network.getTime() < self.T_max:
-                t = self.network.getTime()
-                # Determine whether a new job arrived or not.
-                if np.random.binomial(1, arrivalRate) == 1:
-                    queues, newWork = self.dispatchPolicyStrategy.getDispatch(self.network)
-                    self.network.addWorkload(queues, newWork)
-                # End the time-slot.
-                self.network.endTimeSlot()
-                # Check for convergence.
-                if arrivalRate == 0:
-                    self.statsCollector.insertToAvgWorkloadWindow(0.0)
-                    self.statsCollector.resetWindows()
-                    break
-                # Is it time to check for convergence?
-                elif t >= self.T_min and (t + 1) % self.statsCollector.getWindowStats().getWindowSize() == 0:
-                    # If converged, record stats and end round.
-                    if self.convergenceConditionStrategy.hasConverged(self.network,
-                            [self.statsCollector.getWindowStats().getWindow()],
-                            self.T_min, self.T_max):
-                        self.statsCollector.insertToAvgWorkloadWindow(
-                            self.calcAvgWorkLoad(
-                                t+1,
-                                self.statsCollector.getLastWindowEntry(),
-                                self.network.getTotalWorkload()
-                            )
-                        )
-                        self.statsCollector.resetWindows()
-                        break
-                    # # If didn't converge, switch the windows.
-                    # self.statsCollector.switchWindows()
-
-                # Gather stats of this time-slot.
-                self.statsCollector.insertToWindow(
-                    self.calcAvgWorkLoad(
-                        t+1,
-                        self.statsCollector.getLastWindowEntry(),
-                        self.network.getTotalWorkload()
-                    )
-                )
-                # runningAvg.append(self.calcAvgWorkLoad(t+1, runningAvg[t], self.network.getTotalWorkload()))
-                # Advance simulation time.
-                self.network.advanceTimeSlot()
+                    print("INFO:    Guessed avg workload  =   " + str(guess))
+            spec = self.getTelemetrySpec(arrivalRate, effectiveServiceRate, index=i)
+            estimate, diagnostics = self.runPoint(arrivalRate, effectiveServiceRate)
+            diagnostics['index'] = i
+            self.recordTelemetry(spec, diagnostics)
+            self.statsCollector.resetWindows()
+            self.network.flush()
+            if resultLog is not None:
+                resultLog.append(i, arrivalRate, estimate, diagnostics)
+            yield arrivalRate, estimate, diagnostics
 
-            if self.verbose:
-                print "INFO:    Round ended at  :   " + str(datetime.datetime.now())
-                print "INFO:    Time slot       :   " + str(self.network.getTime() + 1) + "\n"
-            end = timer()   # Time in seconds
-            simTimeAnalysis.append(float(end) - float(start))
-            # if (arrivalRate / effectiveServiceRate == 0.2) or (arrivalRate / effectiveServiceRate == 0.75) or \
-            #     (arrivalRate / effectiveServiceRate == 0.9) or (arrivalRate / effectiveServiceRate == 0.95):
-            #     plt.plot(runningAvg)
-            #     plt.show()
-            self.network.reset()
+    ##
+    # Run the simulation.
+    # Results are streamed to an append-only result log while the sweep runs and written to a dump file at the end.
+    ##
+    def run(self):
+        start_time = datetime.datetime.now()
+        stamp = start_time.strftime("%Y%m%d-%H%M%S")
+        initialWorkloadStr = str(self.network.getWorkloads())
+        if self.verbose:
+            print("INFO:    Starting simulation:")
+            print("INFO:        time                            :   " + str(start_time))
+            print("INFO:        number of servers               :   " + str(self.network.getSize()))
+            print("INFO:        starting in time slot           :   " + str(self.network.getTime()))
+            print("INFO:        policy                          :   " + self.dispatchPolicyStrategy.getName())
+            print("INFO:        servers service per time slot   :   " + str(self.network.getServices()))
+            print("INFO:        servers initial workload        :   " + str(self.network.getWorkloads()))
+            print("INFO:        result log                      :   " + stamp + "_queue_net_sim.log\n")
+
+        header = self.getMetadata()
+        header['time started'] = str(start_time)
+        resultLog = ResultLog(stamp + '_queue_net_sim.log', header=header)
+
+        # Round operating loop.
+        arrivalRates = []
+        simTimeAnalysis = []
+        phaseSummaries = []
+        try:
+            for arrivalRate, estimate, diagnostics in self.sweep(resultLog=resultLog):
+                self.statsCollector.insertToAvgWorkloadWindow(estimate)
+                arrivalRates.append(arrivalRate)
+                simTimeAnalysis.append(diagnostics['wallTime'])
+                if 'phases' in diagnostics:
+                    phaseSummaries.append(("phases @ " + str(arrivalRate), formatPhases(diagnostics['phases'])))
+        finally:
+            resultLog.close()
 
         end_time = datetime.datetime.now()
         if self.verbose:
-            print "INFO:    Simulation ended at:"
-            print "INFO:        time                            :   " + str(end_time)
+            print("INFO:    Simulation ended at:")
+            print("INFO:        time                            :   " + str(end_time))
 
         # Save results to file.
+        dumpFile = datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + '_queue_net_sim.dump'
         if self.verbose:
-            print "INFO:    Saving results to file [ " + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + "_queue_net_sim.dump ]"
-        fd = open(datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + '_queue_net_sim.dump', 'w')
-        for val in arrivalRates:
-            fd.write(str(val) + ",")
-        fd.write("\n")
-        for val in self.statsCollector.getAvgWorkloadWindowStats().getWindow():
-            fd.write(str(val) + ",")
-        fd.write("\n")
-        fd.write("\n")
-        fd.write("INFO:        time started                    :   " + str(start_time) + "\n")
-        fd.write("INFO:        time ended                      :   " + str(end_time) + "\n")
-        fd.write("INFO:        number of servers               :   " + str(self.network.getSize()) + "\n")
-        fd.write("INFO:        dispatch policy                 :   " + self.dispatchPolicyStrategy.getName() + "\n")
-        fd.write("INFO:        redundancy                      :   " + str(self.dispatchPolicyStrategy.getRedundancy()) + "\n")
-        fd.write("INFO:        convergence condition           :   " + self.convergenceConditionStrategy.getName() + "\n")
-        fd.write("INFO:        convergence precision           :   " + str(self.convergenceConditionStrategy.getPrecision()) + "\n")
-        fd.write("INFO:        servers service per time slot   :   " + str(self.network.getServices()) + "\n")
-        fd.write("INFO:        servers initial workload        :   " + initialWorkloadStr + "\n")
-        fd.close()
+            print("INFO:    Saving results to file [ " + dumpFile + " ]")
+        writeDump(dumpFile,
+                  arrivalRates,
+                  self.statsCollector.getAvgWorkloadWindowStats().getWindow(),
+                  [("time started", start_time),
+                   ("time ended", end_time),
+                   ("number of servers", self.network.getSize()),
+                   ("dispatch policy", self.dispatchPolicyStrategy.getName()),
+                   ("redundancy", self.dispatchPolicyStrategy.getRedundancy()),
+                   ("convergence condition", self.convergenceConditionStrategy.getName()),
+                   ("convergence precision", self.convergenceConditionStrategy.getPrecision()),
+                   ("servers service per time slot", self.network.getServices()),
+                   ("servers initial workload", initialWorkloadStr)] + phaseSummaries)
 
         # FIXME: Move the plotting to a plot strategy.
         if self.verbose and len(arrivalRates) != len(self.statsCollector.getAvgWorkloadWindowStats().getWindow()):
-            print "WARN:    length of arrivalRates != length of stats collected"
+            print("WARN:    length of arrivalRates != length of stats collected")
+        if self.plotDirectory is not None:
+            from PlotRenderer import renderJobs
+            renderJobs([{'output': os.path.join(self.plotDirectory, stamp + "_workload.png"), 'kind': 'workload',
+                         'inputs': [dumpFile], 'params': {'labels': [self.dispatchPolicyStrategy.getName()]}},
+                        {'output': os.path.join(self.plotDirectory, stamp + "_wallTime.png"), 'kind': 'diagnostic',
+                         'inputs': [resultLog.getFilename()], 'params': {'field': 'wallTime'}}],
+                       processes=1, verbose=self.verbose)
+            return
+        import matplotlib.pyplot as plt
         plt.plot(arrivalRates, self.statsCollector.getAvgWorkloadWindowStats().getWindow()[:len(arrivalRates)])
         plt.show()
 
@@ -388,14 +562,14 @@ class QueueNetworkSimulation:
     ##
     def load(self, filename):
         if self.verbose:
-            print "INFO:    Loading network from file [ " + filename + " ]"
+            print("INFO:    Loading network from file [ " + filename + " ]")
 
     ##
     # Save simulation to a file.
     ##
     def save(self, filename="queue_net_sim.dump"):
         if self.verbose:
-            print "INFO:    Saving simulation to file [ " + str(datetime.datetime.now()) + "_" + filename + " ]"
+            print("INFO:    Saving simulation to file [ " + str(datetime.datetime.now()) + "_" + filename + " ]")
 
     ##
     # Plot results based on given plotting scheme.
@@ -404,7 +578,7 @@ class QueueNetworkSimulation:
         if x is None or y is None:
             return
         if self.verbose:
-            print "INFO:    Plotting..."
+            print("INFO:    Plotting...")
         if plotStrategy is not None:
             plotStrategy.plot(x, y)
         elif self.plotStrategy is not None:
@@ -418,15 +592,15 @@ class QueueNetworkSimulation:
         yy = []
         for resultsFile in resultsFiles:
             if self.verbose:
-                print "INFO:    Getting data from [ " + resultsFile + " ]"
+                print("INFO:    Getting data from [ " + resultsFile + " ]")
             with open(resultsFile, "r") as fd:
                 xx.append([float(val) for val in fd.readline().split(',')[:-1]])
                 yy.append([float(val) for val in fd.readline().split(',')[:-1]])
                 if self.verbose:
-                    print "INFO:    Results metadata:"
-                    print "################################################################"
-                    print fd.read()
-                    print "################################################################"
+                    print("INFO:    Results metadata:")
+                    print("################################################################")
+                    print(fd.read())
+                    print("################################################################")
         self.plot(xx, yy, plotStrategy=plotStrategy)
 
 
@@ -505,58 +679,34 @@ import ConvergenceConditionStrategy
 
 
 class PLOTd1vsd2:
-    def __init__(self, properties=None):
+    ##
+    # With an @output file the figure is rendered to it (headless, see PlotRenderer) instead of being shown.
+    ##
+    def __init__(self, properties=None, output=None):
         self.properties = properties
+        self.output = output
+
+    def getLabels(self, xx):
+        return [r'$d=%d$' % (i + 1) for i in range(len(xx))]
 
     def plot(self, xx, yy):
-        plt.xlabel(r'$\lambda$')
-        plt.ylabel(r'Average Workload')
-        plt.axvline(self.properties.getEffectiveMu(), linestyle="--")
-        plt.text(self.properties.getEffectiveMu() + (xx[0][1] - xx[0][0]) / 5.0, np.max(yy) / 2.0,
-                 s=r'$d=1$',
-                 fontsize="x-large",
-                 verticalalignment='center',
-                 rotation=90)
-        i = 1
-        for x, y in zip(xx, yy):
-            # gain = ((x[-1] - self.properties.getEffectiveMu()) / self.properties.getEffectiveMu()) * 100.0
-            # plt.annotate(r'Capacity region increased by approx. %d%%' % gain,
-            #              xy=(x[-1], y[-1]),
-            #              xytext=(x[-1] / 2.0, y[-1] / 1.5),
-            #              fontsize="large")
-            plt.plot(x, y, label=r'$d=%d$' % i, linewidth=2)
-            i += 1
-        plt.legend(loc="best", fontsize="x-large")
+        from PlotRenderer import drawWorkloadCurves
+        if self.output is not None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            figure = Figure()
+            FigureCanvasAgg(figure)
+            drawWorkloadCurves(figure.add_subplot(111), xx, yy, self.getLabels(xx), self.properties.getEffectiveMu())
+            figure.savefig(self.output)
+            return
+        import matplotlib.pyplot as plt
+        drawWorkloadCurves(plt.figure().gca(), xx, yy, self.getLabels(xx), self.properties.getEffectiveMu())
         plt.show()
 
 
-class PLOTd1vsd2vsRIQ:
-    def __init__(self, properties=None):
-        self.properties = properties
-
-    def plot(self, xx, yy):
-        plt.xlabel(r'$\lambda$')
-        plt.ylabel(r'Average Workload')
-        plt.axvline(self.properties.getEffectiveMu(), linestyle="--")
-        plt.text(self.properties.getEffectiveMu() + (xx[0][1] - xx[0][0]) / 5.0, np.max(yy) / 2.0,
-                 s=r'$d=1$',
-                 fontsize="x-large",
-                 verticalalignment='center',
-                 rotation=90)
-        i = 1
-        for x, y in zip(xx, yy):
-            # gain = ((x[-1] - self.properties.getEffectiveMu()) / self.properties.getEffectiveMu()) * 100.0
-            # plt.annotate(r'Capacity region increased by approx. %d%%' % gain,
-            #              xy=(x[-1], y[-1]),
-            #              xytext=(x[-1] / 2.0, y[-1] / 1.5),
-            #              fontsize="large")
-            if i != 2:
-                plt.plot(x, y, label=r'$d=%d$' % i, linewidth=2)
-            else:
-                plt.plot(x, y, label=r'$RIQ$', linewidth=2)
-            i += 1
-        plt.legend(loc="best", fontsize="x-large")
-        plt.show()
+class PLOTd1vsd2vsRIQ(PLOTd1vsd2):
+    def getLabels(self, xx):
+        return [r'$RIQ$' if i == 1 else r'$d=%d$' % (i + 1) for i in range(len(xx))]
 
 
 class SimplePlotParams:
@@ -567,20 +717,28 @@ class SimplePlotParams:
         return self.effectiveMu
 
 
-# random-d policy, n=3, alpha=10, beta=2000, p=0.8. d=1 vs. d=2.
-sim = QueueNetworkSimulation(3, DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=2000, p=0.8, d=2),
-                             ConvergenceConditionStrategy.VarianceConvergenceStrategy(epsilon=5e-05),
-                             verbose=True, numOfRounds=30, historyWindowSize=20000, T_min=500000, T_max=150000000)
-plotter = PLOTd1vsd2(properties=SimplePlotParams(sim.getEffectiveServiceRate()))
-sim.plotFromFile(["project_results/20190117-213847_queue_net_sim.dump",
-                  "project_results/20190117-162848_queue_net_sim.dump"], plotStrategy=plotter)
-
-#  n=3, alpha=10, beta=2000, p=0.8. no RR vs. random-d=2 vs. RIQ.
-sim = QueueNetworkSimulation(3, DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=2000, p=0.8, d=2),
-                             ConvergenceConditionStrategy.VarianceConvergenceStrategy(epsilon=5e-05),
-                             verbose=True, numOfRounds=30, historyWindowSize=20000, T_min=500000, T_max=150000000)
-plotter = PLOTd1vsd2vsRIQ(properties=SimplePlotParams(sim.getEffectiveServiceRate()))
-sim.plotFromFile(["20190121-231359_queue_net_sim.dump",
-                  "20190122-024429_queue_net_sim.dump",
-                  "20190121-175444_queue_net_sim.dump"], plotStrategy=plotter)
-
+##
+# Plot the stored results of the report: random-d with d=1 vs. d=2, and no redundancy vs. random-d=2 vs. RIQ. The dump
+# files are read relative to the working directory (the repository root).
+##
+def main():
+    # random-d policy, n=3, alpha=10, beta=2000, p=0.8. d=1 vs. d=2.
+    sim = QueueNetworkSimulation(3, DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=2000, p=0.8, d=2),
+                                 ConvergenceConditionStrategy.VarianceConvergenceStrategy(epsilon=5e-05),
+                                 verbose=True, numOfRounds=30, historyWindowSize=20000, T_min=500000, T_max=150000000)
+    plotter = PLOTd1vsd2(properties=SimplePlotParams(sim.getEffectiveServiceRate()))
+    sim.plotFromFile(["project_results/20190117-213847_queue_net_sim.dump",
+                      "project_results/20190117-162848_queue_net_sim.dump"], plotStrategy=plotter)
+
+    #  n=3, alpha=10, beta=2000, p=0.8. no RR vs. random-d=2 vs. RIQ.
+    sim = QueueNetworkSimulation(3, DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=2000, p=0.8, d=2),
+                                 ConvergenceConditionStrategy.VarianceConvergenceStrategy(epsilon=5e-05),
+                                 verbose=True, numOfRounds=30, historyWindowSize=20000, T_min=500000, T_max=150000000)
+    plotter = PLOTd1vsd2vsRIQ(properties=SimplePlotParams(sim.getEffectiveServiceRate()))
+    sim.plotFromFile(["20190121-231359_queue_net_sim.dump",
+                      "20190122-024429_queue_net_sim.dump",
+                      "20190121-175444_queue_net_sim.dump"], plotStrategy=plotter)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import struct
+import numpy as np
+import unittest as ut
+
+
+##
+# Get a random generator (numpy.random.Generator on PCG64) for @seed: an integer, a list of integers (see
+# SeedStreams.getSeed) or None to seed from the OS. Simulations and policies draw from generators they are given
+# rather than from NumPy's global state.
+##
+def getGenerator(seed=None):
+    return np.random.Generator(np.random.PCG64(seed))
+
+
+##
+# Draw @d distinct queues out of 0, ..., @n - 1, uniformly, in O(d) (Floyd's algorithm): the k-th pick is uniform on
+# 0, ..., n - d + k and is replaced by n - d + k itself if it was already picked. Takes d uniform draws from
+# @generator, so it gives the first row of sampleDistinctBatch for the same generator state.
+##
+def sampleDistinct(generator, n, d):
+    chosen = []
+    first = n - d
+    for k, u in enumerate(generator.random(d).tolist()):
+        pick = int(u * (first + k + 1))
+        chosen.append(first + k if pick in chosen else pick)
+    return chosen
+
+
+##
+# Draw @size samples of @d distinct queues out of 0, ..., @n - 1 (see sampleDistinct) at once. Returns an integer
+# array of shape (size, d). Takes O(size * d^2) vectorized work, independent of n.
+##
+def sampleDistinctBatch(generator, n, d, size):
+    first = n - d
+    chosen = (generator.random((size, d)) * (first + 1 + np.arange(d))).astype(np.int64)
+    for k in range(1, d):
+        # The fallback n - d + k is larger than every earlier pick, so it never collides.
+        collided = (chosen[:, :k] == chosen[:, k:k + 1]).any(axis=1)
+        chosen[collided, k] = first + k
+    return chosen
+
+
+class RandomPermutation:
+    """A pseudo-random permutation of 0, ..., size - 1, computed one index at a time in O(1) memory, for ranges too
+    large to shuffle. It is a balanced Feistel network on the smallest even number of bits covering the range, with
+    cycle walking: an index mapped outside the range is mapped again until it falls inside, which keeps the mapping a
+    permutation of the range (at most 4 passes are expected). The round keys are drawn from a generator."""
+
+    ROUNDS = 4
+
+    def __init__(self, size, generator):
+        if int(size) < 1:
+            raise Exception("Illegal size for RandomPermutation")
+        self.size = int(size)
+        self.half = max(1, ((self.size - 1).bit_length() + 1) // 2)
+        self.mask = (1 << self.half) - 1
+        self.keys = [int(key) & self.mask for key in generator.integers(0, 2 ** 63, self.ROUNDS)]
+
+    def getSize(self):
+        return self.size
+
+    ##
+    # The round function: a multiply/xor-shift mix of @right and @key on half the bits.
+    ##
+    def mix(self, right, key):
+        (mask, shift) = (self.mask, (self.half + 1) // 2)
+        x = ((right ^ key) * 0x9E3779B97F4A7C15) & mask
+        x ^= x >> shift
+        x = (x * 0xBF58476D1CE4E5B9) & mask
+        return x ^ (x >> shift)
+
+    ##
+    # Get the image of @index (0 <= index < size).
+    ##
+    def permute(self, index):
+        (half, mask) = (self.half, self.mask)
+        x = int(index)
+        while True:
+            (left, right) = (x >> half, x & mask)
+            for key in self.keys:
+                (left, right) = (right, left ^ self.mix(right, key))
+            x = (left << half) | right
+            if x < self.size:
+                return x
+
+
+class SeedStreams:
+    """Derives the seeds of independent random streams from one root seed.
+    The seed of a stream is a 128-bit digest of (root seed, stream key), given as four 32-bit words, which NumPy's
+    SeedSequence expands into the state of a PCG64 generator. Distinct keys give unrelated states, and the same root
+    seed and key always give the same stream, so every task of a sweep can be reproduced from the root seed alone."""
+
+    ##
+    # Initialize with @rootSeed, a non-negative integer. If None, a root seed is drawn from the OS (and recorded).
+    ##
+    def __init__(self, rootSeed=None):
+        if rootSeed is None:
+            rootSeed = struct.unpack(">Q", os.urandom(8))[0] >> 1
+        if int(rootSeed) < 0:
+            raise Exception("Invalid root seed " + str(rootSeed))
+        self.rootSeed = int(rootSeed)
+
+    def getRootSeed(self):
+        return self.rootSeed
+
+    ##
+    # Get the seed of the stream identified by @key, a tuple of non-negative integers (e.g. (round, replication,
+    # attempt)). The seed can be given to getGenerator.
+    ##
+    def getSeed(self, *key):
+        digest = hashlib.sha256(",".join(str(int(k)) for k in (self.rootSeed,) + key).encode("ascii")).digest()
+        return list(struct.unpack(">4I", digest[:16]))
+
+    def getGenerator(self, *key):
+        return getGenerator(self.getSeed(*key))
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestSeedStreams(ut.TestCase):
+    def runTest(self):
+        streams = SeedStreams(2019)
+        self.assertEqual(streams.getSeed(3, 1), SeedStreams(2019).getSeed(3, 1))
+        self.assertNotEqual(streams.getSeed(3, 1), streams.getSeed(1, 3))
+        self.assertNotEqual(streams.getSeed(3, 1), SeedStreams(2020).getSeed(3, 1))
+        self.assertEqual(list(streams.getGenerator(0).integers(0, 1000, 5)),
+                         list(streams.getGenerator(0).integers(0, 1000, 5)))
+        self.assertIsInstance(streams.getGenerator(0).bit_generator, np.random.PCG64)
+        # Streams of neighbouring keys must not be correlated.
+        draws = np.array([streams.getGenerator(k).random(1000) for k in range(20)])
+        correlations = np.corrcoef(draws)[np.triu_indices(20, 1)]
+        self.assertLess(np.max(np.abs(correlations)), 0.15)
+        self.assertGreaterEqual(SeedStreams().getRootSeed(), 0)
+        print("TestSeedStreams: OK.")
+
+
+class TestSampleDistinct(ut.TestCase):
+    def runTest(self):
+        samples = sampleDistinctBatch(getGenerator(1), 6, 3, 60000)
+        self.assertEqual(samples.shape, (60000, 3))
+        self.assertTrue(all(len(set(sample)) == 3 for sample in samples.tolist()))
+        self.assertEqual((samples.min(), samples.max()), (0, 5))
+        # Every subset of 3 out of 6 is equally likely.
+        subsets = np.unique(np.sort(samples, axis=1), axis=0, return_counts=True)[1]
+        self.assertEqual(len(subsets), 20)
+        self.assertLess(np.max(np.abs(subsets / 3000.0 - 1)), 0.1)
+        self.assertEqual(sampleDistinct(getGenerator(2), 1000, 4),
+                         sampleDistinctBatch(getGenerator(2), 1000, 4, 1)[0].tolist())
+        self.assertEqual(sorted(sampleDistinct(getGenerator(3), 5, 5)), list(range(5)))
+        print("TestSampleDistinct: OK.")
+
+
+class TestRandomPermutation(ut.TestCase):
+    def runTest(self):
+        for size in [1, 2, 5, 64, 1000, 4097]:
+            permutation = RandomPermutation(size, getGenerator(size))
+            self.assertEqual(sorted(permutation.permute(i) for i in range(size)), list(range(size)))
+        # The same generator state gives the same permutation, another state another one.
+        images = [RandomPermutation(1000, getGenerator(seed)).permute(i) for seed in [1, 1, 2] for i in range(20)]
+        self.assertEqual(images[:20], images[20:40])
+        self.assertNotEqual(images[:20], images[40:])
+        self.assertLess(RandomPermutation(2 ** 100, getGenerator(1)).permute(2 ** 99), 2 ** 100)
+        print("TestRandomPermutation: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
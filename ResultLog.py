@@ -0,0 +1,169 @@
+import json
+import os
+import unittest as ut
+
+
+##
+# JSON encoder hook for numpy scalars and other values the standard encoder does not know.
+##
+def jsonDefault(obj):
+    if hasattr(obj, 'item'):
+        return obj.item()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+
+class ResultLog:
+    """Append-only log of sweep results. Every completed point is written as a single JSON line and flushed to disk
+    right away, so a partial sweep can be tailed by plotting/monitoring tools and survives an interruption."""
+
+    ##
+    # Open (or create) the log @filename for appending. @header is a dictionary describing the sweep and is written
+    # only when the log is new.
+    ##
+    def __init__(self, filename, header=None):
+        self.filename = filename
+        isNew = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self.fd = open(filename, 'a')
+        if isNew and header is not None:
+            self.write({'type': 'header', 'header': header})
+
+    ##
+    # Write a single record and make sure it reached the disk.
+    ##
+    def write(self, record):
+        self.fd.write(json.dumps(record, default=jsonDefault) + "\n")
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+
+    ##
+    # Append a completed point of the sweep. @status is 'ok', or 'failed' for a point that gave up (its estimate is
+    # None and its diagnostics hold the failure records).
+    ##
+    def append(self, index, arrivalRate, estimate, diagnostics=None, status='ok'):
+        self.write({'type': 'point', 'index': index, 'arrivalRate': arrivalRate, 'estimate': estimate,
+                    'status': status, 'diagnostics': diagnostics if diagnostics is not None else {}})
+
+    ##
+    # Append a completed replication of a point. Replication records are kept for the record; the point itself (the
+    # aggregate of its replications) is appended once all of them completed.
+    ##
+    def appendReplication(self, index, replication, arrivalRate, estimate, diagnostics=None, status='ok'):
+        self.write({'type': 'replication', 'index': index, 'replication': replication, 'arrivalRate': arrivalRate,
+                    'estimate': estimate, 'status': status,
+                    'diagnostics': diagnostics if diagnostics is not None else {}})
+
+    def getFilename(self):
+        return self.filename
+
+    def close(self):
+        if not self.fd.closed:
+            self.fd.close()
+
+
+##
+# Read a result log. Returns the header dictionary (or None) and the list of point records ordered by index.
+# If a point was logged more than once (e.g. a failed point that was rerun), its last record wins.
+# A trailing partial line (e.g. the sweep was killed while writing) is ignored.
+##
+def readResultLog(filename):
+    header = None
+    points = {}
+    with open(filename, "r") as fd:
+        for line in fd:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('type') == 'header':
+                header = record['header']
+            elif record.get('type') == 'point':
+                points[record['index']] = record
+    return header, [points[i] for i in sorted(points)]
+
+
+##
+# Write results in the legacy dump format that plotFromFile reads: a line of arrival rates, a line of estimates and
+# the "INFO:" metadata lines given in @info as (label, value) pairs.
+##
+def writeDump(filename, arrivalRates, estimates, info=()):
+    fd = open(filename, 'w')
+    for val in arrivalRates:
+        fd.write(str(val) + ",")
+    fd.write("\n")
+    for val in estimates:
+        fd.write(str(val) + ",")
+    fd.write("\n")
+    fd.write("\n")
+    for label, value in info:
+        fd.write("INFO:        " + label.ljust(32) + ":   " + str(value) + "\n")
+    fd.close()
+
+
+##
+# Read a legacy dump file. Returns the arrival rates, the estimates and the metadata dictionary of its "INFO:" lines
+# (values are kept as the strings written).
+##
+def readDump(filename):
+    with open(filename, "r") as fd:
+        arrivalRates = [float(val) for val in fd.readline().split(',')[:-1]]
+        estimates = [float(val) for val in fd.readline().split(',')[:-1]]
+        info = {}
+        for line in fd:
+            if line.startswith("INFO:") and ":   " in line:
+                (label, value) = line[len("INFO:"):].split(":   ", 1)
+                info[label.strip()] = value.strip()
+    return arrivalRates, estimates, info
+
+
+##
+# Convert a (possibly partial) result log into a legacy dump file.
+##
+def resultLogToDump(logFile, dumpFile):
+    header, points = readResultLog(logFile)
+    info = []
+    if header is not None:
+        info = [(label, header[label]) for label in sorted(header)]
+    estimates = [point['estimate'] if point['estimate'] is not None else float('nan') for point in points]
+    writeDump(dumpFile, [point['arrivalRate'] for point in points], estimates, info)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestResultLog(ut.TestCase):
+    def runTest(self):
+        import tempfile
+        import numpy as np
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "sweep.log")
+        log = ResultLog(filename, header={'number of servers': 3})
+        log.append(1, np.float64(0.5), np.float64(12.5), {'slots': np.int64(100), 'converged': True})
+        log.append(0, 0.0, None, {'failures': [{'error': 'SimulationTimeout'}]}, status='failed')
+        log.appendReplication(0, 1, 0.0, 0.0)
+        log.append(0, 0.0, 0.0)
+        log.close()
+        # Reopening an existing log must not write a second header.
+        log = ResultLog(filename, header={'number of servers': 4})
+        log.close()
+        # Simulate a sweep killed in the middle of a write.
+        with open(filename, 'a') as fd:
+            fd.write('{"type": "point", "index": 2, "arrival')
+        header, points = readResultLog(filename)
+        self.assertEqual(header, {'number of servers': 3})
+        self.assertEqual([point['index'] for point in points], [0, 1])
+        self.assertEqual([point['status'] for point in points], ['ok', 'ok'])
+        self.assertEqual(points[1]['estimate'], 12.5)
+        self.assertEqual(points[1]['diagnostics']['slots'], 100)
+        dumpFile = os.path.join(directory, "sweep.dump")
+        resultLogToDump(filename, dumpFile)
+        with open(dumpFile, "r") as fd:
+            self.assertEqual([float(val) for val in fd.readline().split(',')[:-1]], [0.0, 0.5])
+            self.assertEqual([float(val) for val in fd.readline().split(',')[:-1]], [0.0, 12.5])
+        self.assertEqual(readDump(dumpFile), ([0.0, 0.5], [0.0, 12.5], {'number of servers': '3'}))
+        print("TestResultLog: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import time
+import numpy as np
+import unittest as ut
+
+
+##
+# Get a directory backed by memory (tmpfs) if there is one.
+##
+def getSharedMemoryDir():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class SharedSweepBlock:
+    """A block of shared memory holding the results, diagnostics, progress and artifacts of a parallel sweep.
+    The block is a memory-mapped file in tmpfs addressed by its path, so workers attach to it by name (pickling a block
+    only sends its path and shape) and the driver reads the NumPy views without any copy.
+    Every task owns a row; a worker only ever writes its own task's row."""
+
+    RESULT_FIELDS = ['status', 'arrivalRate', 'estimate']
+    DIAGNOSTIC_FIELDS = ['slots', 'converged', 'wallTime', 'load', 'convergenceChecks', 'peakRSS']
+    PROGRESS_FIELDS = ['progressSlots', 'statistic', 'startTime', 'updateTime', 'worker']
+
+    PENDING = 0
+    RUNNING = 1
+    DONE = 2
+    FAILED = -1
+
+    ##
+    # Create a block for @numOfTasks tasks. Every task gets @artifactLength floats for a per-point artifact (e.g. a
+    # decimated trajectory). @diagnosticFields are the numeric diagnostics kept per task.
+    ##
+    def __init__(self, numOfTasks, artifactLength=0, diagnosticFields=None, path=None):
+        self.numOfTasks = int(numOfTasks)
+        self.artifactLength = int(artifactLength)
+        self.diagnosticFields = list(diagnosticFields) if diagnosticFields else list(self.DIAGNOSTIC_FIELDS)
+        self.fields = self.RESULT_FIELDS + self.diagnosticFields + self.PROGRESS_FIELDS
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="queue_net_sim_", suffix=".shm", dir=getSharedMemoryDir())
+            os.close(fd)
+        self.path = path
+        self.attach(mode='w+')
+
+    def attach(self, mode='r+'):
+        self.columns = dict((field, i) for i, field in enumerate(self.fields))
+        self.block = np.memmap(self.path, dtype=np.float64, mode=mode,
+                               shape=(max(self.numOfTasks, 1), len(self.fields) + self.artifactLength))
+
+    ##
+    # Only the address of the block is pickled; the receiving process maps the same memory.
+    ##
+    def __getstate__(self):
+        return {'path': self.path, 'numOfTasks': self.numOfTasks, 'artifactLength': self.artifactLength,
+                'diagnosticFields': self.diagnosticFields}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.fields = self.RESULT_FIELDS + self.diagnosticFields + self.PROGRESS_FIELDS
+        self.attach()
+
+    ##
+    # Get a (zero-copy) view of a single field of all tasks.
+    ##
+    def getField(self, field):
+        return self.block[:self.numOfTasks, self.columns[field]]
+
+    ##
+    # Get a (zero-copy) view of the artifacts of all tasks, one row per task.
+    ##
+    def getArtifacts(self):
+        return self.block[:self.numOfTasks, len(self.fields):]
+
+    def getStatus(self, index):
+        return int(self.block[index, self.columns['status']])
+
+    def startTask(self, index, arrivalRate):
+        row = self.block[index]
+        row[:] = 0.0
+        row[self.columns['arrivalRate']] = arrivalRate
+        row[self.columns['startTime']] = time.time()
+        row[self.columns['updateTime']] = row[self.columns['startTime']]
+        row[self.columns['worker']] = os.getpid()
+        row[self.columns['status']] = self.RUNNING
+
+    ##
+    # Progress hook of a task's simulation (see QueueNetworkSimulation.setProgressHook).
+    ##
+    def updateProgress(self, index, slots, statistic):
+        row = self.block[index]
+        row[self.columns['progressSlots']] = slots
+        row[self.columns['statistic']] = statistic if statistic is not None else np.nan
+        row[self.columns['updateTime']] = time.time()
+
+    ##
+    # Write the result of a finished task. The status is written last, so a reader that sees DONE sees the whole row.
+    ##
+    def writeResult(self, index, arrivalRate, estimate, diagnostics):
+        row = self.block[index]
+        row[self.columns['arrivalRate']] = arrivalRate
+        row[self.columns['estimate']] = estimate
+        for field in self.diagnosticFields:
+            if field in diagnostics:
+                row[self.columns[field]] = diagnostics[field]
+        row[self.columns['progressSlots']] = diagnostics.get('slots', row[self.columns['progressSlots']])
+        row[self.columns['updateTime']] = time.time()
+        row[self.columns['status']] = self.DONE
+
+    def markFailed(self, index):
+        self.block[index, self.columns['updateTime']] = time.time()
+        self.block[index, self.columns['status']] = self.FAILED
+
+    ##
+    # Store @values as the artifact of a task, decimated (evenly spaced samples) to the artifact length.
+    ##
+    def writeArtifact(self, index, values):
+        if self.artifactLength == 0 or len(values) == 0:
+            return
+        positions = np.linspace(0, len(values) - 1, self.artifactLength).astype(int)
+        self.block[index, len(self.fields):] = np.asarray(values)[positions]
+
+    ##
+    # Read the result of a finished task as (arrival rate, estimate, diagnostics).
+    ##
+    def readResult(self, index):
+        row = self.block[index]
+        diagnostics = dict((field, float(row[self.columns[field]])) for field in self.diagnosticFields)
+        for field in ('slots', 'convergenceChecks', 'peakRSS'):
+            if field in diagnostics:
+                diagnostics[field] = int(diagnostics[field])
+        if 'converged' in diagnostics:
+            diagnostics['converged'] = bool(diagnostics['converged'])
+        diagnostics['arrivalRate'] = float(row[self.columns['arrivalRate']])
+        diagnostics['index'] = index
+        return float(row[self.columns['arrivalRate']]), float(row[self.columns['estimate']]), diagnostics
+
+    ##
+    # Remove the block's name. Processes that mapped it keep their mapping until they drop it.
+    ##
+    def unlink(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+def writeFromWorker(args):
+    (block, index) = args
+    block.startTask(index, 0.1 * index)
+    block.updateProgress(index, 1000 * index, 0.5)
+    block.writeResult(index, 0.1 * index, 10.0 * index, {'slots': 2000 * index, 'converged': True, 'wallTime': 1.5})
+    block.writeArtifact(index, list(range(100)))
+    return index
+
+
+class TestSharedSweepBlock(ut.TestCase):
+    def runTest(self):
+        import multiprocessing
+        block = SharedSweepBlock(4, artifactLength=5)
+        pool = multiprocessing.Pool(processes=2)
+        self.assertEqual(sorted(pool.map(writeFromWorker, [(block, i) for i in range(3)])), [0, 1, 2])
+        pool.close()
+        pool.join()
+        block.unlink()
+        status = block.getField('status')
+        self.assertEqual(list(status), [SharedSweepBlock.DONE] * 3 + [SharedSweepBlock.PENDING])
+        self.assertEqual(list(block.getField('estimate')[:3]), [0.0, 10.0, 20.0])
+        self.assertEqual(list(block.getArtifacts()[2]), [0, 24, 49, 74, 99])
+        arrivalRate, estimate, diagnostics = block.readResult(2)
+        self.assertEqual(estimate, 20.0)
+        self.assertEqual(diagnostics['slots'], 4000)
+        self.assertTrue(diagnostics['converged'])
+        self.assertEqual(block.getField('progressSlots')[1], 2000)
+        print("TestSharedSweepBlock: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -0,0 +1,175 @@
+import unittest as ut
+import DispatchPolicyStrategy
+import ConvergenceConditionStrategy
+from QueueNetworkSimulation import QueueNetworkSimulation
+from PhaseProfiler import PhaseProfiler
+from RandomStreams import getGenerator
+from TraceSource import openTrace
+
+
+class SimulationSpec:
+    """A compact, declarative description of a single simulation round (one arrival rate).
+    Specs are cheap to pickle, so they are what parallel workers receive; a worker turns a spec into a simulation
+    locally with build()."""
+
+    ##
+    # @policyName / @convergenceName are class names in DispatchPolicyStrategy / ConvergenceConditionStrategy and
+    # @policyParams / @convergenceParams their constructor arguments (see getParams of both interfaces).
+    ##
+    def __init__(self, size, policyName, policyParams, convergenceName, convergenceParams, arrivalRate,
+                 effectiveServiceRate, index=0, seed=None, services=None, workloads=None, historyWindowSize=10000,
+                 T_min=0, T_max=10000000, verbose=False, trajectoryRecorder=None, timeout=None, replication=0,
+                 task=None, profilePhases=False, arrivalTrace=None):
+        self.size = int(size)
+        self.policyName = policyName
+        self.policyParams = dict(policyParams)
+        self.convergenceName = convergenceName
+        self.convergenceParams = dict(convergenceParams)
+        self.arrivalRate = float(arrivalRate)
+        self.effectiveServiceRate = float(effectiveServiceRate)
+        self.index = index
+        self.seed = seed
+        self.services = list(services) if services else []
+        self.workloads = list(workloads) if workloads else []
+        self.historyWindowSize = historyWindowSize
+        self.T_min = T_min
+        self.T_max = T_max
+        self.verbose = verbose
+        self.trajectoryRecorder = trajectoryRecorder
+        self.timeout = timeout
+        self.replication = replication
+        self.task = task if task is not None else index
+        self.profilePhases = profilePhases
+        # The prefix of the arrival trace (see TraceSource), if any. Workers map the trace themselves.
+        self.arrivalTrace = arrivalTrace
+
+    ##
+    # Make a spec of the round of @sim with the given arrival rate. The simulation itself is not referenced by the
+    # spec. @index is the round (arrival rate) of the sweep and @task identifies the replication of the round.
+    ##
+    @staticmethod
+    def fromSimulation(sim, arrivalRate, effectiveServiceRate, index=0, seed=None, replication=0, task=None):
+        return SimulationSpec(sim.network.getSize(),
+                              sim.dispatchPolicyStrategy.__class__.__name__,
+                              sim.dispatchPolicyStrategy.getParams(),
+                              sim.convergenceConditionStrategy.__class__.__name__,
+                              sim.convergenceConditionStrategy.getParams(),
+                              arrivalRate, effectiveServiceRate, index=index, seed=seed,
+                              services=sim.network.getServices(), workloads=sim.network.getWorkloads(),
+                              historyWindowSize=sim.statsCollector.getWindowStats().getWindowSize(),
+                              T_min=sim.T_min, T_max=sim.T_max, verbose=sim.verbose,
+                              trajectoryRecorder=sim.trajectoryRecorder, replication=replication, task=task,
+                              profilePhases=sim.phaseProfiler is not None,
+                              arrivalTrace=sim.arrivalTrace.getPrefix() if sim.arrivalTrace is not None else None)
+
+    def buildDispatchPolicy(self):
+        return getattr(DispatchPolicyStrategy, self.policyName)(**self.policyParams)
+
+    def buildConvergenceCondition(self):
+        return getattr(ConvergenceConditionStrategy, self.convergenceName)(**self.convergenceParams)
+
+    def buildArrivalTrace(self):
+        return openTrace(self.arrivalTrace) if self.arrivalTrace is not None else None
+
+    ##
+    # Build the simulation described by the spec.
+    ##
+    def build(self):
+        sim = QueueNetworkSimulation(self.size, self.buildDispatchPolicy(), self.buildConvergenceCondition(),
+                                     services=list(self.services), workloads=list(self.workloads),
+                                     historyWindowSize=self.historyWindowSize, numOfRounds=1, verbose=self.verbose,
+                                     T_min=self.T_min, T_max=self.T_max)
+        sim.setTrajectoryRecorder(self.trajectoryRecorder)
+        sim.setWallClockLimit(self.timeout)
+        sim.setArrivalTrace(self.buildArrivalTrace())
+        sim.setPhaseProfiler(PhaseProfiler() if self.profilePhases else None)
+        return sim
+
+    ##
+    # Specs with the same structure key can run on the same simulation object (see reuse).
+    ##
+    def getStructureKey(self):
+        return (self.size, tuple(self.services), tuple(self.workloads), self.historyWindowSize)
+
+    ##
+    # Reconfigure @sim, a simulation built from a spec with the same structure key, to run this spec. The network
+    # and the statistics windows are reset in place, so their buffers are reused.
+    ##
+    def reuse(self, sim):
+        sim.dispatchPolicyStrategy = self.buildDispatchPolicy()
+        sim.convergenceConditionStrategy = self.buildConvergenceCondition()
+        sim.T_min = self.T_min if self.T_min != 0 else self.historyWindowSize
+        sim.T_max = self.T_max
+        sim.verbose = self.verbose
+        sim.network.flush()
+        if self.workloads:
+            sim.network.setWorkloads(list(self.workloads))
+        sim.statsCollector.resetAll()
+        sim.setTrajectoryRecorder(self.trajectoryRecorder)
+        sim.setWallClockLimit(self.timeout)
+        sim.setArrivalTrace(self.buildArrivalTrace())
+        sim.setProgressHook(None)
+        if not self.profilePhases:
+            sim.setPhaseProfiler(None)
+        elif sim.phaseProfiler is None:
+            sim.setPhaseProfiler(PhaseProfiler())
+        return sim
+
+    ##
+    # Build the simulation and give it a random generator seeded with the spec's seed.
+    # A seed of None seeds from the OS, so forked workers never share a random stream.
+    # If a @cache dictionary is given, a cached simulation with the same structure is reused instead of building one.
+    ##
+    def prepare(self, cache=None):
+        if cache is None:
+            sim = self.build()
+        else:
+            key = self.getStructureKey()
+            if key not in cache:
+                cache[key] = self.build()
+                sim = cache[key]
+            else:
+                sim = self.reuse(cache[key])
+        sim.setGenerator(getGenerator(self.seed))
+        return sim
+
+    ##
+    # Run the round on @sim (a fresh simulation from prepare() if not given). Returns (estimate, diagnostics).
+    ##
+    def run(self, sim=None):
+        if sim is None:
+            sim = self.prepare()
+        estimate, diagnostics = sim.runPoint(self.arrivalRate, self.effectiveServiceRate)
+        diagnostics['index'] = self.index
+        diagnostics['replication'] = self.replication
+        return estimate, diagnostics
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestSimulationSpec(ut.TestCase):
+    def runTest(self):
+        import pickle
+        sim = QueueNetworkSimulation(3, DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=100, p=0.8, d=2),
+                                     ConvergenceConditionStrategy.RunForXSlotsConvergenceStrategy(3000),
+                                     historyWindowSize=1000, T_min=1000, T_max=5000, numOfRounds=50)
+        spec = SimulationSpec.fromSimulation(sim, 0.05, sim.getEffectiveServiceRate(), index=7, seed=1234)
+        # The spec must stay small no matter how large the simulation's windows are.
+        self.assertLess(len(pickle.dumps(spec, pickle.HIGHEST_PROTOCOL)), 2000)
+        spec = pickle.loads(pickle.dumps(spec, pickle.HIGHEST_PROTOCOL))
+        built = spec.build()
+        self.assertEqual(built.network.getSize(), 3)
+        self.assertEqual(built.dispatchPolicyStrategy.getParams(), sim.dispatchPolicyStrategy.getParams())
+        self.assertEqual(built.convergenceConditionStrategy.getPrecision(), 3000)
+        self.assertEqual(built.T_min, 1000)
+        estimate, diagnostics = spec.run()
+        self.assertEqual(diagnostics['index'], 7)
+        self.assertEqual(diagnostics['slots'], 3000)
+        # Same seed, same round.
+        self.assertEqual(spec.run()[0], estimate)
+        print("TestSimulationSpec: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
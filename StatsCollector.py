@@ -26,13 +26,16 @@ class Stats:
         self.firstSlot = None
 
     ##
-    # Reset the stats window.
+    # Reset the stats window. The window buffer is reused unless its size changes.
     ##
     def reset(self, windowSize=0):
         size = self.getWindowSize()
         if windowSize > 0:
             size = windowSize
-        self.window = np.zeros(size)
+        if size == self.getWindowSize():
+            self.window.fill(0.0)
+        else:
+            self.window = np.zeros(size)
         self.nextOpenSlot = 0
         self.firstSlot = None
 
@@ -79,6 +82,12 @@ class Stats:
     def getWindow(self):
         return self.window
 
+    ##
+    # Get the window history ordered from the oldest to the newest value.
+    ##
+    def getChronologicalWindow(self):
+        return np.roll(self.window, -self.nextOpenSlot)
+
 
 ##
 # This should be as a member of a user-defined statistics class.
@@ -105,6 +114,28 @@ class StatsCollector:
             self.stats[i].reset(windowSize=_sizes[i])
 
 
+# Two-sided 95% quantiles of Student's t distribution for 1..30 degrees of freedom.
+T_QUANTILES_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145,
+                  2.131, 2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048,
+                  2.045, 2.042]
+
+
+##
+# Returns the mean of independent replications @values and the half-width of its 95% confidence interval (Student's
+# t). The half-width is None for less than 2 values.
+##
+def confidenceInterval(values):
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return float('nan'), None
+    mean = float(np.mean(values))
+    if len(values) < 2:
+        return mean, None
+    degrees = len(values) - 1
+    quantile = T_QUANTILES_95[degrees - 1] if degrees <= len(T_QUANTILES_95) else 1.96
+    return mean, float(quantile * np.std(values, ddof=1) / math.sqrt(len(values)))
+
+
 ########################################################################################################################
 #   TEST
 ########################################################################################################################
@@ -142,7 +173,18 @@ class TestStats(ut.TestCase):
         # q.reset()
         # self.assertEqual(q.getService(), 1)
         # self.assertEqual(q.getWorkload(), 0)
-        print "TestStats: OK."
+        print("TestStats: OK.")
+
+
+class TestConfidenceInterval(ut.TestCase):
+    def runTest(self):
+        self.assertEqual(confidenceInterval([5.0]), (5.0, None))
+        mean, halfWidth = confidenceInterval([1.0, 2.0, 3.0])
+        self.assertEqual(mean, 2.0)
+        self.assertAlmostEqual(halfWidth, 4.303 / math.sqrt(3))
+        mean, halfWidth = confidenceInterval(np.arange(100))
+        self.assertAlmostEqual(halfWidth, 1.96 * np.std(np.arange(100), ddof=1) / 10.0)
+        print("TestConfidenceInterval: OK.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,173 @@
+import json
+import os
+import multiprocessing
+import numpy as np
+import unittest as ut
+
+
+##
+# Returns the number of CPUs this process may run on.
+##
+def getNumOfCPUs():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+
+class CostModel:
+    """Predicts the wall time of a simulation round from its spec.
+    The number of slots a round needs grows like the relaxation time of the network, 1 / (1 - rho)^2 where
+    rho = arrivalRate / effectiveServiceRate, and is bounded by [T_min, T_max]. The cost of a slot grows with the number
+    of queues. Both are calibrated per policy and network size from observed rounds (telemetry)."""
+
+    ##
+    # @historyFile is an optional JSON-lines file of past observations; it is read now and appended to by observe.
+    # @ledgerFile is an optional telemetry ledger (see TelemetryLedger) that is only read.
+    ##
+    def __init__(self, historyFile=None, secondsPerSlotPerQueue=2e-6, ledgerFile=None):
+        self.historyFile = historyFile
+        self.secondsPerSlotPerQueue = secondsPerSlotPerQueue
+        self.observations = {}
+        for filename in (historyFile, ledgerFile):
+            if filename is not None and os.path.exists(filename):
+                self.readObservations(filename)
+
+    ##
+    # Read the observations of a JSON-lines file of records with key, load, slots and wallTime fields.
+    ##
+    def readObservations(self, filename):
+        with open(filename, "r") as fd:
+            for line in fd:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('slots', 0) > 0 and 'key' in record:
+                    self.addObservation(record['key'], record['load'], record['slots'], record['wallTime'])
+
+    ##
+    # Observations are grouped by policy and network size.
+    ##
+    @staticmethod
+    def getKey(spec):
+        return spec.policyName + ",n=" + str(spec.size)
+
+    @staticmethod
+    def getLoad(spec):
+        if spec.effectiveServiceRate <= 0:
+            return 0.0
+        return spec.arrivalRate / spec.effectiveServiceRate
+
+    ##
+    # The uncalibrated number of slots a round is expected to need (at @load, if given, instead of the spec's load).
+    ##
+    @staticmethod
+    def getModelSlots(spec, load=None):
+        if load is None:
+            load = CostModel.getLoad(spec)
+        if load <= 0:
+            return 0.0
+        T_min = max(spec.T_min, spec.historyWindowSize)
+        relaxation = spec.historyWindowSize / (1.0 - min(load, 0.999)) ** 2
+        return float(min(max(T_min + relaxation, T_min), spec.T_max))
+
+    def addObservation(self, key, load, slots, wallTime):
+        self.observations.setdefault(key, []).append((float(load), float(slots), float(wallTime)))
+
+    ##
+    # Record the outcome of a finished round (see runPoint for the diagnostics).
+    ##
+    def observe(self, spec, diagnostics):
+        if diagnostics.get('slots', 0) <= 0:
+            return
+        key = self.getKey(spec)
+        self.addObservation(key, self.getLoad(spec), diagnostics['slots'], diagnostics['wallTime'])
+        if self.historyFile is not None:
+            with open(self.historyFile, "a") as fd:
+                fd.write(json.dumps({'key': key, 'load': self.getLoad(spec), 'slots': diagnostics['slots'],
+                                     'wallTime': diagnostics['wallTime']}) + "\n")
+
+    ##
+    # Predict the number of slots of a round: the model slots scaled by the median observed/model ratio.
+    ##
+    def predictSlots(self, spec):
+        modelSlots = self.getModelSlots(spec)
+        observations = self.observations.get(self.getKey(spec), [])
+        ratios = []
+        for load, slots, wallTime in observations:
+            model = self.getModelSlots(spec, load)
+            if model > 0:
+                ratios.append(slots / model)
+        if ratios:
+            modelSlots *= np.median(ratios)
+        return float(min(modelSlots, spec.T_max))
+
+    ##
+    # Predict the seconds a slot costs: the median observed rate, or a per-queue default.
+    ##
+    def predictSecondsPerSlot(self, spec):
+        observations = self.observations.get(self.getKey(spec), [])
+        if observations:
+            return float(np.median([wallTime / slots for load, slots, wallTime in observations]))
+        return self.secondsPerSlotPerQueue * spec.size
+
+    ##
+    # Predict the wall time (in seconds) of the round described by @spec.
+    ##
+    def predict(self, spec):
+        return self.predictSlots(spec) * self.predictSecondsPerSlot(spec)
+
+
+class TaskScheduler:
+    """Sizes the worker pool to the machine and orders tasks longest-expected-first. Workers pull one task at a
+    time, so the order only decides which tasks start first and cheap tasks fill the cores at the tail of the sweep."""
+
+    def __init__(self, costModel=None, processes=None):
+        self.costModel = costModel if costModel is not None else CostModel()
+        self.processes = processes if processes else getNumOfCPUs()
+
+    ##
+    # Get the number of worker processes to use for @numOfTasks tasks.
+    ##
+    def getProcesses(self, numOfTasks):
+        return max(1, min(self.processes, numOfTasks))
+
+    ##
+    # Order the specs by decreasing predicted cost.
+    ##
+    def order(self, specs):
+        return sorted(specs, key=self.costModel.predict, reverse=True)
+
+    def observe(self, spec, diagnostics):
+        self.costModel.observe(spec, diagnostics)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestTaskScheduler(ut.TestCase):
+    def runTest(self):
+        import tempfile
+        from SimulationSpec import SimulationSpec
+        specs = [SimulationSpec(3, "RandomQueueStrategy", {'alpha': 10, 'beta': 100, 'p': 0.8},
+                                "VarianceConvergenceStrategy", {'epsilon': 0.01}, arrivalRate, 1.0, index=i,
+                                historyWindowSize=1000, T_min=5000, T_max=10 ** 7)
+                 for i, arrivalRate in enumerate([0.0, 0.2, 0.5, 0.9, 0.99])]
+        scheduler = TaskScheduler(processes=64)
+        self.assertEqual(scheduler.getProcesses(5), 5)
+        self.assertEqual(TaskScheduler(processes=2).getProcesses(5), 2)
+        self.assertEqual([spec.index for spec in scheduler.order(specs)], [4, 3, 2, 1, 0])
+        self.assertEqual(scheduler.costModel.predict(specs[0]), 0.0)
+        # Telemetry calibrates both the slot count and the cost of a slot, and is kept in the history file.
+        historyFile = os.path.join(tempfile.mkdtemp(), "history.log")
+        model = CostModel(historyFile=historyFile)
+        modelSlots = CostModel.getModelSlots(specs[2])
+        model.observe(specs[2], {'slots': 2 * modelSlots, 'wallTime': 2 * modelSlots * 1e-5})
+        self.assertAlmostEqual(model.predictSlots(specs[3]), 2 * CostModel.getModelSlots(specs[3]))
+        self.assertAlmostEqual(model.predictSecondsPerSlot(specs[3]), 1e-5)
+        self.assertAlmostEqual(CostModel(historyFile=historyFile).predict(specs[3]), model.predict(specs[3]))
+        print("TestTaskScheduler: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
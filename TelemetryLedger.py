@@ -0,0 +1,213 @@
+import sys
+import os
+import math
+import json
+import time
+import socket
+import hashlib
+import unittest as ut
+from TaskScheduler import CostModel
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+##
+# Returns the peak resident set size of this process in bytes, or None where it is not available.
+##
+def getPeakRSS():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return int(peak) if sys.platform == 'darwin' else int(peak) * 1024
+
+
+##
+# Returns a stable hash of what determines the outcome of a round (everything in @spec but its seed and its place in a
+# sweep), so rounds of different runs can be matched.
+##
+def getSpecHash(spec):
+    description = {'size': spec.size,
+                   'policy': spec.policyName,
+                   'policyParams': spec.policyParams,
+                   'convergence': spec.convergenceName,
+                   'convergenceParams': spec.convergenceParams,
+                   'arrivalRate': repr(float(spec.arrivalRate)),
+                   'services': spec.services,
+                   'workloads': spec.workloads,
+                   'historyWindowSize': spec.historyWindowSize,
+                   'T_min': spec.T_min,
+                   'T_max': spec.T_max}
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class TelemetryLedger:
+    """An append-only ledger (JSON lines) of the cost of every simulated round, across runs and simulations.
+    Records carry the CostModel fields (key, load, slots, wallTime), so a ledger can calibrate a CostModel
+    (see CostModel's ledgerFile)."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def getFilename(self):
+        return self.filename
+
+    ##
+    # Make the record of a completed round of @spec (see runPoint for the diagnostics).
+    ##
+    @staticmethod
+    def getRecord(spec, diagnostics):
+        slots = diagnostics.get('slots', 0)
+        wallTime = diagnostics.get('wallTime', 0.0)
+        return {'time': time.time(),
+                'host': socket.gethostname(),
+                'specHash': getSpecHash(spec),
+                'key': CostModel.getKey(spec),
+                'policy': spec.policyName,
+                'convergence': spec.convergenceName,
+                'size': spec.size,
+                'arrivalRate': spec.arrivalRate,
+                'load': CostModel.getLoad(spec),
+                'slots': slots,
+                'wallTime': wallTime,
+                'slotsPerSecond': slots / wallTime if wallTime > 0 else None,
+                'convergenceChecks': diagnostics.get('convergenceChecks'),
+                'converged': diagnostics.get('converged'),
+                'hitT_max': not diagnostics.get('converged', True) and slots >= spec.T_max,
+                'peakRSS': diagnostics.get('peakRSS')}
+
+    ##
+    # Append the record of a completed round. Every record is a single write to a file opened for appending, so the
+    # ledger can be shared by concurrent runs.
+    ##
+    def record(self, spec, diagnostics):
+        record = self.getRecord(spec, diagnostics)
+        with open(self.filename, 'a') as fd:
+            fd.write(json.dumps(record, sort_keys=True) + "\n")
+        return record
+
+
+##
+# Read the records of a ledger; lines that do not parse (e.g. a partial last line) are skipped.
+##
+def readLedger(filename):
+    records = []
+    if not os.path.exists(filename):
+        return records
+    with open(filename, "r") as fd:
+        for line in fd:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+##
+# Group ledger @records by the fields @groupBy and summarise the cost of every group: rounds, slots, wall time, its
+# share of the total wall time and its slots per second. 'loadBin' groups by load rounded down to @loadBinWidth.
+# @where is an optional predicate on records. Groups are ordered by decreasing wall time.
+##
+def queryLedger(records, groupBy=('policy', 'size', 'loadBin'), where=None, loadBinWidth=0.1):
+    groups = {}
+    for record in records:
+        if where is not None and not where(record):
+            continue
+        values = dict(record)
+        values['loadBin'] = round(math.floor(record['load'] / loadBinWidth + 1e-9) * loadBinWidth, 6)
+        key = tuple(values.get(field) for field in groupBy)
+        group = groups.setdefault(key, {'rounds': 0, 'slots': 0, 'wallTime': 0.0, 'unconverged': 0})
+        group['rounds'] += 1
+        group['slots'] += record['slots']
+        group['wallTime'] += record['wallTime']
+        group['unconverged'] += 0 if record.get('converged', True) else 1
+    totalWallTime = sum(group['wallTime'] for group in groups.values())
+    rows = []
+    for key, group in groups.items():
+        row = dict(zip(groupBy, key))
+        row.update(group)
+        row['share'] = group['wallTime'] / totalWallTime if totalWallTime > 0 else 0.0
+        row['slotsPerSecond'] = group['slots'] / group['wallTime'] if group['wallTime'] > 0 else None
+        rows.append(row)
+    return sorted(rows, key=lambda row: -row['wallTime'])
+
+
+##
+# Format the rows of queryLedger as a text table.
+##
+def formatQuery(rows, groupBy=('policy', 'size', 'loadBin')):
+    columns = list(groupBy) + ['rounds', 'slots', 'wallTime', 'share', 'slotsPerSecond', 'unconverged']
+    widths = [max([len(column)] + [len(formatCell(row[column])) for row in rows]) + 2 for column in columns]
+    lines = ["".join(column.rjust(width) for column, width in zip(columns, widths))]
+    for row in rows:
+        lines.append("".join(formatCell(row[column]).rjust(width) for column, width in zip(columns, widths)))
+    return "\n".join(lines)
+
+
+def formatCell(value):
+    if isinstance(value, float):
+        return "%.4g" % value
+    return str(value)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestTelemetryLedger(ut.TestCase):
+    def runTest(self):
+        import copy
+        import tempfile
+        from SimulationSpec import SimulationSpec
+        filename = os.path.join(tempfile.mkdtemp(), "ledger.log")
+        ledger = TelemetryLedger(filename)
+        specs = [SimulationSpec(3, "RandomQueueStrategy", {'alpha': 10, 'beta': 100, 'p': 0.8},
+                                "RunForXSlotsConvergenceStrategy", {'x': 3000}, arrivalRate, 0.1, seed=i,
+                                historyWindowSize=1000)
+                 for i, arrivalRate in enumerate([0.01, 0.05, 0.09])]
+        for spec in specs:
+            estimate, diagnostics = spec.run()
+            self.assertEqual(diagnostics['convergenceChecks'], 2)
+            self.assertGreater(diagnostics['peakRSS'], 0)
+            ledger.record(spec, diagnostics)
+        ledger.record(specs[2], {'slots': 10000000, 'wallTime': 100.0, 'converged': False})
+        reseeded = copy.copy(specs[0])
+        reseeded.seed = 99
+        self.assertEqual(getSpecHash(specs[0]), getSpecHash(reseeded))
+        self.assertNotEqual(getSpecHash(specs[0]), getSpecHash(specs[1]))
+        records = readLedger(filename)
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[0]['slots'], 3000)
+        self.assertTrue(records[3]['hitT_max'])
+        rows = queryLedger(records)
+        # The round that hit T_max dominates the budget.
+        self.assertEqual((rows[0]['loadBin'], rows[0]['rounds'], rows[0]['unconverged']), (0.9, 2, 1))
+        self.assertAlmostEqual(sum(row['share'] for row in rows), 1.0)
+        self.assertEqual(len(queryLedger(records, groupBy=('policy',))), 1)
+        self.assertIn("loadBin", formatQuery(rows))
+        # A ledger calibrates the cost model.
+        model = CostModel(ledgerFile=filename)
+        self.assertEqual(len(model.observations[CostModel.getKey(specs[0])]), 4)
+        # Rounds recorded by a simulation are hashed by their spec before they ran, so seeds share a hash.
+        simLedger = TelemetryLedger(os.path.join(os.path.dirname(filename), "simulations.log"))
+        for seed in [1, 2]:
+            spec = copy.copy(specs[2])
+            spec.seed = seed
+            sim = spec.prepare()
+            sim.setTelemetryLedger(simLedger)
+            sim.singleRun(spec.arrivalRate, spec.effectiveServiceRate)
+        hashes = [record['specHash'] for record in readLedger(simLedger.getFilename())]
+        self.assertEqual(len(hashes), 2)
+        self.assertEqual(hashes[0], hashes[1])
+        print("TestTelemetryLedger: OK.")
+
+
+if __name__ == '__main__':
+    # Query a ledger: python TelemetryLedger.py <ledger> [group by fields...]
+    if len(sys.argv) >= 2:
+        fields = tuple(sys.argv[2:]) if len(sys.argv) > 2 else ('policy', 'size', 'loadBin')
+        print(formatQuery(queryLedger(readLedger(sys.argv[1]), groupBy=fields), groupBy=fields))
+    else:
+        ut.main()
@@ -0,0 +1,259 @@
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import multiprocessing
+import numpy as np
+import unittest as ut
+from TelemetryLedger import getPeakRSS
+
+SIZES = [1, 2, 3, 4, 16, 64, 256]
+REDUNDANCIES = [1, 2, 4]
+LOADS = [0.3, 0.7, 0.95]
+ALPHA = 10
+BETA = 100
+P = 0.8
+
+
+##
+# Parameters of every dispatch policy for a network of @n queues and redundancy @d, or None if the policy does not
+# apply (d does not fit n, or d is not a parameter of the policy and d > 1).
+##
+def getPolicyParams(policyName, n, d):
+    jobSizes = {'alpha': ALPHA, 'beta': BETA, 'p': P}
+    if policyName in ('RandomQueueStrategy', 'JoinShortestWorkloadStrategy', 'RouteToAllStrategy',
+                      'RouteToIdleQueuesStrategy'):
+        return jobSizes if d == 1 else None
+    if policyName == 'OneQueueFixedServiceRateStrategy':
+        return {'alpha': ALPHA, 'mu': 1.0 / (ALPHA * P + BETA * (1.0 - P)), 'p': P} if d == 1 else None
+    if policyName == 'OnlyFirstQueueGetsJobsStrategy':
+        return dict(jobSizes, n=n) if d == 1 else None
+    if policyName == 'VolunteerOrTeamworkStrategy':
+        return dict(jobSizes, q=0.5) if d == 1 else None
+    if d > n:
+        return None
+    if policyName == 'FixedSubsetsStrategy':
+        return dict(jobSizes, redundancy=d) if n % d == 0 else None
+    if policyName == 'RandomDStrategy':
+        return dict(jobSizes, d=d)
+    if policyName == 'GeometricDeltaRandomDStrategy':
+        return {'alpha': ALPHA, 'p': 1.0 / BETA, 'd': d, 'n': n}
+    if policyName == 'RoundRobinRedundancyDStrategy':
+        return dict(jobSizes, d=d, n=n)
+    return None
+
+
+def getPolicyNames():
+    import DispatchPolicyStrategy
+    return sorted(name for name, cls in vars(DispatchPolicyStrategy).items()
+                  if isinstance(cls, type) and issubclass(cls, DispatchPolicyStrategy.DispatchPolicyStrategyAbstract)
+                  and cls is not DispatchPolicyStrategy.DispatchPolicyStrategyAbstract)
+
+
+##
+# The slot loop of QueueNetworkSimulation.runPoint.
+##
+def runSlotLoop(spec):
+    return spec.run()[1]
+
+
+def runEventSkipping(spec):
+    from EventSkippingEngine import EventSkippingEngine
+    return EventSkippingEngine().run(spec)[1]
+
+
+def runEventSkippingGeometric(spec):
+    from EventSkippingEngine import EventSkippingEngine
+    return EventSkippingEngine(exactArrivals=False).run(spec)[1]
+
+
+# Engines that simulate a round of a spec and return its diagnostics (slots and wallTime at least). Engines other
+# than the slot loop are checked against it by EngineDifferential.
+ENGINES = {'slotLoop': runSlotLoop,
+           'eventSkipping': runEventSkipping,
+           'eventSkippingGeometric': runEventSkippingGeometric}
+
+
+def getCaseId(case):
+    return case['policy'] + ",n=" + str(case['size']) + ",d=" + str(case['d']) + ",load=" + str(case['load']) + \
+           ",engine=" + case['engine']
+
+
+##
+# Get the benchmark cases: every policy (all of them by default) for every size, redundancy, load and engine.
+##
+def getCases(policies=None, sizes=SIZES, redundancies=REDUNDANCIES, loads=LOADS, engines=None, slots=20000):
+    cases = []
+    for policyName in (policies if policies else getPolicyNames()):
+        for n in sizes:
+            for d in redundancies:
+                params = getPolicyParams(policyName, n, d)
+                if params is None:
+                    continue
+                for load in loads:
+                    for engine in (engines if engines else sorted(ENGINES)):
+                        cases.append({'policy': policyName, 'params': params, 'size': n, 'd': d, 'load': load,
+                                      'engine': engine, 'slots': slots})
+    return cases
+
+
+##
+# Run a single case (in the calling process) and return its result: slots per second and peak memory.
+# At most one job arrives per slot, so on networks whose effective service rate exceeds 1 the arrival rate is capped
+# at 1 and the load actually simulated ('effectiveLoad') is lower than the case's load.
+# A case that raises is reported with its 'error' instead of stopping the benchmark.
+##
+def runCase(case):
+    try:
+        return measureCase(case)
+    except Exception as e:
+        result = dict(case)
+        result.update({'id': getCaseId(case), 'error': e.__class__.__name__ + ": " + str(e), 'slotsPerSecond': None,
+                       'peakRSS': None})
+        return result
+
+
+def measureCase(case):
+    import DispatchPolicyStrategy
+    from SimulationSpec import SimulationSpec
+    from QueueNetwork import QueueNetwork
+    baseRSS = getPeakRSS()
+    policy = getattr(DispatchPolicyStrategy, case['policy'])(**case['params'])
+    effectiveServiceRate = policy.getEffectiveServiceRate(QueueNetwork(case['size']))
+    arrivalRate = min(case['load'] * effectiveServiceRate, 1.0)
+    # Every case runs exactly its number of slots: T_max ends the round before the convergence condition does.
+    spec = SimulationSpec(case['size'], case['policy'], case['params'], "RunForXSlotsConvergenceStrategy",
+                          {'x': 2 * case['slots']}, arrivalRate, effectiveServiceRate, seed=0,
+                          historyWindowSize=min(10000, case['slots']), T_max=case['slots'])
+    diagnostics = ENGINES[case['engine']](spec)
+    result = dict(case)
+    result['id'] = getCaseId(case)
+    result['arrivalRate'] = arrivalRate
+    result['effectiveLoad'] = arrivalRate / effectiveServiceRate
+    result['slots'] = diagnostics['slots']
+    result['wallTime'] = diagnostics['wallTime']
+    result['slotsPerSecond'] = diagnostics['slots'] / diagnostics['wallTime'] if diagnostics['wallTime'] > 0 else None
+    result['peakRSS'] = getPeakRSS()
+    result['peakRSSIncrease'] = result['peakRSS'] - baseRSS if baseRSS is not None else None
+    return result
+
+
+##
+# Run the cases, each in a fresh process so that its peak memory is its own. Returns the results document.
+##
+def runBenchmark(cases, verbose=False):
+    results = []
+    pool = multiprocessing.Pool(processes=1, maxtasksperchild=1)
+    try:
+        for result in pool.imap(runCase, cases):
+            if verbose and 'error' in result:
+                print("WARN:    " + result['id'].ljust(64) + " failed: " + result['error'])
+            elif verbose:
+                print("INFO:    " + result['id'].ljust(64) + ("%.0f" % result['slotsPerSecond']).rjust(10) +
+                      " slots/sec" + ("%.1f" % (result['peakRSS'] / 2.0 ** 20)).rjust(8) + " MB")
+            results.append(result)
+    finally:
+        pool.close()
+        pool.join()
+    return {'metadata': {'time': time.time(),
+                         'host': socket.gethostname(),
+                         'python': platform.python_version(),
+                         'numpy': np.__version__,
+                         'machine': platform.machine()},
+            'results': results}
+
+
+##
+# Compare @benchmark to @baseline (both results documents). A case regressed if its slots per second dropped, or its
+# peak memory grew, by more than @tolerance (a fraction). Returns the regressions, worst first.
+##
+def compareToBaseline(benchmark, baseline, tolerance=0.1):
+    baselineResults = dict((result['id'], result) for result in baseline['results'])
+    regressions = []
+    for result in benchmark['results']:
+        before = baselineResults.get(result['id'])
+        if before is None:
+            continue
+        if 'error' in result and 'error' not in before:
+            regressions.append({'id': result['id'], 'metric': 'error', 'baseline': None, 'value': result['error'],
+                                'change': float('-inf')})
+            continue
+        if before['slotsPerSecond'] and result['slotsPerSecond'] is not None:
+            change = result['slotsPerSecond'] / before['slotsPerSecond'] - 1.0
+            if change < -tolerance:
+                regressions.append({'id': result['id'], 'metric': 'slotsPerSecond',
+                                    'baseline': before['slotsPerSecond'], 'value': result['slotsPerSecond'],
+                                    'change': change})
+        if before.get('peakRSS') and result.get('peakRSS') is not None:
+            change = float(result['peakRSS']) / before['peakRSS'] - 1.0
+            if change > tolerance:
+                regressions.append({'id': result['id'], 'metric': 'peakRSS', 'baseline': before['peakRSS'],
+                                    'value': result['peakRSS'], 'change': change})
+    return sorted(regressions, key=lambda regression: -abs(regression['change']))
+
+
+def readResults(filename):
+    with open(filename, "r") as fd:
+        return json.load(fd)
+
+
+def writeResults(filename, benchmark):
+    with open(filename, "w") as fd:
+        json.dump(benchmark, fd, indent=1, sort_keys=True)
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestThroughputBenchmark(ut.TestCase):
+    def runTest(self):
+        import copy
+        cases = getCases(sizes=[1, 4], redundancies=[1, 2], loads=[0.5], slots=2000)
+        policies = set(case['policy'] for case in cases)
+        self.assertEqual(policies, set(getPolicyNames()))
+        self.assertEqual(len([case for case in cases if case['policy'] == 'RandomDStrategy']), 3 * len(ENGINES))
+        self.assertIsNone(getPolicyParams('FixedSubsetsStrategy', 3, 2))
+        self.assertEqual(getPolicyParams('RoundRobinRedundancyDStrategy', 256, 4)['n'], 256)
+        benchmark = runBenchmark([case for case in cases
+                                  if case['policy'] in ('RandomDStrategy', 'RouteToAllStrategy')])
+        self.assertEqual(len(benchmark['results']), 5 * len(ENGINES))
+        for result in benchmark['results']:
+            self.assertEqual(result['slots'], 2000)
+            self.assertGreater(result['slotsPerSecond'], 0)
+            self.assertGreater(result['peakRSS'], 0)
+        self.assertEqual(compareToBaseline(benchmark, benchmark), [])
+        baseline = copy.deepcopy(benchmark)
+        baseline['results'][0]['slotsPerSecond'] *= 2
+        regressions = compareToBaseline(benchmark, baseline)
+        self.assertEqual([(regression['id'], regression['metric']) for regression in regressions],
+                         [(benchmark['results'][0]['id'], 'slotsPerSecond')])
+        print("TestThroughputBenchmark: OK.")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        ut.main()
+    parser = argparse.ArgumentParser(description="Measure simulator throughput (slots/sec) and peak memory.")
+    parser.add_argument('--policies', nargs='*', help="dispatch policy class names (default: all)")
+    parser.add_argument('--sizes', nargs='*', type=int, default=SIZES)
+    parser.add_argument('--redundancies', nargs='*', type=int, default=REDUNDANCIES)
+    parser.add_argument('--loads', nargs='*', type=float, default=LOADS)
+    parser.add_argument('--engines', nargs='*', help="engines (default: all of " + ", ".join(sorted(ENGINES)) + ")")
+    parser.add_argument('--slots', type=int, default=20000, help="slots simulated per case")
+    parser.add_argument('--output', help="write the results (JSON) to this file")
+    parser.add_argument('--baseline', help="compare against the results in this file")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+    benchmark = runBenchmark(getCases(args.policies, args.sizes, args.redundancies, args.loads, args.engines,
+                                      args.slots), verbose=True)
+    if args.output:
+        writeResults(args.output, benchmark)
+    if args.baseline:
+        regressions = compareToBaseline(benchmark, readResults(args.baseline), args.tolerance)
+        for regression in regressions:
+            print("WARN:    Regression " + regression['id'] + ": " + regression['metric'] + " " +
+                  str(regression['baseline']) + " -> " + str(regression['value']) + \
+                  " (" + "%+.1f%%" % (100.0 * regression['change']) + ")")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,247 @@
+import os
+import json
+import numpy as np
+import unittest as ut
+
+# Byte order of the packed arrival bits and type of the job sizes in trace files.
+ARRIVALS_BITORDER = 'big'
+SIZE_DTYPE = '<u4'
+
+
+##
+# Get the files of the trace @prefix: its metadata, its arrivals and its job sizes.
+##
+def getTraceFiles(prefix):
+    return prefix + ".json", prefix + ".arrivals", prefix + ".sizes"
+
+
+class TraceWriter:
+    """Writes a trace of recorded arrivals and job sizes in chunks, so traces larger than memory can be written.
+    A trace is three files: <prefix>.arrivals holds an arrival indicator per slot (1 bit, packed), <prefix>.sizes the
+    size of every job copy dispatched (uint32, little endian) in the order they are used, and <prefix>.json the counts
+    and moments (see Trace)."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        (metadataFile, arrivalsFile, sizesFile) = getTraceFiles(prefix)
+        self.arrivalsFd = open(arrivalsFile, "wb")
+        self.sizesFd = open(sizesFile, "wb")
+        self.slots = 0
+        self.arrivals = 0
+        self.jobs = 0
+        self.sizeSum = 0.0
+        self.sizeSquareSum = 0.0
+        # Arrival bits of the last partial byte.
+        self.pending = np.zeros(0, dtype=bool)
+
+    def appendArrivals(self, arrivals):
+        arrivals = np.asarray(arrivals, dtype=bool)
+        self.slots += len(arrivals)
+        self.arrivals += int(np.count_nonzero(arrivals))
+        arrivals = np.concatenate([self.pending, arrivals])
+        whole = len(arrivals) - len(arrivals) % 8
+        self.arrivalsFd.write(np.packbits(arrivals[:whole], bitorder=ARRIVALS_BITORDER).tobytes())
+        self.pending = arrivals[whole:]
+
+    def appendSizes(self, sizes):
+        sizes = np.asarray(sizes)
+        if len(sizes) and (sizes.min() < 0 or sizes.max() > np.iinfo(np.uint32).max):
+            raise Exception("Job sizes of a trace must fit in 32 unsigned bits")
+        self.sizesFd.write(sizes.astype(SIZE_DTYPE).tobytes())
+        self.jobs += len(sizes)
+        self.sizeSum += float(np.sum(sizes, dtype=float))
+        self.sizeSquareSum += float(np.sum(np.asarray(sizes, dtype=float) ** 2))
+
+    def close(self):
+        self.arrivalsFd.write(np.packbits(self.pending, bitorder=ARRIVALS_BITORDER).tobytes())
+        self.arrivalsFd.close()
+        self.sizesFd.close()
+        metadata = {'slots': self.slots, 'arrivals': self.arrivals, 'jobs': self.jobs,
+                    'meanSize': self.sizeSum / self.jobs if self.jobs else 0.0,
+                    'secondMoment': self.sizeSquareSum / self.jobs if self.jobs else 0.0}
+        with open(getTraceFiles(self.prefix)[0], "w") as fd:
+            json.dump(metadata, fd, indent=1, sort_keys=True)
+
+
+##
+# Write the trace @prefix of @arrivals (one indicator per slot) and job @sizes at once (see TraceWriter).
+##
+def writeTrace(prefix, arrivals, sizes):
+    writer = TraceWriter(prefix)
+    writer.appendArrivals(arrivals)
+    writer.appendSizes(sizes)
+    writer.close()
+
+
+class Trace:
+    """A recorded trace (see TraceWriter), read through read-only memory maps: only the chunks read are paged in, and
+    processes that map the same files share their pages through the OS page cache instead of holding a copy each.
+    A Trace pickles as its prefix and maps the files again where it is unpickled (e.g. in a parSim worker); use
+    openTrace to map a trace once per process."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(getTraceFiles(prefix)[0], "r") as fd:
+            self.metadata = json.load(fd)
+        self.arrivalMap = None
+        self.sizeMap = None
+
+    def __getstate__(self):
+        return {'prefix': self.prefix, 'metadata': self.metadata, 'arrivalMap': None, 'sizeMap': None}
+
+    def getPrefix(self):
+        return self.prefix
+
+    def getSlots(self):
+        return self.metadata['slots']
+
+    def getJobs(self):
+        return self.metadata['jobs']
+
+    def getArrivalRate(self):
+        return float(self.metadata['arrivals']) / self.metadata['slots'] if self.metadata['slots'] else 0.0
+
+    def getMeanSize(self):
+        return self.metadata['meanSize']
+
+    def getSecondMoment(self):
+        return self.metadata['secondMoment']
+
+    ##
+    # Map a file of the trace (an empty file cannot be mapped, so it reads as an empty array).
+    ##
+    @staticmethod
+    def mapFile(filename, dtype):
+        if os.path.getsize(filename) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r')
+
+    ##
+    # Get the arrival indicators of the @count slots from slot @start. Slots after the end of the trace have none.
+    ##
+    def getArrivals(self, start, count):
+        if self.arrivalMap is None:
+            self.arrivalMap = self.mapFile(getTraceFiles(self.prefix)[1], np.uint8)
+        end = min(start + count, self.getSlots())
+        arrivals = np.zeros(count, dtype=bool)
+        if start < end:
+            packed = self.arrivalMap[start // 8:(end + 7) // 8]
+            bits = np.unpackbits(packed, bitorder=ARRIVALS_BITORDER).astype(bool)
+            arrivals[:end - start] = bits[start % 8:start % 8 + end - start]
+        return arrivals
+
+    ##
+    # Get the @count job sizes from job @start, wrapping around at the end of the trace.
+    ##
+    def getSizes(self, start, count):
+        if self.sizeMap is None:
+            self.sizeMap = self.mapFile(getTraceFiles(self.prefix)[2], SIZE_DTYPE)
+        if self.getJobs() == 0:
+            raise Exception("Trace " + self.prefix + " has no job sizes")
+        indices = (start + np.arange(count)) % self.getJobs()
+        if count and indices[0] + count <= self.getJobs():
+            return np.array(self.sizeMap[indices[0]:indices[0] + count], dtype=np.int64)
+        return np.array(self.sizeMap[indices], dtype=np.int64)
+
+    ##
+    # Get the distinct job sizes of the trace and their frequencies, reading it @chunk sizes at a time.
+    ##
+    def getSizeHistogram(self, chunk=1 << 22):
+        counts = {}
+        for start in range(0, self.getJobs(), chunk):
+            (values, frequencies) = np.unique(self.getSizes(start, min(chunk, self.getJobs() - start)),
+                                              return_counts=True)
+            for value, frequency in zip(values.tolist(), frequencies.tolist()):
+                counts[value] = counts.get(value, 0) + frequency
+        values = sorted(counts)
+        return values, [counts[value] / float(self.getJobs()) for value in values]
+
+    ##
+    # Get a stream of the arrivals from the first slot (see TraceArrivals).
+    ##
+    def getArrivalStream(self):
+        return TraceArrivals(self)
+
+
+class TraceArrivals:
+    """Replays the arrivals of a trace slot after slot. draw has the signature of QueueNetworkSimulation.drawArrivals,
+    so a simulation draws its arrivals from the trace (in windows, like it draws them at random) instead of from its
+    generator; the arrival rate is the trace's."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.position = 0
+
+    def draw(self, generator, slots, arrivalRate):
+        arrivals = self.trace.getArrivals(self.position, slots)
+        self.position += slots
+        return arrivals
+
+
+# Traces mapped by this process (see openTrace).
+openTraces = {}
+
+
+##
+# Get the trace @prefix, mapped once per process.
+##
+def openTrace(prefix):
+    if prefix not in openTraces:
+        openTraces[prefix] = Trace(prefix)
+    return openTraces[prefix]
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestTraceSource(ut.TestCase):
+    def runTest(self):
+        import pickle
+        import tempfile
+        from RandomStreams import getGenerator
+        prefix = os.path.join(tempfile.mkdtemp(), "trace")
+        generator = getGenerator(1)
+        arrivals = generator.random(10007) < 0.3
+        sizes = generator.integers(1, 500, 5000)
+        # Written in chunks that do not end on byte boundaries.
+        writer = TraceWriter(prefix)
+        for start in range(0, len(arrivals), 999):
+            writer.appendArrivals(arrivals[start:start + 999])
+        writer.appendSizes(sizes[:1234])
+        writer.appendSizes(sizes[1234:])
+        writer.close()
+        trace = Trace(prefix)
+        self.assertEqual((trace.getSlots(), trace.getJobs()), (10007, 5000))
+        self.assertAlmostEqual(trace.getArrivalRate(), np.mean(arrivals))
+        self.assertAlmostEqual(trace.getMeanSize(), np.mean(sizes))
+        self.assertTrue(np.array_equal(trace.getArrivals(0, 10007), arrivals))
+        self.assertTrue(np.array_equal(trace.getArrivals(13, 50), arrivals[13:63]))
+        self.assertTrue(np.array_equal(trace.getArrivals(10000, 10), np.append(arrivals[10000:], [False] * 3)))
+        self.assertTrue(np.array_equal(trace.getSizes(4998, 4), np.append(sizes[4998:], sizes[:2])))
+        (values, probabilities) = trace.getSizeHistogram(chunk=1000)
+        self.assertEqual(values, sorted(set(sizes.tolist())))
+        self.assertAlmostEqual(sum(probabilities), 1.0)
+        stream = trace.getArrivalStream()
+        self.assertTrue(np.array_equal(np.concatenate([stream.draw(None, 100, 0.0) for i in range(5)]),
+                                       arrivals[:500]))
+        # A pickled trace carries no data, and maps the files again.
+        copy = pickle.loads(pickle.dumps(trace))
+        self.assertLess(len(pickle.dumps(trace)), 1000)
+        self.assertTrue(np.array_equal(copy.getSizes(0, 100), sizes[:100]))
+        self.assertIs(openTrace(prefix), openTrace(prefix))
+        # A round replaying the trace runs the same on both engines, and its spec pickles as the prefix.
+        from SimulationSpec import SimulationSpec
+        from EventSkippingEngine import EventSkippingEngine
+        spec = SimulationSpec(4, "RandomDStrategy", {'d': 2, 'jobSizes': {'kind': 'trace', 'trace': prefix}},
+                              "VarianceConvergenceStrategy", {'epsilon': 0.01}, trace.getArrivalRate(), 4.0, seed=3,
+                              historyWindowSize=1000, T_max=trace.getSlots(), arrivalTrace=prefix)
+        spec = pickle.loads(pickle.dumps(spec))
+        (estimate, diagnostics) = spec.run()
+        self.assertGreater(estimate, 0.0)
+        self.assertEqual(EventSkippingEngine().run(spec)[0], estimate)
+        self.assertFalse(EventSkippingEngine(exactArrivals=False).supports(spec))
+        print("TestTraceSource: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
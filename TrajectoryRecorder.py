@@ -0,0 +1,224 @@
+import json
+import os
+import numpy as np
+import unittest as ut
+
+
+##
+# This class records workload trajectories of a simulation round to disk. See example in the test below.
+# Rows are written to a memory-mapped file that is flushed every few rows, so the amount of RAM used is bounded by the
+# flush interval no matter how many time slots are simulated.
+##
+class TrajectoryRecorder:
+    """Records decimated total and per-queue workload trajectories and cumulative workload checkpoints."""
+
+    ##
+    # Initialize a recorder writing files named @filePrefix + "_lambda=<arrival rate>.{traj,ckpt,json}".
+    # @mode is either 'stride' (keep every @stride-th slot) or 'block' (keep the average of every block of @stride
+    # slots). @checkpointInterval is the number of slots between cumulative workload checkpoints (defaults to @stride).
+    # @perQueue controls whether per-queue workloads are recorded next to the total workload.
+    ##
+    def __init__(self, filePrefix, stride=1000, mode='stride', checkpointInterval=None, perQueue=True,
+                 flushEvery=4096):
+        if int(stride) < 1:
+            raise Exception("Invalid stride of " + str(stride))
+        if mode not in ['stride', 'block']:
+            raise Exception("Invalid recording mode " + str(mode))
+        self.filePrefix = filePrefix
+        self.stride = int(stride)
+        self.mode = mode
+        self.checkpointInterval = int(checkpointInterval) if checkpointInterval else self.stride
+        self.perQueue = perQueue
+        self.flushEvery = int(flushEvery)
+        self.trajectory = None
+        self.checkpoints = None
+
+    ##
+    # Get the base path (without extension) of the files recorded for @arrivalRate.
+    ##
+    def getPath(self, arrivalRate):
+        return self.filePrefix + "_lambda=" + repr(float(arrivalRate))
+
+    ##
+    # Open the files of a new round. @maxSlots bounds the number of slots the round can simulate.
+    ##
+    def start(self, network, arrivalRate, maxSlots):
+        self.path = self.getPath(arrivalRate)
+        self.size = network.getSize()
+        self.arrivalRate = float(arrivalRate)
+        self.columns = 2 + (self.size if self.perQueue else 0)
+        self.rows = 0
+        self.numOfCheckpoints = 0
+        self.integral = 0.0
+        self.blockSlots = 0
+        self.blockTotal = 0.0
+        self.blockQueues = np.zeros(self.size)
+        self.trajectory = np.memmap(self.path + ".traj", dtype=np.float64, mode='w+',
+                                    shape=(int(maxSlots) // self.stride + 1, self.columns))
+        self.checkpoints = np.memmap(self.path + ".ckpt", dtype=np.float64, mode='w+',
+                                     shape=(int(maxSlots) // self.checkpointInterval + 1, 2))
+        self.writeMetadata()
+
+    ##
+    # Record the network state at the end of time slot @t (after the slot's service was given).
+    ##
+    def record(self, t, network):
+        total = network.getTotalWorkload()
+        self.integral += total
+        slots = t + 1
+        if self.mode == 'stride':
+            if t % self.stride == 0:
+                self.writeRow(slots, total, network.getWorkloads() if self.perQueue else None)
+        else:
+            self.blockTotal += total
+            if self.perQueue:
+                self.blockQueues += network.getWorkloads()
+            self.blockSlots += 1
+            if self.blockSlots == self.stride:
+                self.writeRow(slots, self.blockTotal / self.blockSlots,
+                              self.blockQueues / self.blockSlots if self.perQueue else None)
+                self.blockSlots = 0
+                self.blockTotal = 0.0
+                self.blockQueues[:] = 0
+        if slots % self.checkpointInterval == 0:
+            self.checkpoints[self.numOfCheckpoints] = [slots, self.integral]
+            self.numOfCheckpoints += 1
+
+    def writeRow(self, slots, total, workloads):
+        row = self.trajectory[self.rows]
+        row[0] = slots
+        row[1] = total
+        if workloads is not None:
+            row[2:] = workloads
+        self.rows += 1
+        if self.rows % self.flushEvery == 0:
+            self.trajectory.flush()
+            self.checkpoints.flush()
+            self.writeMetadata()
+
+    def writeMetadata(self):
+        with open(self.path + ".json", "w") as fd:
+            json.dump({'size': self.size,
+                       'arrivalRate': self.arrivalRate,
+                       'mode': self.mode,
+                       'stride': self.stride,
+                       'perQueue': self.perQueue,
+                       'columns': self.columns,
+                       'rows': self.rows,
+                       'checkpointInterval': self.checkpointInterval,
+                       'checkpoints': self.numOfCheckpoints}, fd)
+
+    ##
+    # Close the files of the current round and trim them to the recorded length.
+    ##
+    def finish(self):
+        if self.trajectory is None:
+            return
+        self.trajectory.flush()
+        self.checkpoints.flush()
+        self.trajectory = None
+        self.checkpoints = None
+        for ext, length in [(".traj", self.rows * self.columns * 8), (".ckpt", self.numOfCheckpoints * 2 * 8)]:
+            with open(self.path + ext, "r+b") as fd:
+                fd.truncate(length)
+        self.writeMetadata()
+
+
+##
+# Load a recorded round given its base path (see TrajectoryRecorder.getPath).
+# Returns the metadata dictionary, a read-only memory map of the trajectory rows (slot, total workload, per-queue
+# workloads...) and a read-only memory map of the checkpoint rows (slot, cumulative workload).
+##
+def loadTrajectory(path):
+    with open(path + ".json", "r") as fd:
+        metadata = json.load(fd)
+    trajectory = np.zeros((0, metadata['columns']))
+    checkpoints = np.zeros((0, 2))
+    if metadata['rows'] > 0:
+        trajectory = np.memmap(path + ".traj", dtype=np.float64, mode='r', shape=(metadata['rows'],
+                                                                                 metadata['columns']))
+    if metadata['checkpoints'] > 0:
+        checkpoints = np.memmap(path + ".ckpt", dtype=np.float64, mode='r', shape=(metadata['checkpoints'], 2))
+    return metadata, trajectory, checkpoints
+
+
+class RecordedTime:
+    """Stands in for the network when replaying a convergence condition; only the time is needed."""
+
+    def __init__(self, time=0):
+        self.time = time
+
+    def getTime(self):
+        return self.time
+
+
+##
+# Re-evaluate a convergence condition offline from recorded checkpoints.
+# The running average workload is reconstructed at every checkpoint as (cumulative workload / slots), and every
+# @windowSize slots (from @T_min on, exactly like the simulation does) the condition is asked whether the running
+# averages inside the last window have converged.
+# Returns the number of slots after which the condition would have stopped the round (None if it never would have)
+# and the estimate it would have reported.
+##
+def replayConvergence(path, convergenceConditionStrategy, windowSize, T_min, T_max):
+    metadata, trajectory, checkpoints = loadTrajectory(path)
+    if windowSize % metadata['checkpointInterval'] != 0:
+        raise Exception("Window size must be a multiple of the checkpoint interval")
+    perWindow = windowSize // metadata['checkpointInterval']
+    runningAvg = checkpoints[:, 1] / checkpoints[:, 0]
+    clock = RecordedTime()
+    for k in range(perWindow - 1, len(checkpoints), perWindow):
+        slots = int(checkpoints[k, 0])
+        clock.time = slots - 1
+        if clock.time < T_min:
+            continue
+        window = runningAvg[k - perWindow + 1:k + 1]
+        if convergenceConditionStrategy.hasConverged(clock, [window], T_min, T_max):
+            return slots, float(np.mean(window))
+    return None, float(np.mean(runningAvg[-perWindow:])) if len(runningAvg) else 0.0
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class TestTrajectoryRecorder(ut.TestCase):
+    def runTest(self):
+        import tempfile
+        from QueueNetwork import QueueNetwork
+        from ConvergenceConditionStrategy import RunForXSlotsConvergenceStrategy
+        directory = tempfile.mkdtemp()
+        network = QueueNetwork(2)
+        strided = TrajectoryRecorder(os.path.join(directory, "strided"), stride=3, checkpointInterval=2)
+        blocked = TrajectoryRecorder(os.path.join(directory, "blocked"), stride=3, mode='block', perQueue=False)
+        strided.start(network, 0.5, 10)
+        blocked.start(network, 0.5, 10)
+        totals = []
+        for t in range(10):
+            if t % 4 == 0:
+                network.addWorkload([0, 1], [5, 2])
+            network.endTimeSlot()
+            totals.append(network.getTotalWorkload())
+            strided.record(t, network)
+            blocked.record(t, network)
+            network.advanceTimeSlot()
+        strided.finish()
+        blocked.finish()
+        metadata, trajectory, checkpoints = loadTrajectory(strided.getPath(0.5))
+        self.assertEqual(metadata['rows'], 4)
+        self.assertEqual(list(trajectory[:, 0]), [1, 4, 7, 10])
+        self.assertEqual(list(trajectory[:, 1]), [totals[0], totals[3], totals[6], totals[9]])
+        self.assertEqual(list(trajectory[0, 2:]), [4, 1])
+        self.assertEqual(list(checkpoints[:, 0]), [2, 4, 6, 8, 10])
+        self.assertEqual(checkpoints[-1, 1], sum(totals))
+        self.assertEqual(os.path.getsize(strided.getPath(0.5) + ".traj"), 4 * 4 * 8)
+        metadata, trajectory, checkpoints = loadTrajectory(blocked.getPath(0.5))
+        self.assertEqual(trajectory.shape, (3, 2))
+        self.assertAlmostEqual(trajectory[1, 1], sum(totals[3:6]) / 3.0)
+        slots, estimate = replayConvergence(strided.getPath(0.5), RunForXSlotsConvergenceStrategy(8), 4, 0, 10)
+        self.assertEqual(slots, 8)
+        self.assertAlmostEqual(estimate, (sum(totals[:6]) / 6.0 + sum(totals[:8]) / 8.0) / 2.0)
+        print("TestTrajectoryRecorder: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
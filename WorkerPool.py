@@ -0,0 +1,164 @@
+import os
+import datetime
+import traceback
+import multiprocessing
+import unittest as ut
+from TaskScheduler import getNumOfCPUs
+
+
+##
+# Initializer of every worker: import the simulation modules once and create the worker's simulation cache.
+##
+def warmUp():
+    import QueueNetworkSimulation
+    import DispatchPolicyStrategy
+    import ConvergenceConditionStrategy
+    import SimulationSpec
+    import SharedResults
+    warmUp.simulations = {}
+
+
+##
+# Get the failure record of a round of @spec (a SimulationSpec) that failed with @error (an exception class name),
+# @message and @trace (a formatted traceback).
+##
+def getFailureRecord(spec, error, message, trace=''):
+    return {'error': error,
+            'message': message,
+            'traceback': trace,
+            'seed': spec.seed,
+            'time': str(datetime.datetime.now())}
+
+
+##
+# Get a ready-to-run simulation for @spec in a worker. Simulations are cached per structure (see
+# SimulationSpec.getStructureKey), so back-to-back rounds and sweeps reuse the worker's allocated buffers.
+##
+def getWarmSimulation(spec):
+    if not hasattr(warmUp, 'simulations'):
+        warmUp.simulations = {}
+    return spec.prepare(cache=warmUp.simulations)
+
+
+class WorkerPool:
+    """A long-lived pool of warm simulation workers. Create one and pass it to any number of parSweep/parRun calls,
+    which then submit their rounds to it instead of starting and tearing down a pool of their own."""
+
+    def __init__(self, processes=None):
+        self.processes = processes if processes else getNumOfCPUs()
+        self.pool = multiprocessing.Pool(processes=self.processes, initializer=warmUp)
+        # The tasks submitted and not known to be finished, and those dropped (see dropTask).
+        self.handles = []
+        self.dropped = []
+
+    def getProcesses(self):
+        return self.processes
+
+    ##
+    # Apply @func to every task; results are yielded in completion order and workers pull one task at a time.
+    ##
+    def imapUnordered(self, func, tasks):
+        return self.pool.imap_unordered(func, tasks, chunksize=1)
+
+    ##
+    # Submit a single task. @func is a module-level function taking (block, spec), like parSim.singleRun, and
+    # @callback is called (in the driver) with its result. If the task raises in a way @func does not catch (or its
+    # result cannot be sent back), @callback is called with (spec.task, failure record) instead.
+    ##
+    def submit(self, func, args, callback):
+        spec = args[1]
+
+        def reportError(error):
+            trace = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+            callback((spec.task, getFailureRecord(spec, error.__class__.__name__, str(error), trace)))
+        handle = self.pool.apply_async(func, (args,), callback=callback, error_callback=reportError)
+        self.handles = [other for other in self.handles if not other.ready()] + [handle]
+        return handle
+
+    ##
+    # Whether the worker process @pid (see SharedSweepBlock.startTask) is still running. A worker that dies in the
+    # middle of a task never reports it, so the driver watches its workers.
+    ##
+    def isWorkerAlive(self, pid):
+        return int(pid) in [process.pid for process in multiprocessing.active_children()]
+
+    ##
+    # Give up on the task @handle (see submit) run by the worker process @pid: the worker is stopped if it still runs
+    # (e.g. hung), and the pool starts a new one in its place. A task whose worker is gone never finishes, so the pool
+    # no longer waits for it.
+    ##
+    def dropTask(self, handle, pid):
+        self.dropped.append(handle)
+        for process in multiprocessing.active_children():
+            if process.pid == int(pid):
+                process.terminate()
+
+    def apply(self, func, args=()):
+        return self.pool.apply(func, args)
+
+    ##
+    # Stop accepting work and wait for the workers to finish the submitted tasks.
+    ##
+    def close(self):
+        self.pool.close()
+        for handle in self.handles:
+            if not any(handle is dropped for dropped in self.dropped):
+                handle.wait()
+        # The pool would wait forever for a dropped task.
+        if self.dropped:
+            self.pool.terminate()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+def getWorkerState(spec):
+    sim = getWarmSimulation(spec)
+    return os.getpid(), id(sim), id(sim.statsCollector.getWindowStats().getWindow())
+
+
+class TestWorkerPool(ut.TestCase):
+    def runTest(self):
+        from SimulationSpec import SimulationSpec
+        spec = SimulationSpec(2, "RandomQueueStrategy", {'alpha': 10, 'beta': 100, 'p': 0.8},
+                              "RunForXSlotsConvergenceStrategy", {'x': 2000}, 0.05, 0.1, historyWindowSize=1000)
+        with WorkerPool(processes=1) as pool:
+            first = pool.apply(getWorkerState, (spec,))
+            spec.arrivalRate = 0.02
+            second = pool.apply(getWorkerState, (spec,))
+            # Same warm worker, same simulation object and the same statistics buffer.
+            self.assertEqual(first, second)
+            spec.historyWindowSize = 500
+            self.assertNotEqual(pool.apply(getWorkerState, (spec,))[1], first[1])
+        print("TestWorkerPool: OK.")
+
+
+class TestWorkerImports(ut.TestCase):
+    def runTest(self):
+        import sys
+        import subprocess
+        # A worker imports the engine with numpy only: no plotting, and nothing runs on import.
+        script = "import sys, WorkerPool, parSim; WorkerPool.warmUp(); " + \
+                 "print(sorted(set(m.split('.')[0] for m in sys.modules) & set(['matplotlib', 'PlotRenderer'])))"
+        output = subprocess.check_output([sys.executable, "-c", script],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)) or None).decode('ascii')
+        self.assertEqual(output.strip(), "[]")
+        print("TestWorkerImports: OK.")
+
+
+if __name__ == '__main__':
+    ut.main()
@@ -1,4 +1,9 @@
+import sys
 import numpy as np
+import matplotlib
+# Given an output file (python find_abpu.py <figure.png|pdf>) the figure is rendered to it headless instead of shown.
+if len(sys.argv) > 1:
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
 ########################################################################################################################
@@ -111,4 +116,7 @@ plt.title(r'The throughput of a system of 4 queues for different redundancy leve
           wrap=True)
 # plt.figtext(0.5, 0.03, r'$\alpha=$' + str(int(alpha)) + r', $\beta=$' + str(int(beta)) + r', $n=4$', wrap=True,
 #             horizontalalignment='center', fontsize=8)
-plt.show()
+if len(sys.argv) > 1:
+    plt.savefig(sys.argv[1])
+else:
+    plt.show()
@@ -1,26 +1,58 @@
 import time
+import functools
+import traceback
+import queue
 import datetime
 import os
 import numpy as np
 import multiprocessing
-import matplotlib.pyplot as plt
+import unittest as ut
 import QueueNetworkSimulation as qns
+from ResultLog import ResultLog, readResultLog, writeDump
+from SimulationSpec import SimulationSpec
+from TaskScheduler import TaskScheduler, CostModel
+from SharedResults import SharedSweepBlock
+from WorkerPool import WorkerPool, getWarmSimulation, getFailureRecord
+from RandomStreams import SeedStreams
+from StatsCollector import confidenceInterval
+from ProgressMonitor import ProgressMonitor, ProgressServer
+from PhaseProfiler import getPhaseFields, flattenPhases, unflattenPhases, mergePhases, formatPhases
 
 
-def poolInit(q):
-    singleRun.q = q
-
-
+##
+# Worker side of parSweep: runs a round (one replication of a point) on a warm simulation and writes its result,
+# diagnostics, progress and artifact into the task's row of the shared sweep block. Only (task, None) travels back
+# through the pool, or (task, failure record) if the round raised.
+##
 def singleRun(args):
-    (simObj, arrivalRate, effectiveServiceRate, result_num) = args
+    (block, spec) = args
     try:
-        return [result_num, arrivalRate, simObj[0].sims[result_num].singleRun(arrivalRate, effectiveServiceRate)]
-    except Exception:
-        print('arrivalRate, result_num = %f, %d' % (arrivalRate, result_num))
+        # Started first, so the driver watches the worker from here on (see parSim.getLostTasks).
+        block.startTask(spec.task, spec.arrivalRate)
+        sim = getWarmSimulation(spec)
+        sim.setProgressHook(functools.partial(block.updateProgress, spec.task))
+        estimate, diagnostics = spec.run(sim)
+        if 'phases' in diagnostics:
+            diagnostics.update(flattenPhases(diagnostics.pop('phases')))
+        if block.artifactLength > 0:
+            block.writeArtifact(spec.task, sim.statsCollector.getWindowStats().getChronologicalWindow())
+        block.writeResult(spec.task, spec.arrivalRate, estimate, diagnostics)
+        return spec.task, None
+    except Exception as e:
+        block.markFailed(spec.task)
+        return spec.task, getFailureRecord(spec, e.__class__.__name__, str(e), traceback.format_exc())
 
 
+# Seconds a round may run past its wall-clock limit before the driver gives up on it (a round checks its limit only
+# once per window, see QueueNetworkSimulation.setWallClockLimit).
+DEADLINE_MARGIN = 10.0
+
 class parSim(qns.QueueNetworkSimulation):
 
+    ##
+    # The parallel simulation keeps no per-round simulation objects. Every round is described by a SimulationSpec
+    # that a worker turns into a simulation locally, so driver memory and IPC cost do not grow with numOfRounds.
+    ##
     def __init__(self, size, dispatchPolicyStrategy, convergenceConditionStrategy, plotStrategy=None, services=[],
                  workloads=[], historyWindowSize=10000, numOfRounds=100, verbose=False, T_min=0, T_max=10000000,
                  guess=False):
@@ -28,104 +60,394 @@ class parSim(qns.QueueNetworkSimulation):
                                             plotStrategy, services, workloads, historyWindowSize, numOfRounds, verbose,
                                             T_min, T_max, guess)
         self.size = size
-        self.sims = [qns.QueueNetworkSimulation(size, dispatchPolicyStrategy, convergenceConditionStrategy,
-                                     plotStrategy=plotStrategy, services=services, workloads=workloads,
-                                     historyWindowSize=historyWindowSize, numOfRounds=numOfRounds, verbose=verbose,
-                                     T_min=T_min, T_max=T_max, guess=guess)
-                     for k in range(numOfRounds)]
         self.results = [[0.0] * self.numOfRounds for i in range(2)]
+        self.ciHalfWidths = [None] * self.numOfRounds
+        self.sharedBlock = None
+        self.seedStreams = None
+        self.progressServer = None
 
     def reset(self):
-        for simu in self.sims:
-            simu.reset()
+        qns.QueueNetworkSimulation.reset(self)
         self.results = [[0.0] * self.numOfRounds for i in range(2)]
+        self.ciHalfWidths = [None] * self.numOfRounds
 
-    def parRun(self):
-        if __name__ == '__main__':
-            result_queue = multiprocessing.Queue()
-            starttime = time.time()
-            start_time = datetime.datetime.now()
-
-            numOfRounds = len(self.sims)
-            effectiveServiceRate = self.sims[0].getEffectiveServiceRate()
-            arrivalRate = [0.0] * numOfRounds
-            if effectiveServiceRate != 0:
-                arrivalRate = np.arange(0, effectiveServiceRate, float(effectiveServiceRate) / float(numOfRounds))
-            # self.results[0] = arrivalRate
-
-            args = [([self], arrivalRate[i], effectiveServiceRate, i) for i in range(numOfRounds-1, -1, -1)]
-
-            pool = multiprocessing.Pool(processes=8, initializer=poolInit, initargs=[result_queue])
-            res = pool.imap(singleRun, args)
-            pool.close()
-            pool.join()
-            # print res.get()
-            r = res.next()
-            while r:
-                # print r
-                self.results[0][r[0]] = r[1]
-                self.results[1][r[0]] = r[2]
-                try:
-                    r = res.next()
-                except:
-                    break
-
-            # print self.results
-
-            # processes = []
-            # for i in range(numOfRounds-1, -1, -1):
-            #     sim = self.sims[i]
-            #     p = multiprocessing.Process(target=sim.singleRun, args=(arrivalRate[i],
-            #                                                             effectiveServiceRate, result_queue, i))
-            #     processes.append(p)
-            #     p.start()
-            #
-            # for process in processes:
-            #     process.join()
-
-            print "DONE"
-
-            # while not result_queue.empty():
-            #     result = result_queue.get()
-            #     self.results[1][result[0]] = result[1]
-
-            end_time = datetime.datetime.now()
-            if self.verbose:
-                print "INFO:    Simulation ended at:"
-                print "INFO:        time                            :   " + str(end_time)
+    def getRootSeed(self):
+        return self.seedStreams.getRootSeed() if self.seedStreams is not None else None
+
+    ##
+    # Get the specs of all rounds of the sweep, in arrival rate order, @replications specs per arrival rate.
+    # Replication r of round i is task i * replications + r, and its seed is the (i, r) stream of @streams (see
+    # SeedStreams), so every task has its own independent and reproducible random stream.
+    ##
+    def getSpecs(self, replications=1, streams=None):
+        effectiveServiceRate = self.getEffectiveServiceRate()
+        specs = []
+        for i, arrivalRate in enumerate(self.getArrivalRates(effectiveServiceRate)):
+            for r in range(replications):
+                seed = streams.getSeed(i, r, 0) if streams is not None else None
+                specs.append(SimulationSpec.fromSimulation(self, arrivalRate, effectiveServiceRate, index=i, seed=seed,
+                                                           replication=r, task=i * replications + r))
+        return specs
+
+    ##
+    # Read the reusable points of a previous run of this sweep from @resume, a result log filename or a list of point
+    # records (see readResultLog). A point is reusable if it completed and its arrival rate matches.
+    ##
+    def getReusablePoints(self, arrivalRates, resume):
+        if resume is None:
+            return {}
+        records = resume
+        if isinstance(resume, str):
+            records = readResultLog(resume)[1]
+        reusable = {}
+        for record in records:
+            index = record['index']
+            if record.get('status', 'ok') == 'ok' and 0 <= index < len(arrivalRates) and \
+                    np.isclose(record['arrivalRate'], arrivalRates[index]):
+                reusable[index] = record
+        return reusable
+
+    ##
+    # Get the seed of attempt number @attempt (0 is the first run) of a round: a fresh stream of the sweep's root seed.
+    ##
+    def getRetrySeed(self, spec, attempt):
+        return self.seedStreams.getSeed(spec.index, spec.replication, attempt)
 
-            # Save results to file.
+    ##
+    # Combine the replications of point @index, a list of (estimate, diagnostics) in replication order, into
+    # (estimate, diagnostics, status). The estimate is the mean of the replications that succeeded and
+    # diagnostics['ciHalfWidth'] is the half-width of its 95% confidence interval (None with less than 2 of them).
+    # The point fails only if every replication failed.
+    ##
+    def aggregateReplications(self, index, arrivalRate, replications):
+        estimates = [estimate for estimate, info in replications]
+        infos = [info for estimate, info in replications]
+        succeeded = [estimate for estimate in estimates if estimate is not None]
+        diagnostics = {'arrivalRate': arrivalRate,
+                       'index': index,
+                       'load': infos[0].get('load'),
+                       'replications': len(replications),
+                       'estimates': estimates,
+                       'seeds': [info['seed'] for info in infos],
+                       'rootSeed': self.getRootSeed(),
+                       'slots': sum(info.get('slots', 0) for info in infos),
+                       'wallTime': sum(info.get('wallTime', 0.0) for info in infos),
+                       'converged': all(info.get('converged', False) for info in infos if info['status'] == 'ok'),
+                       'attempts': sum(info['attempts'] for info in infos)}
+        if any('phases' in info for info in infos):
+            diagnostics['phases'] = mergePhases([info['phases'] for info in infos if 'phases' in info])
+        failures = []
+        for r, info in enumerate(infos):
+            for failure in info.get('failures', []):
+                failure['replication'] = r
+                failures.append(failure)
+        if failures:
+            diagnostics['failures'] = failures
+        if not succeeded:
+            diagnostics['ciHalfWidth'] = None
+            return None, diagnostics, 'failed'
+        estimate, diagnostics['ciHalfWidth'] = confidenceInterval(succeeded)
+        return estimate, diagnostics, 'ok'
+
+    ##
+    # Run the sweep in parallel and yield (arrival rate, estimate, diagnostics) as soon as each point completes, in
+    # completion order. If @resultLog is given, every point is appended to it (and flushed) before it is yielded.
+    # The @scheduler (see TaskScheduler) sizes the pool and dispatches the rounds longest-expected-first; workers pull
+    # one round at a time. Every finished round is fed back to the scheduler's cost model.
+    # Workers write results and progress into a SharedSweepBlock (self.sharedBlock) that the driver reads without
+    # copies; if @artifactLength > 0, each round also stores its final running-average window decimated to that length.
+    # If a long-lived @pool (see WorkerPool) is given the rounds are submitted to it, otherwise a pool is created for
+    # this sweep only. Rounds already submitted to a long-lived pool still run if the consumer stops early.
+    # A SweepCoordinator can be given as the @pool to spread the rounds over workers on other hosts.
+    # Fault tolerance: a round that runs longer than @timeout seconds is stopped, and a failed round is retried up to
+    # @maxRetries times with a fresh seed. A round fails when it raises, when its worker dies, and when it is still
+    # running @deadlineMargin seconds after its wall-clock limit (see getLostTasks). A round that still fails is
+    # yielded with an estimate of None and diagnostics['status'] == 'failed'; every failed attempt is kept in
+    # diagnostics['failures'].
+    # With @resume (see getReusablePoints) completed points of a previous run are yielded first (with
+    # diagnostics['reused'] set) and only the missing or failed points are simulated.
+    # Every point is simulated in @replications independent replications, spread over the pool, and yielded once all
+    # of them completed (see aggregateReplications); the replications are logged one by one if there are several.
+    # All random streams are derived from @rootSeed (drawn from the OS if None, see getRootSeed), so running the sweep
+    # again with the same root seed reproduces it.
+    # If @progressAddress (host, port) is given, the live progress of every round (see ProgressMonitor) is served over
+    # HTTP there while the sweep runs (self.progressServer).
+    # Every completed round is recorded in the telemetry ledger, if one is set; the ledger also calibrates the default
+    # scheduler's cost model.
+    ##
+    def parSweep(self, resultLog=None, scheduler=None, artifactLength=0, pool=None, timeout=None, maxRetries=0,
+                 resume=None, replications=1, rootSeed=None, progressAddress=None, deadlineMargin=DEADLINE_MARGIN):
+        if scheduler is None:
+            ledgerFile = self.telemetryLedger.getFilename() if self.telemetryLedger is not None else None
+            scheduler = TaskScheduler(CostModel(ledgerFile=ledgerFile))
+        self.seedStreams = SeedStreams(rootSeed)
+        specs = self.getSpecs(replications, self.seedStreams)
+        for spec in specs:
+            spec.timeout = timeout
+        reusable = self.getReusablePoints([spec.arrivalRate for spec in specs[::replications]], resume)
+        for index in sorted(reusable):
+            record = reusable[index]
+            diagnostics = dict(record['diagnostics'])
+            diagnostics['reused'] = True
+            self.results[0][index] = record['arrivalRate']
+            self.results[1][index] = record['estimate']
+            self.ciHalfWidths[index] = diagnostics.get('ciHalfWidth')
+            if resultLog is not None and resultLog.getFilename() != resume:
+                resultLog.append(index, record['arrivalRate'], record['estimate'], diagnostics)
+            yield record['arrivalRate'], record['estimate'], diagnostics
+
+        diagnosticFields = list(SharedSweepBlock.DIAGNOSTIC_FIELDS)
+        if self.phaseProfiler is not None:
+            diagnosticFields += getPhaseFields()
+        self.sharedBlock = SharedSweepBlock(len(specs), artifactLength=artifactLength,
+                                            diagnosticFields=diagnosticFields)
+        todo = scheduler.order([spec for spec in specs if spec.index not in reusable])
+        attempts = dict((spec.task, 0) for spec in todo)
+        failures = dict((spec.task, []) for spec in todo)
+        completed = dict((spec.index, {}) for spec in todo)
+        done = queue.Queue()
+
+        if progressAddress is not None:
+            self.progressServer = ProgressServer(ProgressMonitor(self.sharedBlock, specs, scheduler.costModel),
+                                                 progressAddress)
             if self.verbose:
-                print "INFO:    Saving results to file [ " + datetime.datetime.now().strftime(
-                    "%Y%m%d-%H%M%S") + "_queue_net_sim.dump ]"
-            fd = open(datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + '_queue_net_sim.dump', 'w')
-            for val in self.results[0]:
-                fd.write(str(val) + ",")
-            fd.write("\n")
-            for val in self.results[1]:
-                fd.write(str(val) + ",")
-            fd.write("\n")
-            fd.write("\n")
-            fd.write("INFO:        time started                    :   " + str(start_time) + "\n")
-            fd.write("INFO:        time ended                      :   " + str(end_time) + "\n")
-            fd.write("INFO:        number of servers               :   " + str(self.size) + "\n")
-            fd.write("INFO:        dispatch policy                 :   " +
-                     self.dispatchPolicyStrategy.getName() + "\n")
-            fd.write("INFO:        redundancy                      :   " +
-                     str(self.dispatchPolicyStrategy.getRedundancy()) + "\n")
-            fd.write("INFO:        params                          :   " +
-                     self.dispatchPolicyStrategy.getParamStr() + "\n")
-            fd.write("INFO:        convergence condition           :   " +
-                     self.convergenceConditionStrategy.getName() + "\n")
-            fd.write("INFO:        convergence precision           :   " +
-                     str(self.convergenceConditionStrategy.getPrecision()) + "\n")
-            fd.close()
-            print('overall it took {} seconds'.format(time.time() - starttime))
+                print("INFO:    Serving progress at [ " + self.progressServer.getURL() + " ]")
+        ownPool = pool is None
+        if ownPool:
+            pool = WorkerPool(processes=scheduler.getProcesses(len(todo)))
+        # The attempt, submission time and pool handle of every task being run. A late result of an attempt given up
+        # on is ignored.
+        running = {}
+
+        def submit(spec):
+            (attempt, submitted) = (attempts[spec.task], time.time())
+            handle = pool.submit(singleRun, (self.sharedBlock, spec), lambda result: done.put((result, attempt)))
+            running[spec.task] = (attempt, submitted, handle)
+
+        try:
+            for spec in todo:
+                submit(spec)
+            nextCheck = time.time() + 1.0
+            while running:
+                if time.time() >= nextCheck:
+                    nextCheck = time.time() + 1.0
+                    for (task, failure) in self.getLostTasks(running, specs, pool, deadlineMargin):
+                        done.put(((task, failure), running[task][0]))
+                try:
+                    ((task, failure), attempt) = done.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if task not in running or running[task][0] != attempt:
+                    continue
+                del running[task]
+                spec = specs[task]
+                attempts[task] += 1
+                if failure is not None:
+                    failure['attempt'] = attempts[task]
+                    failures[task].append(failure)
+                    if self.verbose:
+                        print("WARN:    arrival rate = " + str(spec.arrivalRate) + " failed (attempt " +
+                              str(attempts[task]) + "): " + failure['error'] + ": " + failure['message'])
+                    if attempts[task] <= maxRetries:
+                        spec.seed = self.getRetrySeed(spec, attempts[task])
+                        submit(spec)
+                        continue
+                    (estimate, status) = (None, 'failed')
+                    diagnostics = {'arrivalRate': spec.arrivalRate, 'index': spec.index}
+                else:
+                    (rate, estimate, diagnostics) = self.sharedBlock.readResult(task)
+                    diagnostics['index'] = spec.index
+                    if self.phaseProfiler is not None:
+                        phases = unflattenPhases(diagnostics)
+                        # Rounds that return before the loop (zero arrival rate) have no phases.
+                        if any(values['calls'] for values in phases.values()):
+                            diagnostics['phases'] = phases
+                    status = 'ok'
+                    scheduler.observe(spec, diagnostics)
+                    if self.telemetryLedger is not None:
+                        self.telemetryLedger.record(spec, diagnostics)
+                diagnostics['status'] = status
+                diagnostics['attempts'] = attempts[task]
+                diagnostics['seed'] = spec.seed
+                if failures[task]:
+                    diagnostics['failures'] = failures[task]
+                if resultLog is not None and replications > 1:
+                    resultLog.appendReplication(spec.index, spec.replication, spec.arrivalRate, estimate, diagnostics,
+                                                status=status)
+                completed[spec.index][spec.replication] = (estimate, diagnostics)
+                if len(completed[spec.index]) < replications:
+                    continue
+                index = spec.index
+                (estimate, diagnostics, status) = self.aggregateReplications(
+                    index, spec.arrivalRate, [completed[index][r] for r in range(replications)])
+                diagnostics['status'] = status
+                self.results[0][index] = spec.arrivalRate
+                self.results[1][index] = estimate if estimate is not None else float('nan')
+                self.ciHalfWidths[index] = diagnostics['ciHalfWidth']
+                if resultLog is not None:
+                    resultLog.append(index, spec.arrivalRate, estimate, diagnostics, status=status)
+                yield spec.arrivalRate, estimate, diagnostics
+        finally:
+            # Reached on normal completion, on an error in the driver and when the consumer stops iterating early.
+            if ownPool:
+                pool.terminate()
+            if self.progressServer is not None:
+                self.progressServer.close()
+                self.progressServer = None
+            self.sharedBlock.unlink()
+
+    ##
+    # Get the tasks of @running (task: (attempt, submission time, handle), see parSweep) the driver gives up on, with
+    # their failure records: those whose worker is gone (see isWorkerAlive of the pool), and those still running
+    # @margin seconds after their wall-clock limit. A worker that dies or hangs never reports its task, so without
+    # this the sweep would wait for it forever. The pool drops the tasks given up on (see dropTask), stopping a hung
+    # worker. Tasks not started yet (or started by an earlier attempt) are skipped.
+    ##
+    def getLostTasks(self, running, specs, pool, margin):
+        block = self.sharedBlock
+        (startTimes, workers) = (block.getField('startTime'), block.getField('worker'))
+        now = time.time()
+        lost = []
+        for task in sorted(running):
+            (attempt, submitted, handle) = running[task]
+            if block.getStatus(task) != SharedSweepBlock.RUNNING or startTimes[task] < submitted:
+                continue
+            spec = specs[task]
+            if not pool.isWorkerAlive(workers[task]):
+                pool.dropTask(handle, workers[task])
+                lost.append((task, getFailureRecord(spec, 'WorkerLost', "The worker running the round exited")))
+            elif spec.timeout is not None and now > startTimes[task] + spec.timeout + margin:
+                pool.dropTask(handle, workers[task])
+                lost.append((task, getFailureRecord(spec, 'DeadlineExceeded', "The round was still running " +
+                                                    str(margin) + " seconds after its wall-clock limit of " +
+                                                    str(spec.timeout) + " seconds")))
+        return lost
+
+    ##
+    # Run the sweep in parallel (see parSweep), streaming it to a result log and writing a dump at the end.
+    # @resumeFrom is the result log of an interrupted or partially failed run of this sweep: its completed points are
+    # reused, only the missing/failed ones are simulated and the log is appended to (with the root seed of that run,
+    # unless @rootSeed is given).
+    # Every point is the mean of @replications independent replications; the dump records the root seed and the 95%
+    # confidence half-width of every point.
+    # @progressAddress serves the live progress of the sweep (see parSweep), e.g. ('127.0.0.1', 8080).
+    # The dump is written to @dumpFile, a time-stamped file in the working directory by default.
+    ##
+    def parRun(self, pool=None, timeout=None, maxRetries=0, resumeFrom=None, replications=1, rootSeed=None,
+               progressAddress=None, dumpFile=None):
+        starttime = time.time()
+        start_time = datetime.datetime.now()
+        stamp = start_time.strftime("%Y%m%d-%H%M%S")
+
+        if rootSeed is None and resumeFrom is not None and os.path.exists(resumeFrom):
+            rootSeed = (readResultLog(resumeFrom)[0] or {}).get('root seed')
+        if rootSeed is None:
+            rootSeed = SeedStreams().getRootSeed()
+        header = self.getMetadata()
+        header['time started'] = str(start_time)
+        header['root seed'] = rootSeed
+        header['replications'] = replications
+        resultLog = ResultLog(resumeFrom if resumeFrom is not None else stamp + '_queue_net_sim.log', header=header)
+        if self.verbose:
+            print("INFO:    Streaming results to [ " + resultLog.getFilename() + " ]")
+        phaseSummaries = {}
+        try:
+            for arrivalRate, estimate, diagnostics in self.parSweep(resultLog=resultLog, pool=pool, timeout=timeout,
+                                                                    maxRetries=maxRetries, resume=resumeFrom,
+                                                                    replications=replications, rootSeed=rootSeed,
+                                                                    progressAddress=progressAddress):
+                if 'phases' in diagnostics:
+                    phaseSummaries[diagnostics['index']] = ("phases @ " + str(arrivalRate),
+                                                            formatPhases(diagnostics['phases']))
+                if self.verbose:
+                    print("INFO:    Point done: arrival rate = " + str(arrivalRate) + ", estimate = " +
+                          str(estimate) + " +- " + str(diagnostics.get('ciHalfWidth')) + ", status = " + \
+                          diagnostics.get('status', 'ok'))
+        finally:
+            resultLog.close()
+
+        print("DONE")
+
+        end_time = datetime.datetime.now()
+        if self.verbose:
+            print("INFO:    Simulation ended at:")
+            print("INFO:        time                            :   " + str(end_time))
+
+        # Save results to file.
+        if dumpFile is None:
+            dumpFile = datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + '_queue_net_sim.dump'
+        if self.verbose:
+            print("INFO:    Saving results to file [ " + dumpFile + " ]")
+        writeDump(dumpFile,
+                  self.results[0],
+                  self.results[1],
+                  [("time started", start_time),
+                   ("time ended", end_time),
+                   ("number of servers", self.size),
+                   ("dispatch policy", self.dispatchPolicyStrategy.getName()),
+                   ("redundancy", self.dispatchPolicyStrategy.getRedundancy()),
+                   ("params", self.dispatchPolicyStrategy.getParamStr()),
+                   ("convergence condition", self.convergenceConditionStrategy.getName()),
+                   ("convergence precision", self.convergenceConditionStrategy.getPrecision()),
+                   ("root seed", rootSeed),
+                   ("replications", replications),
+                   ("confidence half-widths (95%)", self.ciHalfWidths)] +
+                  [phaseSummaries[index] for index in sorted(phaseSummaries)])
+        print(('overall it took {} seconds'.format(time.time() - starttime)))
 
     def plot(self, x=None, y=None, plotStrategy=None):
         self.plotStrategy.plot(self.results[0], self.results[1])
 
 
+
+########################################################################################################################
+#   TEST
+########################################################################################################################
+class FaultyRecorder:
+    """A trajectory recorder that breaks the first round it sees (across processes, through a @marker file): its
+    worker exits, or hangs with @hang."""
+
+    def __init__(self, marker, hang=False):
+        self.marker = marker
+        self.hang = hang
+
+    def start(self, network, arrivalRate, maxSlots):
+        if not os.path.exists(self.marker):
+            open(self.marker, 'w').close()
+            if self.hang:
+                time.sleep(600)
+            os._exit(1)
+
+    def record(self, t, network):
+        pass
+
+    def finish(self):
+        pass
+
+
+class TestParSweepFaults(ut.TestCase):
+    def runTest(self):
+        import tempfile
+        directory = tempfile.mkdtemp()
+        for (hang, maxRetries) in [(False, 1), (True, 1), (False, 0)]:
+            sim = parSim(3, qns.DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=100, p=0.8, d=2),
+                         qns.ConvergenceConditionStrategy.RunForXSlotsConvergenceStrategy(2000), numOfRounds=3,
+                         historyWindowSize=1000, T_min=1000)
+            sim.setTrajectoryRecorder(FaultyRecorder(os.path.join(directory, str((hang, maxRetries))), hang=hang))
+            start = time.time()
+            with WorkerPool(processes=1) as pool:
+                points = list(sim.parSweep(pool=pool, timeout=1, maxRetries=maxRetries, rootSeed=5,
+                                           deadlineMargin=1.0))
+            self.assertLess(time.time() - start, 30)
+            self.assertEqual(len(points), 3)
+            failures = [failure for rate, estimate, diagnostics in points
+                        for failure in diagnostics.get('failures', [])]
+            self.assertEqual([failure['error'] for failure in failures], ['DeadlineExceeded' if hang else 'WorkerLost'])
+            statuses = sorted(diagnostics['status'] for rate, estimate, diagnostics in points)
+            self.assertEqual(statuses, ['ok'] * 3 if maxRetries else ['failed', 'ok', 'ok'])
+        print("TestParSweepFaults: OK.")
+
+
 if __name__ == '__main__':
     rounds = 30
     # sim = parSim(3, qns.DispatchPolicyStrategy.RandomDStrategy(alpha=10, beta=1000, p=0.95, d=2, bias=2.0),
@@ -163,8 +485,15 @@ if __name__ == '__main__':
     # sim.parRun()
     # sim1.plot()
     # sim.plot()
-    sim = parSim(3, qns.DispatchPolicyStrategy.RoundRobinRedundancyDStrategy(alpha=10, beta=2000, p=0.8, d=2, n=3, bias=0.225*2),
-                 qns.ConvergenceConditionStrategy.VarianceConvergenceStrategy(epsilon=0.00005), verbose=True,
-                 numOfRounds=rounds, historyWindowSize=20000, T_min=500000, T_max=1000000000, plotStrategy=qns.PLOT())
-    sim.parRun()
+    # A grid of sweeps is better described in an experiment file and run with "python Experiment.py <file.json>".
+    # Back-to-back sweeps should share one warm pool: sim.parRun(pool=pool).
+    # To spread a sweep over several hosts, use a coordinator as the pool and start workers on every host with
+    # "python Coordinator.py <driver host> <port>":
+    # with Coordinator.SweepCoordinator(address=('', 50000)) as coordinator:
+    #     sim.parRun(pool=coordinator)
+    with WorkerPool() as pool:
+        sim = parSim(3, qns.DispatchPolicyStrategy.RoundRobinRedundancyDStrategy(alpha=10, beta=2000, p=0.8, d=2, n=3, bias=0.225*2),
+                     qns.ConvergenceConditionStrategy.VarianceConvergenceStrategy(epsilon=0.00005), verbose=True,
+                     numOfRounds=rounds, historyWindowSize=20000, T_min=500000, T_max=1000000000, plotStrategy=qns.PLOT())
+        sim.parRun(pool=pool)
     sim.plot()